@@ -3,37 +3,45 @@ import os
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1' # Allow HTTP for local testing
 
 
-import openpyxl
 import redis
 import re
 import logging
-import requests
 import json
+import time
 from datetime import datetime, timedelta, timezone
-from flask import Flask, request, jsonify, session, Response, make_response, render_template, send_from_directory, url_for, redirect
+from flask import Flask, Blueprint, request, jsonify, session, Response, make_response, render_template, send_from_directory, url_for, redirect, stream_with_context
 from flask_session import Session  # type: ignore
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from dotenv import load_dotenv
-from openpyxl import Workbook
-from openpyxl.styles import Font
-from openpyxl.worksheet.worksheet import Worksheet
 from google_calendar_utils import create_meet_event, create_meet_event_oauth, OAUTH_CLIENT_SECRET_FILE
-from typing import List, Dict, Any, Optional
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+from lead_registry import LeadRegistry, conversation_key
+from data_store import create_lead_store
+from conversation_log import ConversationLogWriter
+from conversation_index import ConversationIndex
+from extraction_state import ExtractionState, ExtractionStateStore
+from client_extraction import MEETING_NAME_ENGINE, find_emails
+from keyword_matcher import KEYWORD_MATCHER
+from gemini_client import get_gemini_client, GeminiRequestError, GeminiUnavailableError, GEMINI_DEADLINE
+from job_queue import JobQueue
+from response_cache import ResponseCache, RESPONSE_CACHE_ENABLED
+from history_manager import HistoryManager, ConversationWindow
+from coalescer import MessageCoalescer, COALESCE_WINDOW, COALESCE_REPLY_MODE
+from idempotency import IdempotencyStore, IdempotencyConflict
+from instruction_cache import InstructionCache, ClientContextCache
+from startup import Lazy, ReadinessCheck
+from session_store import ChatSession, create_session_store
+from context_cache import ContextCache, InvalidationBus
+from client_lock import ClientTurnLock, ClientBusy, TurnLease, CLIENT_TURN_LOCK
+from emotion_service import EMOTION_MODEL, EMOTION_MAX_BATCH_TEXTS, classify as classify_emotions
+from typing import List, Dict, Any, Optional, Tuple
 import pathlib
 import pickle
 import uuid
 import sys
-
-# Add transformers import for pipeline
-try:
-    from transformers import pipeline
-except ImportError:
-    pipeline = None
-    print("Warning: transformers not installed. Emotion analysis will be disabled.")
+import threading
+from contextlib import nullcontext
 
 # Google Calendar OAuth2 scopes
 SCOPES = ['https://www.googleapis.com/auth/calendar.events', 'https://www.googleapis.com/auth/calendar.readonly']
@@ -44,7 +52,8 @@ load_dotenv()
 # Get Gemini API Key
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
-    raise ValueError("❌ Missing GEMINI_API_KEY in .env file")
+    # Reported by the readiness check (/ready) instead of failing the import
+    logging.error("❌ Missing GEMINI_API_KEY in .env file")
 
 # Get model name from environment or default to gemini-2.0-flash
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
@@ -55,26 +64,9 @@ SECONDS_PER_WORD = 60 / WORDS_PER_MINUTE
 
 # Excel file configuration
 EXCEL_FOLDER = "client_data"
-os.makedirs(EXCEL_FOLDER, exist_ok=True)
 
-# Optionally skip Hugging Face model loading if SKIP_HF_EMOTION is set
-if os.getenv("SKIP_HF_EMOTION", "0") == "1":
-    logging.info("Skipping Hugging Face emotion classifier initialization due to SKIP_HF_EMOTION=1")
-    emotion_classifier = None
-else:
-    try:
-        if pipeline is None:
-            logging.warning("Transformers pipeline not available, skipping emotion classifier")
-            emotion_classifier = None
-        else:
-            emotion_classifier = pipeline(
-                "text-classification",
-                model="j-hartmann/emotion-english-distilroberta-base",
-                return_all_scores=True
-            )
-    except Exception as e:
-        logging.error(f"Failed to load emotion classifier: {e}")
-        emotion_classifier = None
+# Skip emotion analysis entirely (no model service is started)
+SKIP_HF_EMOTION = os.getenv("SKIP_HF_EMOTION", "0") == "1"
 
 def analyze_emotion(text: str) -> Dict[str, float]:
     """
@@ -86,12 +78,12 @@ def analyze_emotion(text: str) -> Dict[str, float]:
     Returns:
         Dictionary mapping emotion labels to confidence scores
     """
-    if not emotion_classifier:
+    if SKIP_HF_EMOTION:
         return {"error": "Emotion classifier not initialized"}
         
     try:
-        # Get emotion predictions
-        results = emotion_classifier(text)[0]
+        # The model runs in the shared emotion service, not in this worker
+        results = classify_emotions(EMOTION_MODEL, [text])[0]
         
         # Convert to dictionary format
         emotions = {item['label']: float(item['score']) for item in results}
@@ -100,22 +92,51 @@ def analyze_emotion(text: str) -> Dict[str, float]:
     except Exception as e:
         logging.error(f"Error in emotion analysis: {e}")
         return {"error": str(e)}
+
+def analyze_emotions_batch(texts: List[str]) -> List[Dict[str, float]]:
+    """
+    analyze_emotion() for many texts in one model call (the service pads them
+    into batches). Raises on failure instead of returning an error dict.
+    """
+    if SKIP_HF_EMOTION:
+        raise RuntimeError("Emotion classifier not initialized")
+    return [{item['label']: float(item['score']) for item in results}
+            for results in classify_emotions(EMOTION_MODEL, texts)]
 LEADS_DATA_FILE = os.path.join(EXCEL_FOLDER, "leads.json")  # Define leads data file path
 DAILY_REPORTS_FOLDER = os.path.join(EXCEL_FOLDER, "daily_lead_reports")  # New folder for daily reports
-os.makedirs(DAILY_REPORTS_FOLDER, exist_ok=True)  # Ensure the new folder is created
 
 LOGS_FOLDER = EXCEL_FOLDER  # <-- Add this line so logs endpoints work
 
 # Define client data folder (same as excel folder)
 CLIENT_DATA_FOLDER = EXCEL_FOLDER
 
+# Stores that create folders or database files are built on first use (startup.Lazy),
+# so importing this module touches nothing on disk
+
+# Append-only writer for conversation_*.txt files (what was written is tracked in Redis)
+conversation_writer: ConversationLogWriter = Lazy(lambda: ConversationLogWriter(CLIENT_DATA_FOLDER, redis_client))  # type: ignore[assignment]
+
+# client -> conversation files index (replaces per-turn directory scans)
+conversation_index: ConversationIndex = Lazy(lambda: ConversationIndex(CLIENT_DATA_FOLDER))  # type: ignore[assignment]
+
+# Per-conversation name/phone/email/summary extraction, updated with new text only
+extraction_states: ExtractionStateStore = Lazy(lambda: ExtractionStateStore(CLIENT_DATA_FOLDER))  # type: ignore[assignment]
+
+# Leads, notes and meeting leads storage (JSON files or SQLite, see data_store.py)
+lead_store = Lazy(lambda: create_lead_store(CLIENT_DATA_FOLDER))
+
+# Token-budgeted chat history with a rolling summary of older turns
+history_manager = HistoryManager()
+
 # In your app.py, set the correct variable name for the client secret file
 CLIENT_SECRETS_FILE = OAUTH_CLIENT_SECRET_FILE  # Use the variable from google_calendar_utils.py
 
 # Validate API key and model
-def validate_api_key_and_model():
+def validate_api_key_and_model() -> Tuple[bool, Optional[str]]:
+    if not GEMINI_API_KEY:
+        return False, "Missing GEMINI_API_KEY in .env file"
     try:
-        response = requests.get(f"https://generativelanguage.googleapis.com/v1beta/models?key={GEMINI_API_KEY}")
+        response = get_gemini_client(GEMINI_API_KEY).list_models(timeout=10)
         if response.status_code != 200:
             return False, "Invalid or unauthorized GEMINI_API_KEY"
         models = response.json().get("models", [])
@@ -126,44 +147,38 @@ def validate_api_key_and_model():
     except Exception as e:
         return False, f"Failed to validate API key or model: {str(e)}"
 
-is_valid, error_message = validate_api_key_and_model()
-if not is_valid:
-    raise ValueError(error_message)
+# Runs in the background once the app serves requests; reported by /ready
+readiness = ReadinessCheck(validate_api_key_and_model)
 
 # Functions to load and save leads
 def load_leads_from_file() -> List[Dict[str, Any]]:
-    """Loads leads from the JSON data file."""
-    if not os.path.exists(LEADS_DATA_FILE):
-        return []
+    """Loads meeting leads (leads.json) from the lead store."""
     try:
-        with open(LEADS_DATA_FILE, "r", encoding="utf-8") as f:
-            data: List[Dict[str, Any]] = json.load(f)
-            if isinstance(data, list):  # Basic validation
-                return data
-            else:
-                logging.error(f"Leads data file {LEADS_DATA_FILE} does not contain a JSON list. Initializing with empty list.")
-                return []
-    except (json.JSONDecodeError, IOError) as e:
+        return lead_store.load_meeting_leads()
+    except Exception as e:
         logging.error(f"Error loading leads from {LEADS_DATA_FILE}: {e}. Initializing with empty list.")
         return []
 
 def save_leads_to_file(leads_data: List[Dict[str, Any]]) -> None:
-    """Saves leads to the JSON data file."""
+    """Saves all meeting leads (leads.json) to the lead store."""
     try:
-        with open(LEADS_DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(leads_data, f, indent=4)
+        lead_store.save_meeting_leads(leads_data)
         logging.info(f"Leads data saved to {LEADS_DATA_FILE}")
-    except IOError as e:
+    except Exception as e:
         logging.error(f"Error saving leads to {LEADS_DATA_FILE}: {e}")
 
 def save_to_excel(client_data: Dict[str, Any], client_id: str) -> bool:
     """Save collected client data to Excel file"""
     try:
+        from openpyxl import Workbook, load_workbook
+        from openpyxl.styles import Font
+        from openpyxl.worksheet.worksheet import Worksheet
+
         filename = f"{EXCEL_FOLDER}/client_{client_id}.xlsx"
         wb: Workbook
         ws: Worksheet
         if os.path.exists(filename):
-            wb = openpyxl.load_workbook(filename)
+            wb = load_workbook(filename)
             ws = wb.active
             if ws is None:  # Ensure ws is not None
                 ws = wb.create_sheet()
@@ -188,61 +203,47 @@ def save_to_excel(client_data: Dict[str, Any], client_id: str) -> bool:
         logging.error(f"Error saving to Excel: {str(e)}")
         return False
 
-def save_conversation(client_id: str, conversation_history: List[Dict[str, Any]]) -> str:
-    """Save conversation history to a file, updating existing conversation or creating new one"""
+def save_conversation(client_id: str, turns: List[Dict[str, Any]], first_seq: int, session_epoch: str = "") -> str:
+    """Append new turns to the client's conversation file, creating it if needed
+
+    `turns` are only the turns added by this request, numbered from
+    `first_seq` in the chat session `session_epoch`; turns that were already
+    written (e.g. on a retry) are skipped.
+    """
     try:
         # First, check if there's an existing conversation file for this client
         existing_filename = find_existing_conversation_file(client_id)
         
         if existing_filename:
-            # Update existing file
-            filename = f"{EXCEL_FOLDER}/{existing_filename}"
-            logging.info(f"Updating existing conversation file: {filename}")
+            # Append to existing file
+            conversation_filename = existing_filename
+            logging.info(f"Appending to existing conversation file: {conversation_filename}")
         else:
             # Create new file with timestamp
             timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-            filename = f"{EXCEL_FOLDER}/conversation_{client_id}_{timestamp}.txt"
-            logging.info(f"Creating new conversation file: {filename}")
-        
-        # Write the complete conversation history
-        with open(filename, "w", encoding="utf-8") as f:
-            for entry in conversation_history:
-                role: str = entry.get("role", "unknown")  # type: ignore
-                parts: List[Dict[str, str]] = entry.get("parts", [])  # type: ignore
-                for part in parts:
-                    text: str = part.get("text", "")  # type: ignore
-                    f.write(f"{role}: {text}\n")
-        
-        # Get just the filename for database storage
-        conversation_filename = os.path.basename(filename)
+            conversation_filename = f"conversation_{client_id}_{timestamp}.txt"
+            logging.info(f"Creating new conversation file: {conversation_filename}")
+        
+        # Write only the new turns
+        written = conversation_writer.append(conversation_filename, turns, first_seq, session_epoch)
+        if not existing_filename:
+            conversation_index.register(conversation_filename)
+        if not written:
+            logging.info(f"Turns {first_seq}+ already saved to {conversation_filename}, skipping")
+            return conversation_filename
+        new_turns = turns[len(turns) - written:]
+        new_user_messages = sum(1 for entry in new_turns if entry.get("role") == "user")
         
         # Extract client info and link to leads database
         phone = extract_phone_from_chat_id(client_id)
-        # Extract email from conversation if available
-        email = None
-        name = None
-        
-        # Try to extract email and name from conversation
-        for entry in conversation_history:
-            if entry.get("role") == "user":
-                parts = entry.get("parts", [])
-                for part in parts:
-                    text = part.get("text", "")
-                    # Extract email pattern
-                    email_match = re.search(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', text)
-                    if email_match and not email:
-                        email = email_match.group(0).lower()
-                    
-                    # Extract name pattern
-                    name_match = re.search(r"(?:my name is|i'm|i am|this is|call me)\s+([a-zA-Z\s]+)", text, re.IGNORECASE)
-                    if name_match and not name:
-                        potential_name = name_match.group(1).strip().title()
-                        if len(potential_name) > 1 and not any(word in potential_name.lower() for word in ['saba', 'ai', 'bot', 'hello', 'help']):
-                            name = potential_name
+        # Email and name found so far, updated with only the lines just written
+        extraction = extraction_states.get(conversation_filename)
+        email = extraction.email
+        name = extraction.name
         
         # Link conversation to lead if we have identifying information
         if phone or email:
-            link_conversation_to_lead(conversation_filename, phone, email, name)
+            link_conversation_to_lead(conversation_filename, phone, email, name, new_user_messages=new_user_messages)
         
         # Return just the filename (not full path) for database storage
         return conversation_filename
@@ -254,33 +255,20 @@ def save_conversation(client_id: str, conversation_history: List[Dict[str, Any]]
 # Logging setup
 logging.basicConfig(level=logging.DEBUG)
 
-# Flask setup
-app = Flask(__name__)
-CORS(app, supports_credentials=True)
+# Routes are registered on a blueprint; create_app() builds the Flask app
+bp = Blueprint("chat", __name__)
 
-# Session configuration (for cookie-based clients)
-app.config["SECRET_KEY"] = os.urandom(24)
-app.config["SESSION_TYPE"] = os.getenv("SESSION_TYPE", "redis")
-
-# Fixed Redis configuration
+# Fixed Redis configuration (redis.Redis connects on first use)
 redis_host = os.getenv("REDIS_HOST", "localhost")
 redis_port = int(os.getenv("REDIS_PORT", 6379))
 redis_db = int(os.getenv("REDIS_DB", 0))
 
-app.config["SESSION_REDIS"] = redis.Redis(
+redis_client = redis.Redis(
     host=redis_host,
     port=redis_port,
     db=redis_db
 )
 
-app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_USE_SIGNER"] = True
-app.config["SESSION_COOKIE_SAMESITE"] = os.getenv("SESSION_COOKIE_SAMESITE", "None")
-app.config["SESSION_COOKIE_SECURE"] = os.getenv("SESSION_COOKIE_SECURE", "True") == "True"
-app.config["PERMANENT_SESSION_LIFETIME"] = int(os.getenv("SESSION_LIFETIME", 86400))  # 24 hours
-
-Session(app)  # type: ignore
-
 # Rate limiting with Redis storage
 redis_url = f"redis://{os.getenv('REDIS_HOST', 'localhost')}:{os.getenv('REDIS_PORT', 6379)}/{os.getenv('REDIS_DB', 0)}"
 limiter = Limiter(
@@ -289,21 +277,47 @@ limiter = Limiter(
     storage_uri=redis_url
 )
 
-limiter.init_app(app)
+# Opt-in cache of Gemini replies to context-free turns (in-process LRU + Redis)
+response_cache: Optional[ResponseCache] = (
+    ResponseCache(redis_client) if RESPONSE_CACHE_ENABLED else None
+)
+
+# Opt-in per-client debounce that merges bursts of messages into one Gemini call
+message_coalescer: Optional[MessageCoalescer] = MessageCoalescer() if COALESCE_WINDOW > 0 else None
+
+# Replays /gemini/train results for retried message ids (Idempotency-Key / message_id)
+idempotency_store = IdempotencyStore(redis_client)
+
+# chat_session:{client_id} and client_info:{client_id}: one read and one write per turn
+session_store = create_session_store(redis_client)
+
+# Turns of one client run one at a time, in arrival order, across all workers
+client_turns: Optional[ClientTurnLock] = ClientTurnLock(redis_client) if CLIENT_TURN_LOCK else None
+
+# Per-client sales notes and client info, served from memory while unchanged; writers call
+# invalidate() and every worker hears about it over pub/sub (see context_cache.py)
+context_invalidations = InvalidationBus(redis_client)
+notes_cache = ContextCache("notes", lambda client_id: lead_store.load_notes().get(client_id, ""),
+                           redis_client, context_invalidations)
+# client_info already lives in Redis: memory tier only
+client_info_cache = ContextCache("client_info", session_store.load_client_info,
+                                 redis_client, context_invalidations, shared=False)
 
 # System instruction
 INSTRUCTION_FILE = "system_instruction.txt"
 HISTORY_FILE = "system_instruction_history.json"
 
 def get_instruction() -> Optional[str]:
-    if not os.path.exists(INSTRUCTION_FILE):
-        return None
-    with open(INSTRUCTION_FILE, "r", encoding="utf-8") as f:
-        return f.read()
+    # Re-read only when the file changed (see instruction_cache.py)
+    return instruction_cache.raw()
 
 def save_instruction(text: str) -> None:
-    with open(INSTRUCTION_FILE, "w", encoding="utf-8") as f:
+    # Replace the file atomically; every worker sees the new inode/mtime on its next request
+    tmp_path = f"{INSTRUCTION_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
         f.write(text)
+    os.replace(tmp_path, INSTRUCTION_FILE)
+    instruction_cache.invalidate()
 
 def get_history() -> List[Dict[str, str]]:
     if not os.path.exists(HISTORY_FILE):
@@ -317,15 +331,9 @@ def save_history(history: List[Dict[str, str]]) -> None:
         json.dump(history, f, ensure_ascii=False, indent=2)
 
 def get_client_info_from_redis(client_id: str) -> Dict[str, Any]:
-    """Get stored client information from Redis"""
+    """Get stored client information (cached; do not modify the result)"""
     try:
-        redis_client: redis.Redis = app.config["SESSION_REDIS"]
-        client_info_key = f"client_info:{client_id}"
-        existing_info_raw: Optional[bytes] = redis_client.get(client_info_key)
-        
-        if existing_info_raw:
-            return json.loads(existing_info_raw.decode('utf-8'))
-        return {}
+        return client_info_cache.get(client_id)
     except Exception as e:
         logging.error(f"Error getting client info: {e}")
         return {}
@@ -333,28 +341,18 @@ def get_client_info_from_redis(client_id: str) -> Dict[str, Any]:
 def extract_client_name_from_conversation(user_input: str, ai_reply: str) -> Optional[str]:
     """Extract client name from conversation text"""
     combined_text = f"{user_input} {ai_reply}"
-    
-    # Look for name patterns
-    name_patterns = [
-        r"(?:my name is|i'm|i am|call me)\s+([A-Za-z][A-Za-z\s]{1,30})",
-        r"(?:this is|here is)\s+([A-Za-z][A-ZaZ\s]{1,30})",
-    ]
-    
-    for pattern in name_patterns:
-        match = re.search(pattern, combined_text, re.IGNORECASE)
-        if match:
-            name = match.group(1).strip()
-            # Filter out common words that aren't names
-            if name.lower() not in ['saba', 'assistant', 'bot', 'ai', 'help', 'meeting']:
-                return name
-    return None
+    # Name patterns and the filter for common words that aren't names are in client_extraction.py
+    return MEETING_NAME_ENGINE.scan(combined_text).name
 
-def is_client_info_complete(client_id: str, email: str, user_input: str, ai_reply: str) -> Dict[str, Any]:
+def is_client_info_complete(client_id: str, email: str, user_input: str, ai_reply: str,
+                            client_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Check if we have complete client information before scheduling meeting.
     Returns dict with completion status and missing fields.
+    `client_info` is the stored info when the caller already loaded it.
     """
-    client_info = get_client_info_from_redis(client_id)
+    if client_info is None:
+        client_info = get_client_info_from_redis(client_id)
     
     # Try to extract name from current conversation if not stored
     stored_name = client_info.get('name') or client_info.get('Name')
@@ -390,33 +388,24 @@ def is_client_info_complete(client_id: str, email: str, user_input: str, ai_repl
         'needs_confirmation': True  # Always require confirmation
     }
 
-def detect_and_schedule_meeting(user_input: str, ai_reply: str, client_id: str) -> Dict[str, Any]:
+def detect_and_schedule_meeting(user_input: str, ai_reply: str, client_id: str,
+                                client_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Detects email addresses in conversation and schedules Google Meet only after confirming complete client information.
     Returns meeting details if email was detected and meeting scheduling was attempted.
+    `client_info` is the client's stored info when the caller already loaded it.
     """
-    # 📧 EMAIL PATTERN: Enhanced to catch various email formats
-    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-    
     # Check for email in user input
-    user_emails = re.findall(email_pattern, user_input)
+    user_emails = find_emails(user_input)
     
     # 🔍 ENHANCED: Also check conversation history for emails if none found in current input
     conversation_emails = []
     if not user_emails:
         try:
-            # Read the conversation file to check for emails in full conversation history
-            conversation_files = [f for f in os.listdir('client_data') if f.startswith(f'conversation_{client_id}')]
-            if conversation_files:
-                latest_conversation = max(conversation_files, key=lambda x: os.path.getctime(os.path.join('client_data', x)))
-                conversation_path = os.path.join('client_data', latest_conversation)
-                
-                with open(conversation_path, 'r', encoding='utf-8') as f:
-                    full_conversation = f.read()
-                
-                conversation_emails = re.findall(email_pattern, full_conversation)
-                # Filter out the official email to get client emails only
-                conversation_emails = [email for email in conversation_emails if email != "khanjawadkhalid@gmail.com"]
+            # Emails already seen in the conversation (official email filtered out)
+            latest_conversation = conversation_index.latest(client_id)
+            if latest_conversation:
+                conversation_emails = extraction_states.get(latest_conversation).client_emails
                 
                 if conversation_emails:
                     logging.info(f"📧 Email found in conversation history: {conversation_emails[0]} for client: {client_id}")
@@ -426,14 +415,9 @@ def detect_and_schedule_meeting(user_input: str, ai_reply: str, client_id: str)
     # Use emails from current input or conversation history
     detected_emails = user_emails or conversation_emails
     
-    # Check for meeting-related keywords in the conversation
-    meeting_keywords = [
-        'meeting', 'schedule', 'google meet', 'meet link', 'appointment', 
-        'call', 'discussion', 'consultation', 'demo', 'presentation'
-    ]
-    
-    has_meeting_context = any(keyword in user_input.lower() or keyword in ai_reply.lower() 
-                            for keyword in meeting_keywords)
+    # Check for meeting-related and confirmation keywords in the conversation
+    user_intents = KEYWORD_MATCHER.classify(user_input, only=["meeting", "confirmation"])
+    has_meeting_context = "meeting" in user_intents or KEYWORD_MATCHER.matches(ai_reply, "meeting")
     
     # If email detected and meeting context exists
     if detected_emails and has_meeting_context:
@@ -441,7 +425,7 @@ def detect_and_schedule_meeting(user_input: str, ai_reply: str, client_id: str)
         logging.info(f"📧 Email detected: {email} for client: {client_id}")
         
         # Check if we have complete client information first
-        info_check = is_client_info_complete(client_id, email, user_input, ai_reply)
+        info_check = is_client_info_complete(client_id, email, user_input, ai_reply, client_info)
         
         if not info_check['is_complete']:
             # Return request for missing information instead of scheduling meeting
@@ -454,12 +438,7 @@ def detect_and_schedule_meeting(user_input: str, ai_reply: str, client_id: str)
             }
         
         # Check for explicit confirmation keywords
-        confirmation_keywords = [
-            'yes', 'confirm', 'proceed', 'go ahead', 'schedule it', 'book it', 
-            'correct', 'right', 'that\'s right', 'exactly', 'perfect'
-        ]
-        
-        has_confirmation = any(keyword in user_input.lower() for keyword in confirmation_keywords)
+        has_confirmation = "confirmation" in user_intents
         
         # If we don't have explicit confirmation, request it
         if info_check['needs_confirmation'] and not has_confirmation:
@@ -638,9 +617,7 @@ def save_meeting_to_leads(client_id: str, email: str, meeting_info: Dict[str, st
     Saves meeting information to the leads database and updates minimal leads file.
     """
     try:
-        leads_data = load_leads_from_file()
         meeting_entry = {
-            "id": len(leads_data) + 1,
             "timestamp": datetime.now().isoformat(),
             "name": name or "N/A",
             "contact_method": "auto_scheduled_meeting",
@@ -653,8 +630,7 @@ def save_meeting_to_leads(client_id: str, email: str, meeting_info: Dict[str, st
             "calendar_link": calendar_result.get("htmlLink"),
             "source_log_file": f"conversation_{client_id}.txt"
         }
-        leads_data.append(meeting_entry)
-        save_leads_to_file(leads_data)
+        lead_store.append_meeting_lead(meeting_entry)
         logging.info(f"📝 Meeting entry saved to leads database: {meeting_entry['id']}")
         # --- Update minimal leads file ---
         phone = extract_phone_from_chat_id(chat_id) if chat_id else None
@@ -672,18 +648,8 @@ def save_meeting_to_leads(client_id: str, email: str, meeting_info: Dict[str, st
 
 LEADS_MINIMAL_FILE = os.path.join(EXCEL_FOLDER, "leads_minimal.json")
 
-def load_leads_minimal() -> List[Dict[str, Any]]:
-    if not os.path.exists(LEADS_MINIMAL_FILE):
-        return []
-    try:
-        with open(LEADS_MINIMAL_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return []
-
-def save_leads_minimal(leads: List[Dict[str, Any]]):
-    with open(LEADS_MINIMAL_FILE, "w", encoding="utf-8") as f:
-        json.dump(leads, f, ensure_ascii=False, indent=2)
+# Indexed in-memory view of the leads store shared by all lookups
+lead_registry = LeadRegistry(lead_store)
 
 def extract_phone_from_chat_id(chat_id: str) -> Optional[str]:
     match = re.match(r"(\d{10,15})@", chat_id)
@@ -692,9 +658,8 @@ def extract_phone_from_chat_id(chat_id: str) -> Optional[str]:
     return None
 
 def update_leads_minimal(name: Optional[str], phone: Optional[str], email: Optional[str], chat_summary: Optional[str], meet_link: Optional[str], date: Optional[str], meeting_time: Optional[str] = None, conversation_file: Optional[str] = None):
-    leads = load_leads_minimal()
     # Find by phone
-    lead = next((l for l in leads if l.get("phone") == phone), None)
+    lead = lead_registry.find_by_phone(phone)
     if lead:
         if name: lead["name"] = name
         if email: lead["email"] = email
@@ -710,10 +675,9 @@ def update_leads_minimal(name: Optional[str], phone: Optional[str], email: Optio
                 conversation_files.append(conversation_file)
                 lead["conversation_files"] = conversation_files
             lead["last_interaction"] = datetime.now().isoformat()
+        lead_registry.save_lead(lead)
     else:
-        new_id = max([l.get("id", 0) for l in leads] + [0]) + 1
-        leads.append({
-            "id": new_id,
+        lead_registry.add_lead({
             "name": name or "",
             "phone": phone or "",
             "email": email or "",
@@ -725,22 +689,19 @@ def update_leads_minimal(name: Optional[str], phone: Optional[str], email: Optio
             "last_interaction": datetime.now().isoformat(),
             "total_messages": 0
         })
-    save_leads_minimal(leads)
 
 def get_conversation_history(phone: Optional[str] = None, email: Optional[str] = None, lead_id: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     Get conversation history for a lead - returns lightweight conversation data for Gemini
     """
-    leads = load_leads_minimal()
-    
     # Find the lead
     lead = None
     if lead_id:
-        lead = next((l for l in leads if l.get("id") == lead_id), None)
+        lead = lead_registry.find_by_id(lead_id)
     elif phone:
-        lead = next((l for l in leads if l.get("phone") == phone), None)
+        lead = lead_registry.find_by_phone(phone)
     elif email:
-        lead = next((l for l in leads if l.get("email") == email), None)
+        lead = lead_registry.find_by_email(email)
     
     if not lead:
         return []
@@ -779,14 +740,14 @@ def get_conversation_history(phone: Optional[str] = None, email: Optional[str] =
     
     return conversation_history
 
-@app.route("/system-instruction", methods=["GET"])
+@bp.route("/system-instruction", methods=["GET"])
 def get_system_instruction_api():
     instruction = get_instruction()
     if instruction is None:
         return jsonify({"error": "Not found"}), 404
     return jsonify({"system_instruction": instruction})
 
-@app.route("/system-instruction", methods=["POST"])
+@bp.route("/system-instruction", methods=["POST"])
 def update_system_instruction_api():
     data = request.get_json()
     new_instruction = data.get("system_instruction", "")
@@ -802,7 +763,7 @@ def update_system_instruction_api():
         save_history(history)
     return jsonify({"message": "System instruction updated"})
 
-@app.route("/system-instruction", methods=["PUT"])
+@bp.route("/system-instruction", methods=["PUT"])
 def create_system_instruction_api():
     if os.path.exists(INSTRUCTION_FILE):
         return jsonify({"error": "File already exists"}), 400
@@ -812,7 +773,7 @@ def create_system_instruction_api():
     save_history([])  # Start with empty history
     return jsonify({"message": "File created"})
 
-@app.route("/system-instruction/history", methods=["GET"])
+@bp.route("/system-instruction/history", methods=["GET"])
 def get_system_instruction_history_api():
     history = get_history()
     return jsonify({"history": history})
@@ -822,323 +783,623 @@ You are Saba, a clever, slightly witty, and professional AI assistant Saba as a
 ... (your full instruction here) ...
 """
 
-if not os.path.exists(INSTRUCTION_FILE):
-    save_instruction(DEFAULT_SYSTEM_INSTRUCTION)
-    save_history([])
+# Parsed system instruction (reloaded when the file changes) and per-client context blocks
+instruction_cache = InstructionCache(INSTRUCTION_FILE, DEFAULT_SYSTEM_INSTRUCTION)
+client_context_cache = ClientContextCache()
 
-@app.route('/gemini/train', methods=['POST'])
-@limiter.limit("200000 per day;10000 per hour")
-def gemini_train():
-    try:
-        data = request.get_json()
-        logging.debug(f"Received train request: {data}")
-        if not data or "content" not in data:
-            logging.warning("🚨 'content' key missing: %s", data)
-            return jsonify({"error": "Missing 'content' in request body"}), 400
-
-        user_input: str = data.get("content", "").strip()
-        if not user_input:
-            logging.warning("🚨 Empty 'content': %s", data)
-            return jsonify({"error": "Empty 'content' value"}), 400
-
-        client_id: str = data.get("client_id", "default").replace("@", "_")
-        phone: Optional[str] = data.get("phone")
-        email: Optional[str] = data.get("email")
-        logging.debug(f"Client ID: {client_id}, Phone: {phone}, Email: {email}")
-
-        MAX_INPUT_LENGTH = int(os.getenv("MAX_INPUT_LENGTH", 5000))
-        if len(user_input) > MAX_INPUT_LENGTH:
-            return jsonify({"error": f"Input exceeds {MAX_INPUT_LENGTH} characters"}), 400
-
-        # 📊 GET CLIENT CONTEXT FROM BOTH JSON FILES
-        client_context = get_client_context(client_id, phone, email)
-        sales_notes = client_context.get("sales_notes", "")
-        existing_client_data = client_context.get("client_data")
-        
-        # 🎯 CLIENT DEDUPLICATION: Check if this is first interaction
-        client_result = get_or_create_client_and_conversation(phone, email, client_id)
-        is_new_client = client_result["created"]
-        client_info = client_result["client"]
-        
-        logging.debug(f"📋 Sales Notes: {sales_notes[:100]}..." if sales_notes else "📋 No sales notes found")
-        logging.debug(f"👤 Client Info: {client_info.get('name')} (ID: {client_info['id']}) - {'NEW' if is_new_client else 'EXISTING'}")
-
-        redis_client: redis.Redis = app.config["SESSION_REDIS"]
-        session_key = f"chat_session:{client_id}"
-
-        session_data_raw: Optional[bytes] = redis_client.get(session_key)  # type: ignore
-        conversation_history: List[Dict[str, Any]]
-        client_name: Optional[str] = None
-
-        is_new_user = False
-        if session_data_raw:
-            session_data: Dict[str, Any] = json.loads(session_data_raw.decode('utf-8'))
-            conversation_history = session_data.get("conversation_history", [])
-            client_name = session_data.get("client_name")
+def prepare_train_turn(data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Validate a /gemini/train request, load the client's session and build the
+    Gemini payload.
+
+    Returns {"error": (body, status)} for a bad request, {"greeting": text}
+    for a new client's first message, or the turn state used by
+    finalize_train_turn() with the request payload under "payload".
+    """
+    logging.debug(f"Received train request: {data}")
+    if not data or "content" not in data:
+        logging.warning("🚨 'content' key missing: %s", data)
+        return {"error": ({"error": "Missing 'content' in request body"}, 400)}
+
+    user_input: str = data.get("content", "").strip()
+    if not user_input:
+        logging.warning("🚨 Empty 'content': %s", data)
+        return {"error": ({"error": "Empty 'content' value"}, 400)}
+
+    client_id: str = data.get("client_id", "default").replace("@", "_")
+    phone: Optional[str] = data.get("phone")
+    email: Optional[str] = data.get("email")
+    logging.debug(f"Client ID: {client_id}, Phone: {phone}, Email: {email}")
+
+    MAX_INPUT_LENGTH = int(os.getenv("MAX_INPUT_LENGTH", 5000))
+    if len(user_input) > MAX_INPUT_LENGTH:
+        return {"error": ({"error": f"Input exceeds {MAX_INPUT_LENGTH} characters"}, 400)}
+
+    # 📊 GET CLIENT CONTEXT FROM BOTH JSON FILES
+    client_context = get_client_context(client_id, phone, email)
+    sales_notes = client_context.get("sales_notes", "")
+    existing_client_data = client_context.get("client_data")
+    
+    # 🎯 CLIENT DEDUPLICATION: Check if this is first interaction
+    client_result = get_or_create_client_and_conversation(phone, email, client_id)
+    is_new_client = client_result["created"]
+    client_info = client_result["client"]
+    
+    logging.debug(f"📋 Sales Notes: {sales_notes[:100]}..." if sales_notes else "📋 No sales notes found")
+    logging.debug(f"👤 Client Info: {client_info.get('name')} (ID: {client_info['id']}) - {'NEW' if is_new_client else 'EXISTING'}")
+
+    # Session and client info in one round trip; saved once when the turn ends
+    chat_session = session_store.load(client_id)
+    history: ConversationWindow
+    client_name: Optional[str] = None
+
+    is_new_user = False
+    if not chat_session.is_new:
+        session_data: Dict[str, Any] = chat_session.data  # type: ignore[assignment]
+        history = history_manager.load(session_data)
+        client_name = session_data.get("client_name")
+        # Sequence number of the last turn ever added (history itself is trimmed)
+        turn_seq: int = session_data.get("turn_seq", len(history.turns))
+        # Identifies the session turn_seq counts in (the conversation file outlives it)
+        session_epoch: str = session_data.get("session_epoch") or uuid.uuid4().hex
+    else:
+        # New user - initialize session but don't return early
+        is_new_user = True
+        history = history_manager.load(None)
+        client_name = None
+        turn_seq = 0
+        session_epoch = uuid.uuid4().hex
+        logging.debug(f"Initializing new session for {client_id}")
+
+    # 🆕 HANDLE NEW CLIENT: Return greeting with client ID immediately for first message
+    if is_new_client and len(history.turns) == 0:
+        greeting = saba_greeting_with_client_id(client_info)
+        logging.info(f"🆕 New client detected, sending greeting with ID: {client_info['id']}")
+        
+        # Add user input and greeting to conversation history
+        new_turns = [
+            {"role": "user", "parts": [{"text": user_input}]},
+            {"role": "model", "parts": [{"text": greeting}]},
+        ]
+        for new_turn in new_turns:
+            history.add(new_turn)
+        
+        # Save session and conversation
+        chat_session.replace(history, client_name=client_name, turn_seq=turn_seq + 2, session_epoch=session_epoch)
+        session_store.save(chat_session)
+        bookkeeping_queue.enqueue("save_conversation", {
+            "client_id": client_id,
+            "turns": new_turns,
+            "first_seq": turn_seq + 1,
+            "session_epoch": session_epoch,
+        }, key=client_id)
+        
+        return {"greeting": greeting}
+
+    if not client_name:
+        logging.debug(f"Checking for name in input: {user_input}")
+        name_match = re.search(r"(?:my name is|i'm|i am)\s+([A-Za-z][A-Za-z\s]*)", user_input, re.IGNORECASE)
+        if name_match:
+            client_name = name_match.group(1)
+            logging.debug(f"Client name stored: {client_name}")
         else:
-            # New user - initialize session but don't return early
-            is_new_user = True
-            conversation_history = []
-            client_name = None
-            logging.debug(f"Initializing new session for {client_id}")
-
-        # 🆕 HANDLE NEW CLIENT: Return greeting with client ID immediately for first message
-        if is_new_client and len(conversation_history) == 0:
-            greeting = saba_greeting_with_client_id(client_info)
-            logging.info(f"🆕 New client detected, sending greeting with ID: {client_info['id']}")
-            
-            # Add user input and greeting to conversation history
-            conversation_history.append({"role": "user", "parts": [{"text": user_input}]})
-            conversation_history.append({"role": "model", "parts": [{"text": greeting}]})
+            logging.debug("No name matched in input")
+
+    user_turn: Dict[str, Any] = {"role": "user", "parts": [{"text": user_input}]}
+    # Older turns beyond HISTORY_TOKEN_BUDGET are folded into the rolling summary
+    history.add(user_turn)
+    turn_seq += 1
+    user_turn_seq = turn_seq
+
+    logging.debug(f"Conversation history ({history.total_tokens} tokens): {history.turns}")
+    logging.debug(f"📤 Sending to Gemini: {user_input}")
+
+    # 📅 Base instruction with today's date, parsed once per file version and dated once per day
+    system_instruction_content = instruction_cache.render()
+
+    # 🎯 INJECT CLIENT CONTEXT INTO SYSTEM INSTRUCTION (rebuilt only when notes/lead data change)
+    context_injection = client_context_cache.block(client_id, sales_notes, existing_client_data)
+    if context_injection:
+        system_instruction_content += context_injection
+        logging.debug(f"💡 Injected client context: {len(context_injection)} characters")
+
+    payload: Dict[str, Any] = {
+        "systemInstruction": {"parts": [{"text": system_instruction_content}]},
+        "contents": history.contents()
+    }
+
+    # 🗃️ Only turns without per-client context may be answered from the response cache
+    cache_query = None
+    if response_cache is not None:
+        if context_injection:
+            response_cache.bypass()
+        else:
+            cache_query = response_cache.query(user_input, system_instruction_content, history.turns[:-1])
+
+    return {
+        "user_input": user_input,
+        "client_id": client_id,
+        "phone": phone,
+        "email": email,
+        "existing_client_data": existing_client_data,
+        "session": chat_session,
+        "history": history,
+        "client_name": client_name,
+        "turn_seq": turn_seq,
+        "session_epoch": session_epoch,
+        "user_turn": user_turn,
+        "user_turn_seq": user_turn_seq,
+        "payload": payload,
+        "cache_query": cache_query,
+    }
+
+def gemini_response_error(res_json: Dict[str, Any]) -> Optional[Tuple[Dict[str, str], int]]:
+    """Return (error body, status) for a Gemini reply without text (e.g. blocked), else None"""
+    if not res_json.get("candidates") or not res_json["candidates"][0].get("content") or not res_json["candidates"][0]["content"].get("parts"):
+        logging.error("⚠️ Missing content structure: %s", res_json)
+        finish_reason = res_json.get("candidates", [{}])[0].get("finishReason", "UNKNOWN")
+        if finish_reason != "STOP":
+            block_reason = res_json.get("promptFeedback", {}).get("blockReason", "NONE")
+            logging.warning(f"Prompt blocked: {block_reason}, Details: {res_json.get('promptFeedback')}")
+            return {
+                "error": "Content blocked due to safety policies.",
+                "details": "Please revise your input and try again."
+            }, 400
+        return {"error": f"Response issue. Finish Reason: {finish_reason}"}, 500
+    return None
+
+def update_client_from_conversation(job: Dict[str, Any]) -> None:
+    """Background job: extract client info from the conversation and update the lead"""
+    client_id: str = job["client_id"]
+    # Extract client information from the full conversation history
+    extracted_info = None
+    try:
+        # Catch the extraction state up with the lines added since the last turn
+        latest_conversation = conversation_index.latest(client_id)
+        if latest_conversation:
+            extraction = extraction_states.get(latest_conversation)
+            extracted_info = extraction.client_info()
+            logging.info(f"📖 Using full conversation history for data extraction: {extraction.chars_seen} characters")
+    except Exception as e:
+        logging.warning(f"⚠️ Could not read full conversation, using current input only: {e}")
+    
+    if extracted_info is None:
+        extracted_info = extract_client_info_from_conversation(job["user_input"], job["reply"])
+    
+    # Update total messages count
+    extracted_info["total_messages"] = job["total_messages"]
+    
+    # Update the client data
+    if not update_client_data(client_id, extracted_info, job.get("phone"), job.get("email")):
+        raise RuntimeError(f"Failed to update client data for {client_id}")
+    logging.info(f"✅ Updated client data for {client_id}")
+
+def save_to_excel_job(job: Dict[str, Any]) -> None:
+    """Background job: write captured client info to Excel"""
+    if not save_to_excel(job["client_info"], job["client_id"]):
+        raise RuntimeError(f"Failed to save client info to Excel for {job['client_id']}")
+
+def save_conversation_job(job: Dict[str, Any]) -> None:
+    """Background job: append a turn's messages to the conversation log and link the lead"""
+    if not save_conversation(job["client_id"], job["turns"], job["first_seq"], job.get("session_epoch", "")):
+        raise RuntimeError(f"Failed to save conversation for {job['client_id']}")
+
+def build_bookkeeping_queue() -> JobQueue:
+    """
+    Durable queue for post-reply bookkeeping (lead updates, Excel, conversation logs).
+    BOOKKEEPING_WORKERS=0 runs the jobs inline in the request.
+    """
+    queue = JobQueue(
+        os.getenv("JOB_QUEUE_PATH", os.path.join(CLIENT_DATA_FOLDER, "jobs.db")),
+        workers=int(os.getenv("BOOKKEEPING_WORKERS", 2)),
+    )
+    queue.register("update_client", update_client_from_conversation)
+    queue.register("save_to_excel", save_to_excel_job)
+    queue.register("save_conversation", save_conversation_job)
+    return queue
+
+bookkeeping_queue: JobQueue = Lazy(build_bookkeeping_queue)  # type: ignore[assignment]
+
+def finalize_train_turn(turn: Dict[str, Any], reply: str) -> str:
+    """
+    Post-process Gemini's reply: detect/schedule meetings and store the
+    session inline, and queue the lead update, Excel export and conversation
+    log append for the bookkeeping workers.
+    Returns the reply to send (meeting details may be appended).
+    """
+    user_input: str = turn["user_input"]
+    client_id: str = turn["client_id"]
+    phone: Optional[str] = turn["phone"]
+    email: Optional[str] = turn["email"]
+    existing_client_data = turn["existing_client_data"]
+    chat_session: ChatSession = turn["session"]
+    history: ConversationWindow = turn["history"]
+    client_name: Optional[str] = turn["client_name"]
+    turn_seq: int = turn["turn_seq"]
+    user_turn: Dict[str, Any] = turn["user_turn"]
+    user_turn_seq: int = turn["user_turn_seq"]
+    session_epoch: str = turn["session_epoch"]
+
+    # 🔄 UPDATE CLIENT DATA IN LEADS_MINIMAL.JSON (in the background)
+    total_messages = existing_client_data.get("total_messages", 0) + 1 if existing_client_data else 1
+    bookkeeping_queue.enqueue("update_client", {
+        "client_id": client_id,
+        "user_input": user_input,
+        "reply": reply,
+        "phone": phone,
+        "email": email,
+        "total_messages": total_messages,
+    }, key=client_id)
+
+    if "what is your" in user_input.lower() or "can you tell me your" in user_input.lower():
+        field_match = re.search(r"(what is your|can you tell me your)\s+(.+)", user_input, re.IGNORECASE)
+        if field_match:
+            field = field_match.group(2).strip().capitalize()
+            client_data_item: Dict[str, str] = {field: reply}
+            chat_session.update_client_info(client_data_item)
+            existing_info: Dict[str, Any] = dict(chat_session.client_info)
+            if len(existing_info) >= 3:
+                bookkeeping_queue.enqueue("save_to_excel", {"client_id": client_id, "client_info": existing_info}, key=client_id)
+
+    if "I'm Saba" in reply or "May I have your name" in reply:
+        logging.warning(f"Possible repetition in response: {reply}")
+
+    # 📧 AUTOMATIC EMAIL DETECTION & GOOGLE MEET SCHEDULING WITH CONFIRMATION
+    meeting_result = {"success": False}
+    try:
+        meeting_result = detect_and_schedule_meeting(user_input, reply, client_id, chat_session.client_info)
+        
+        if meeting_result.get("success"):
+            logging.info(f"📧 Email detected and meeting scheduled for client: {client_id}")
             
-            # Save session and conversation
-            redis_client.setex(session_key, 86400, json.dumps({
-                "conversation_history": conversation_history,
-                "client_name": client_name,
-            }))
-            save_conversation(client_id, conversation_history)
+            # 🔗 ADD MEETING DETAILS TO THE AI RESPONSE
+            meeting_link = meeting_result.get("meeting_link")
+            calendar_link = meeting_result.get("calendar_link")
+            client_email = meeting_result.get("email")
+            meeting_details = meeting_result.get("meeting_details", {})
             
-            return jsonify({"reply": greeting})
-
-        if not client_name:
-            logging.debug(f"Checking for name in input: {user_input}")
-            name_match = re.search(r"(?:my name is|i'm|i am)\s+([A-Za-z][A-Za-z\s]*)", user_input, re.IGNORECASE)
-            if name_match:
-                client_name = name_match.group(1)
-                logging.debug(f"Client name stored: {client_name}")
-            else:
-                logging.debug("No name matched in input")
-
-        conversation_history.append({"role": "user", "parts": [{"text": user_input}]})
-
-        MAX_HISTORY_TURNS = int(os.getenv("MAX_HISTORY_TURNS", 10))
-        if len(conversation_history) > MAX_HISTORY_TURNS * 2:
-            conversation_history = conversation_history[-(MAX_HISTORY_TURNS * 2):]
-
-        redis_client.setex(session_key, 86400, json.dumps({  # type: ignore
-            "conversation_history": conversation_history,
-            "client_name": client_name,
-        }))
-        logging.debug(f"Updated session for {client_id}")
-
-        logging.debug(f"Conversation history: {conversation_history}")
-        logging.debug(f"📤 Sending to Gemini: {user_input}")
-
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
-        headers = {"Content-Type": "application/json"}
-        
-        system_instruction_content = get_instruction()
-        if system_instruction_content is None:
-            system_instruction_content = DEFAULT_SYSTEM_INSTRUCTION
-
-        # 🎯 INJECT CLIENT CONTEXT INTO SYSTEM INSTRUCTION
-        context_injection = ""
-        
-        if sales_notes:
-            context_injection += f"\n\n📝 SALES TEAM NOTES FOR THIS CLIENT:\n{sales_notes}\n"
-        
-        if existing_client_data:
-            context_injection += f"\n\n👤 CLIENT INFORMATION:\n"
-            context_injection += f"- Name: {existing_client_data.get('name', 'Unknown')}\n"
-            context_injection += f"- Phone: {existing_client_data.get('phone', 'N/A')}\n"
-            context_injection += f"- Email: {existing_client_data.get('email', 'N/A')}\n"
-            context_injection += f"- Previous Summary: {existing_client_data.get('chat_summary', 'N/A')}\n"
-            context_injection += f"- Last Interaction: {existing_client_data.get('last_interaction', 'N/A')}\n"
+            if meeting_link:
+                # Append meeting information to the AI's response
+                meeting_info = f"\n\n✅ **Meeting Scheduled Successfully!**\n\n"
+                meeting_info += f"📧 **Invitation sent to:** {client_email} and khanjawadkhalid@gmail.com\n"
+                meeting_info += f"📅 **Date & Time:** {meeting_details.get('meeting_date', 'TBD')} at {meeting_details.get('meeting_time', 'TBD')} PKT\n"
+                meeting_info += f"🔗 **Google Meet Link:** {meeting_link}\n"
+                if calendar_link:
+                    meeting_info += f"📅 **Add to Calendar:** {calendar_link}\n"
+                meeting_info += f"\nPlease save this meeting link and join at the scheduled time. I'll see you there!"
+                
+                # Add the meeting info to the original AI reply
+                reply = reply + meeting_info
+        
+        elif meeting_result.get("needs_info"):
+            logging.info(f"📝 Missing client information for meeting: {client_id}")
+            # Append information request to the AI's response
+            info_request = f"\n\n📝 **Meeting Information Required**\n\n"
+            info_request += meeting_result.get("message", "I need some additional information before scheduling your meeting.")
+            reply = reply + info_request
+        
+        elif meeting_result.get("needs_confirmation"):
+            logging.info(f"📋 Requesting confirmation for meeting: {client_id}")
+            # Append confirmation request to the AI's response
+            confirmation_request = f"\n\n📋 **Please Confirm Your Details**\n\n"
+            confirmation_request += meeting_result.get("message", "Please confirm your information before I schedule the meeting.")
+            reply = reply + confirmation_request
+                
+    except Exception as e:
+        logging.error(f"❌ Error in automatic meeting scheduling: {e}")
+        # Don't break the conversation flow if meeting scheduling fails
+
+    model_turn: Dict[str, Any] = {"role": "model", "parts": [{"text": reply}]}
+    history.add(model_turn)
+    turn_seq += 1
+    # The only session write of the turn: session and client info in one MULTI/EXEC
+    chat_session.replace(history, client_name=client_name, turn_seq=turn_seq, session_epoch=session_epoch)
+    client_info_changed = chat_session.client_info_changed
+    session_store.save(chat_session)
+    if client_info_changed:
+        client_info_cache.invalidate(client_id)
+    bookkeeping_queue.enqueue("save_conversation", {
+        "client_id": client_id,
+        "turns": [user_turn, model_turn],
+        "first_seq": user_turn_seq,
+        "session_epoch": session_epoch,
+    }, key=client_id)
+    logging.debug("Session updated with response")
+    return reply
+
+def request_deadline(timeout_header: Optional[str]) -> float:
+    """
+    time.monotonic() deadline for a request's Gemini call: the caller's
+    X-Request-Timeout budget (seconds) when sent, capped at GEMINI_DEADLINE.
+    """
+    budget = GEMINI_DEADLINE
+    try:
+        budget = min(budget, float(timeout_header or budget))
+    except ValueError:
+        pass
+    return time.monotonic() + budget
+
+def gemini_request_deadline() -> float:
+    """request_deadline() of the current Flask request"""
+    return request_deadline(request.headers.get("X-Request-Timeout"))
+
+ResponseParts = Tuple[Dict[str, Any], int, Dict[str, str]]
+
+def gemini_unreachable_error(e: GeminiRequestError) -> ResponseParts:
+    """Error body, status and headers when Gemini gave no reply (breaker open, deadline, connection error)"""
+    body = {"error": "Gemini API request failed.", "details": "Please try again later."}
+    if isinstance(e, GeminiUnavailableError):
+        logging.warning(f"⛔ {e}")
+        return body, 503, {"Retry-After": str(int(e.retry_after) + 1)}
+    logging.error(f"🔥 Gemini API unreachable: {e}")
+    return body, 504 if e.timeout else 502, {}
+
+def answer_without_gemini(turn: Dict[str, Any]) -> Optional[ResponseParts]:
+    """The response for a prepared turn that needs no Gemini call (bad request, greeting, cache hit), else None"""
+    if "error" in turn:
+        return turn["error"][0], turn["error"][1], {}
+    if "greeting" in turn:
+        return {"reply": turn["greeting"]}, 200, {}
+
+    cache_query = turn["cache_query"]
+    cached_reply = response_cache.get(cache_query) if cache_query else None
+    if cached_reply is not None:
+        logging.info(f"🗃️ Serving cached reply for {turn['client_id']}")
+        return {"reply": finalize_train_turn(turn, cached_reply)}, 200, {}
+    return None
+
+def complete_train_turn(turn: Dict[str, Any], response: Any) -> ResponseParts:
+    """Turn Gemini's HTTP response into the /gemini/train response, finalizing the turn on success"""
+    if response.status_code == 200:
+        res_json = response.json()
+        try:
+            error_response = gemini_response_error(res_json)
+            if error_response:
+                return error_response[0], error_response[1], {}
+
+            reply: str = res_json["candidates"][0]["content"]["parts"][0]["text"]
+            if turn["cache_query"]:
+                response_cache.put(turn["cache_query"], reply)
+            reply = finalize_train_turn(turn, reply)
             
-            meeting_info = client_context.get("meeting_info", {})
-            if meeting_info.get("meet_link"):
-                context_injection += f"- Meeting Scheduled: {meeting_info.get('meeting_date')} at {meeting_info.get('meeting_time')}\n"
-                context_injection += f"- Meeting Link: {meeting_info.get('meet_link')}\n"
-        
-        if context_injection:
-            context_injection += "\nUse this information to provide personalized, context-aware responses. Reference previous conversations and notes when relevant.\n"
-            system_instruction_content += context_injection
-            logging.debug(f"💡 Injected client context: {len(context_injection)} characters")
+            # Return the natural AI response without forced greetings
+            return {"reply": reply}, 200, {}
+        except (KeyError, IndexError) as e:
+            logging.error("⚠️ Unexpected response structure: %s, Error: %s", res_json, e)
+            return {"error": "Unexpected response format from Gemini."}, 500, {}
+    else:
+        logging.error("🔥 Gemini API Error (%s): %s", response.status_code, response.text)
+        return {"error": "Gemini API request failed.", "details": "Please try again later."}, response.status_code, {}
 
-        # 📅 DYNAMIC DATE INJECTION: Update the date context in the system instruction
-        current_date = datetime.now().strftime("%B %d, %Y")  # e.g., "June 4, 2025"
-        current_time_zone = "Pakistan Standard Time (PST/PKT)"
-        
-        # Replace the static date in the system instruction with the current date
-        date_pattern = r"📅 CURRENT DATE & TIME CONTEXT\s*\nToday's date is: [^\n]+\nCurrent time zone: [^\n]+"
-        updated_date_context = f"📅 CURRENT DATE & TIME CONTEXT\nToday's date is: {current_date}\nCurrent time zone: {current_time_zone}"
-        
-        if re.search(date_pattern, system_instruction_content):
-            system_instruction_content = re.sub(date_pattern, updated_date_context, system_instruction_content)
-        else:
-            # If no date context found, add it at the beginning after the header
-            lines = system_instruction_content.split('\n')
-            if len(lines) > 8:  # Insert after the header section
-                lines.insert(9, f"\n{updated_date_context}")
-                system_instruction_content = '\n'.join(lines)
-        
-        logging.debug(f"📅 Injected current date: {current_date}")
+def turn_key(data: Any) -> Optional[str]:
+    """The client whose turns a /gemini/train request must not overlap, or None when it is rejected anyway"""
+    if not isinstance(data, dict) or not str(data.get("content", "")).strip():
+        return None
+    return str(data.get("client_id", "default")).replace("@", "_")
 
-        payload: Dict[str, Any] = {
-            "systemInstruction": {"parts": [{"text": system_instruction_content}]},
-            "contents": conversation_history
-        }
+def client_turn(data: Any):
+    """Context manager holding the request's client for the whole turn (client_lock.py)"""
+    key = turn_key(data) if client_turns is not None else None
+    return client_turns.hold(key) if key else nullcontext()
 
-        response = requests.post(url, headers=headers, json=payload)
+def release_client_turn(lease: Optional[TurnLease]) -> None:
+    if lease is not None:
+        client_turns.release(lease)
 
-        if response.status_code == 200:
-            res_json = response.json()
-            try:
-                if not res_json.get("candidates") or not res_json["candidates"][0].get("content") or not res_json["candidates"][0]["content"].get("parts"):
-                    logging.error("⚠️ Missing content structure: %s", res_json)
-                    finish_reason = res_json.get("candidates", [{}])[0].get("finishReason", "UNKNOWN")
-                    if finish_reason != "STOP":
-                        block_reason = res_json.get("promptFeedback", {}).get("blockReason", "NONE")
-                        logging.warning(f"Prompt blocked: {block_reason}, Details: {res_json.get('promptFeedback')}")
-                        return jsonify({
-                            "error": "Content blocked due to safety policies.",
-                            "details": "Please revise your input and try again."
-                        }), 400
-                    return jsonify({"error": f"Response issue. Finish Reason: {finish_reason}"}), 500
-
-                reply: str = res_json["candidates"][0]["content"]["parts"][0]["text"]
-
-                # 🔄 UPDATE CLIENT DATA IN LEADS_MINIMAL.JSON
-                try:
-                    # Extract client information from the full conversation history
-                    full_conversation = user_input  # Start with current input
-                    try:
-                        # Read the conversation file to get full context
-                        conversation_files = [f for f in os.listdir('client_data') if f.startswith(f'conversation_{client_id}')]
-                        if conversation_files:
-                            latest_conversation = max(conversation_files, key=lambda x: os.path.getctime(os.path.join('client_data', x)))
-                            conversation_path = os.path.join('client_data', latest_conversation)
-                            
-                            with open(conversation_path, 'r', encoding='utf-8') as f:
-                                full_conversation = f.read()
-                                logging.info(f"📖 Using full conversation history for data extraction: {len(full_conversation)} characters")
-                    except Exception as e:
-                        logging.warning(f"⚠️ Could not read full conversation, using current input only: {e}")
-                    
-                    extracted_info = extract_client_info_from_conversation(full_conversation, reply)
-                    
-                    # Update total messages count
-                    if existing_client_data:
-                        extracted_info["total_messages"] = existing_client_data.get("total_messages", 0) + 1
-                    else:
-                        extracted_info["total_messages"] = 1
-                    
-                    # Update the client data
-                    success = update_client_data(client_id, extracted_info, phone, email)
-                    if success:
-                        logging.info(f"✅ Updated client data for {client_id}")
-                    else:
-                        logging.warning(f"⚠️ Failed to update client data for {client_id}")
-                        
-                except Exception as e:
-                    logging.error(f"❌ Error updating client data: {e}")
-                    # Don't break the conversation flow
-
-                if "what is your" in user_input.lower() or "can you tell me your" in user_input.lower():
-                    field_match = re.search(r"(what is your|can you tell me your)\s+(.+)", user_input, re.IGNORECASE)
-                    if field_match:
-                        field = field_match.group(2).strip().capitalize()
-                        client_data_item: Dict[str, str] = {field: reply}
-                        client_info_key = f"client_info:{client_id}"
-                        existing_info_raw: Optional[bytes] = redis_client.get(client_info_key)  # type: ignore
-                        existing_info: Dict[str, Any]
-                        if existing_info_raw:
-                            existing_info = json.loads(existing_info_raw.decode('utf-8'))
-                        else:
-                            existing_info = {}
-                        existing_info.update(client_data_item)
-                        redis_client.setex(client_info_key, 86400 * 7, json.dumps(existing_info))  # type: ignore
-                        if len(existing_info) >= 3:
-                            save_to_excel(existing_info, client_id)
-
-                if "I'm Saba" in reply or "May I have your name" in reply:
-                    logging.warning(f"Possible repetition in response: {reply}")
-
-                # 📧 AUTOMATIC EMAIL DETECTION & GOOGLE MEET SCHEDULING WITH CONFIRMATION
-                meeting_result = {"success": False}
-                try:
-                    meeting_result = detect_and_schedule_meeting(user_input, reply, client_id)
-                    
-                    if meeting_result.get("success"):
-                        logging.info(f"📧 Email detected and meeting scheduled for client: {client_id}")
-                        
-                        # 🔗 ADD MEETING DETAILS TO THE AI RESPONSE
-                        meeting_link = meeting_result.get("meeting_link")
-                        calendar_link = meeting_result.get("calendar_link")
-                        client_email = meeting_result.get("email")
-                        meeting_details = meeting_result.get("meeting_details", {})
-                        
-                        if meeting_link:
-                            # Append meeting information to the AI's response
-                            meeting_info = f"\n\n✅ **Meeting Scheduled Successfully!**\n\n"
-                            meeting_info += f"📧 **Invitation sent to:** {client_email} and khanjawadkhalid@gmail.com\n"
-                            meeting_info += f"📅 **Date & Time:** {meeting_details.get('meeting_date', 'TBD')} at {meeting_details.get('meeting_time', 'TBD')} PKT\n"
-                            meeting_info += f"🔗 **Google Meet Link:** {meeting_link}\n"
-                            if calendar_link:
-                                meeting_info += f"📅 **Add to Calendar:** {calendar_link}\n"
-                            meeting_info += f"\nPlease save this meeting link and join at the scheduled time. I'll see you there!"
-                            
-                            # Add the meeting info to the original AI reply
-                            reply = reply + meeting_info
-                    
-                    elif meeting_result.get("needs_info"):
-                        logging.info(f"📝 Missing client information for meeting: {client_id}")
-                        # Append information request to the AI's response
-                        info_request = f"\n\n📝 **Meeting Information Required**\n\n"
-                        info_request += meeting_result.get("message", "I need some additional information before scheduling your meeting.")
-                        reply = reply + info_request
-                    
-                    elif meeting_result.get("needs_confirmation"):
-                        logging.info(f"📋 Requesting confirmation for meeting: {client_id}")
-                        # Append confirmation request to the AI's response
-                        confirmation_request = f"\n\n📋 **Please Confirm Your Details**\n\n"
-                        confirmation_request += meeting_result.get("message", "Please confirm your information before I schedule the meeting.")
-                        reply = reply + confirmation_request
-                            
-                except Exception as e:
-                    logging.error(f"❌ Error in automatic meeting scheduling: {e}")
-                    # Don't break the conversation flow if meeting scheduling fails
-
-                conversation_history.append({"role": "model", "parts": [{"text": reply}]})
-                redis_client.setex(session_key, 86400, json.dumps({  # type: ignore
-                    "conversation_history": conversation_history,
-                    "client_name": client_name,
-                }))
-                save_conversation(client_id, conversation_history)
-                logging.debug("Session updated with response")
-                
-                # Return the natural AI response without forced greetings
-                return jsonify({"reply": reply})
-            except (KeyError, IndexError) as e:
-                logging.error("⚠️ Unexpected response structure: %s, Error: %s", res_json, e)
-                return jsonify({"error": "Unexpected response format from Gemini."}), 500
-        else:
-            logging.error("🔥 Gemini API Error (%s): %s", response.status_code, response.text)
-            try:
-                return jsonify({"error": "Gemini API request failed.", "details": "Please try again later."}), response.status_code
-            except requests.exceptions.JSONDecodeError:
-                return jsonify({"error": "Gemini API request failed.", "details": response.text}), response.status_code
+CLIENT_BUSY: ResponseParts = ({"error": "An earlier message from this client is still being answered."},
+                              503, {"Retry-After": "5"})
 
+def run_train_turn(data: Optional[Dict[str, Any]], deadline: float) -> ResponseParts:
+    """Handle one /gemini/train request body; returns the JSON body, status and headers"""
+    try:
+        # Load, Gemini call and save of one client's turns never overlap
+        with client_turn(data):
+            turn = prepare_train_turn(data)
+            answer = answer_without_gemini(turn)
+            if answer is not None:
+                return answer
+
+            # Pooled keep-alive client with retries, circuit breaker and optional hedging (gemini_client.py)
+            response = get_gemini_client(GEMINI_API_KEY).generate_content(GEMINI_MODEL, turn["payload"], deadline=deadline)
+            return complete_train_turn(turn, response)
+
+    except ClientBusy as e:
+        logging.warning(f"⏳ {e}")
+        return CLIENT_BUSY
+    except GeminiRequestError as e:
+        return gemini_unreachable_error(e)
     except Exception as e:
         logging.exception(f"🔥 Unhandled exception in /gemini/train: {e}")
+        return {"error": "Internal server error. Please try again."}, 500, {}
+
+def merge_train_requests(batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One request body from a burst of messages: contents joined, latest non-empty fields win"""
+    merged: Dict[str, Any] = {}
+    for data in batch:
+        merged.update({key: value for key, value in data.items() if value})
+    merged["content"] = "\n".join(data["content"].strip() for data in batch)
+    return merged
+
+def coalesce_key(data: Optional[Dict[str, Any]]) -> Optional[str]:
+    """The client key to coalesce a /gemini/train request under, or None when it is handled alone"""
+    if message_coalescer is None or not isinstance(data, dict) or not str(data.get("content", "")).strip():
+        return None
+    return str(data.get("client_id", "default")).replace("@", "_")
+
+def coalesced_parts(client_key: str, parts: ResponseParts, position: int, size: int) -> ResponseParts:
+    """The response for message `position` of a burst of `size` that produced `parts`"""
+    body, status, headers = parts
+    if size > 1:
+        logging.info(f"🧺 Coalesced {size} messages from {client_key} into one turn")
+        if COALESCE_REPLY_MODE == "last" and position < size - 1:
+            return {"reply": "", "coalesced": True}, 200, {}
+        body = {**body, "coalesced_messages": size}
+    return body, status, headers
+
+def train_response_parts(data: Optional[Dict[str, Any]], deadline: float) -> ResponseParts:
+    """Run a /gemini/train request, coalescing it with the client's burst when enabled"""
+    # 🧺 Coalesce a burst of short messages from one client into one turn (COALESCE_WINDOW)
+    client_key = coalesce_key(data)
+    if client_key is not None:
+        try:
+            parts, position, size = message_coalescer.submit(
+                client_key, data, lambda batch: run_train_turn(merge_train_requests(batch), deadline))
+        except Exception as e:
+            logging.exception(f"🔥 Unhandled exception in coalesced /gemini/train: {e}")
+            return {"error": "Internal server error. Please try again."}, 500, {}
+        return coalesced_parts(client_key, parts, position, size)
+
+    return run_train_turn(data, deadline)
+
+def idempotency_key(data: Any, header: Optional[str]) -> Optional[str]:
+    """Key of a /gemini/train request for idempotent replay: Idempotency-Key header or message_id, per client"""
+    message_id = header or (data.get("message_id") if isinstance(data, dict) else None)
+    if not message_id:
+        return None
+    client_key = str(data.get("client_id", "default") if isinstance(data, dict) else "default").replace("@", "_")
+    return f"{client_key}:{message_id}"
+
+IDEMPOTENCY_CONFLICT: Tuple[Dict[str, Any], int] = ({"error": "A request with this message id is still in progress."}, 409)
+
+@bp.route('/gemini/train', methods=['POST'])
+@limiter.limit("200000 per day;10000 per hour")
+def gemini_train():
+    # The deadline starts when the request arrives
+    deadline = gemini_request_deadline()
+    data = request.get_json(silent=True)
+
+    # 🔁 Gateway retries of the same message share one run (in flight) or replay its result
+    key = idempotency_key(data, request.headers.get("Idempotency-Key"))
+    if key:
+        try:
+            (body, status, headers), replayed = idempotency_store.run(key, lambda: train_response_parts(data, deadline))
+        except IdempotencyConflict:
+            return jsonify(IDEMPOTENCY_CONFLICT[0]), IDEMPOTENCY_CONFLICT[1]
+        if replayed:
+            logging.info(f"🔁 Replayed result for message {key}")
+            headers = {**headers, "Idempotent-Replayed": "true"}
+        return jsonify(body), status, headers
+
+    body, status, headers = train_response_parts(data, deadline)
+    return jsonify(body), status, headers
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@bp.route('/gemini/train/stream', methods=['POST'])
+@limiter.limit("200000 per day;10000 per hour")
+def gemini_train_stream():
+    """
+    Streaming variant of /gemini/train using Server-Sent Events.
+
+    Same request body as /gemini/train. Events:
+    - "chunk" {"text": ...}: the next piece of the reply as Gemini produces it
+    - "done" {"reply": ...}: the full reply, after the same post-processing as
+      /gemini/train (lead update, meeting detection, session and log saving);
+      text appended by post-processing (meeting details) arrives as a last chunk
+    - "error" {"error": ..., "details": ...}: the reply could not be completed
+    Request errors are returned as JSON before the stream starts.
+    """
+    lease: Optional[TurnLease] = None
+    streaming = False
+    try:
+        deadline = gemini_request_deadline()
+        data = request.get_json()
+        # Held until the streamed reply is finalized and the response closed
+        key = turn_key(data) if client_turns is not None else None
+        if key:
+            lease = client_turns.acquire(key)
+        turn = prepare_train_turn(data)
+        if "error" in turn:
+            return jsonify(turn["error"][0]), turn["error"][1]
+        if "greeting" in turn:
+            greeting = turn["greeting"]
+            events = [sse_event("chunk", {"text": greeting}), sse_event("done", {"reply": greeting})]
+            return Response(events, mimetype="text/event-stream", headers=SSE_HEADERS)
+
+        stream = get_gemini_client(GEMINI_API_KEY).stream_generate_content(GEMINI_MODEL, turn["payload"], deadline=deadline)
+        if stream.status_code != 200:
+            logging.error("🔥 Gemini API Error (%s): %s", stream.status_code, stream.text)
+            stream.close()
+            return jsonify({"error": "Gemini API request failed.", "details": "Please try again later."}), stream.status_code
+        streaming = True
+    except ClientBusy as e:
+        logging.warning(f"⏳ {e}")
+        return jsonify(CLIENT_BUSY[0]), CLIENT_BUSY[1], CLIENT_BUSY[2]
+    except GeminiRequestError as e:
+        body, status, headers = gemini_unreachable_error(e)
+        return jsonify(body), status, headers
+    except Exception as e:
+        logging.exception(f"🔥 Unhandled exception in /gemini/train/stream: {e}")
         return jsonify({"error": "Internal server error. Please try again."}), 500
+    finally:
+        if not streaming:
+            release_client_turn(lease)
+
+    def generate():
+        parts: List[str] = []
+        last_chunk: Dict[str, Any] = {}
+        try:
+            for chunk in stream:
+                last_chunk = chunk
+                candidates = chunk.get("candidates") or [{}]
+                for part in candidates[0].get("content", {}).get("parts", []):
+                    if part.get("text"):
+                        parts.append(part["text"])
+                        yield sse_event("chunk", {"text": part["text"]})
+        except GeminiRequestError as e:
+            logging.error(f"🔥 Gemini stream failed: {e}")
+            yield sse_event("error", {"error": "Gemini API request failed.", "details": "Please try again later."})
+            return
+
+        streamed = "".join(parts)
+        if not streamed:
+            error_body, _ = gemini_response_error(last_chunk) or ({"error": "Empty response from Gemini."}, 500)
+            yield sse_event("error", error_body)
+            return
 
-@app.route('/gemini/reset', methods=['POST'])
+        try:
+            reply = finalize_train_turn(turn, streamed)
+        except Exception as e:
+            logging.exception(f"🔥 Error finalizing streamed reply: {e}")
+            yield sse_event("error", {"error": "Internal server error. Please try again."})
+            return
+        if len(reply) > len(streamed) and reply.startswith(streamed):
+            yield sse_event("chunk", {"text": reply[len(streamed):]})
+        yield sse_event("done", {"reply": reply})
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream", headers=SSE_HEADERS)
+    # Also runs when the client disconnects before the stream started
+    response.call_on_close(lambda: release_client_turn(lease))
+    return response
+
+
+@bp.route('/gemini/cache/stats', methods=['GET'])
+def gemini_cache_stats():
+    """Hit/miss metrics of the response cache"""
+    if response_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **response_cache.stats()})
+
+@bp.route('/gemini/reset', methods=['POST'])
 @limiter.limit("20000 per day;5000 per hour")
 def reset_conversation():
     try:
         data = request.get_json()
         client_id: str = data.get("client_id", "default").replace("@", "_") if data else "default"
         logging.debug(f"Reset request for client_id: {client_id}")
-        redis_client: redis.Redis = app.config["SESSION_REDIS"]
-        session_key = f"chat_session:{client_id}"
-        redis_client.delete(session_key)  # type: ignore
+        # Clear the chat session and client info in Redis
+        session_store.clear(client_id)
+        client_info_cache.invalidate(client_id)
+        # The next turns are numbered from 1 again but go on in the same conversation file
+        conversation_file = find_existing_conversation_file(client_id)
+        if conversation_file:
+            conversation_writer.forget(conversation_file)
         logging.debug(f"Deleted session for {client_id}")
 
-        # Clear client info in Redis
-        client_info_key = f"client_info:{client_id}"
-        redis_client.delete(client_info_key)  # type: ignore
-
         # Also clear cookie-based session
         session.pop('conversation_history', None)  # type: ignore
         session.pop('client_name', None)  # type: ignore
@@ -1151,7 +1412,7 @@ def reset_conversation():
         logging.exception(f"🔥 Reset endpoint error: {e}")
         return jsonify({"error": "Failed to reset conversation."}), 500
 
-@app.route('/gemini/save-info', methods=['POST'])
+@bp.route('/gemini/save-info', methods=['POST'])
 @limiter.limit("1000 per hour")
 def save_client_info():
     try:
@@ -1159,12 +1420,9 @@ def save_client_info():
         client_id: str = data.get("client_id", "default").replace("@", "_") if data else "default"
         
         # For Redis-based sessions
-        redis_client: redis.Redis = app.config["SESSION_REDIS"]
-        client_info_key = f"client_info:{client_id}"
-        existing_info_raw: Optional[bytes] = redis_client.get(client_info_key)  # type: ignore
+        existing_info: Dict[str, Any] = session_store.load_client_info(client_id)
         
-        if existing_info_raw:
-            existing_info: Dict[str, Any] = json.loads(existing_info_raw.decode('utf-8'))
+        if existing_info:
             if save_to_excel(existing_info, client_id):
                 return jsonify({"message": "Client info saved successfully"})
         
@@ -1180,7 +1438,7 @@ def save_client_info():
         logging.exception(f"Error saving client info: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route("/logs", methods=["GET"])
+@bp.route("/logs", methods=["GET"])
 def get_logs():
     logs: List[Dict[str, Any]] = []
     for fname in os.listdir(LOGS_FOLDER):
@@ -1188,7 +1446,7 @@ def get_logs():
             path = os.path.join(LOGS_FOLDER, fname)
             with open(path, "r", encoding="utf-8") as f:
                 content = f.read()
-            flagged = "callback" in content.lower() or "google meet" in content.lower()
+            flagged = KEYWORD_MATCHER.matches(content, "flagged")
             logs.append({
                 "filename": fname,
                 "flagged": flagged,
@@ -1197,7 +1455,7 @@ def get_logs():
             })
     return jsonify({"logs": logs})
 
-@app.route("/analyze/emotions", methods=["POST"])
+@bp.route("/analyze/emotions", methods=["POST"])
 def analyze_text_emotions():
     """
     Analyze emotions in the provided text.
@@ -1227,7 +1485,34 @@ def analyze_text_emotions():
         logging.error(f"Error in emotion analysis endpoint: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route("/logs/clear", methods=["POST"])
+@bp.route("/analyze/emotions/batch", methods=["POST"])
+def analyze_text_emotions_batch():
+    """
+    Analyze emotions in many texts with one model call.
+    
+    Expected JSON body:
+    {
+        "texts": ["First text", "Second text"]
+    }
+    """
+    data = request.get_json(silent=True)
+    texts = data.get("texts") if isinstance(data, dict) else None
+    if not isinstance(texts, list) or not texts or not all(isinstance(text, str) for text in texts):
+        return jsonify({"error": "'texts' must be a non-empty list of strings"}), 400
+    if len(texts) > EMOTION_MAX_BATCH_TEXTS:
+        return jsonify({"error": f"At most {EMOTION_MAX_BATCH_TEXTS} texts per request"}), 400
+
+    try:
+        results = analyze_emotions_batch(texts)
+    except Exception as e:
+        logging.error(f"Error in batch emotion analysis endpoint: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        "results": [{"text": text, "emotions": emotions} for text, emotions in zip(texts, results)]
+    })
+
+@bp.route("/logs/clear", methods=["POST"])
 def clear_logs():
     removed: List[str] = []
     for fname in os.listdir(LOGS_FOLDER):
@@ -1236,13 +1521,16 @@ def clear_logs():
             with open(path, "r", encoding="utf-8") as f:
                 content = f.read()
             # Don't delete if flagged for callback or meeting
-            if "callback" in content.lower() or "google meet" in content.lower():
+            if KEYWORD_MATCHER.matches(content, "flagged"):
                 continue
             os.remove(path)
+            conversation_writer.forget(fname)
+            conversation_index.remove(fname)
+            extraction_states.forget(fname)
             removed.append(fname)
     return jsonify({"removed": removed, "status": "success"})
 
-@app.route("/logs/<filename>", methods=["GET"])
+@bp.route("/logs/<filename>", methods=["GET"])
 def get_log_content(filename: str) -> Response:
     """Serve the content of a specific log file."""
     # Basic security: ensure filename is just a filename and doesn't try to traverse directories
@@ -1262,9 +1550,7 @@ def get_log_content(filename: str) -> Response:
         logging.error(f"Error reading log file {filename}: {e_log_read}")
         return make_response(jsonify({"error": "Could not read log file."}), 500)
 
-leads: List[Dict[str, Any]] = load_leads_from_file()  # Load leads at startup
-
-@app.route("/leads", methods=["GET", "POST"])
+@bp.route("/leads", methods=["GET", "POST"])
 def get_leads() -> Response:
     """Fetch all leads or filter by source_log_file. Also handles POST for compatibility."""
     # Handle POST requests (might be sent by some frontend automation)
@@ -1278,6 +1564,7 @@ def get_leads() -> Response:
             post_data = request.get_json()
             logging.info(f"POST data received: {post_data}")
     
+    leads = load_leads_from_file()
     source_log_file = request.args.get('source_log_file')
     if source_log_file:
         # Ensure the filename is safe, similar to get_log_content
@@ -1291,19 +1578,19 @@ def get_leads() -> Response:
     
     return jsonify({"leads": leads})
 
-@app.route("/leads-minimal", methods=["GET"])
+@bp.route("/leads-minimal", methods=["GET"])
 def get_leads_minimal_api():
     """Return minimal leads data for frontend display"""
     leads = load_leads_minimal()
     return jsonify({"leads": leads})
 
-@app.route("/conversation-history/<int:lead_id>", methods=["GET"])
+@bp.route("/conversation-history/<int:lead_id>", methods=["GET"])
 def get_conversation_history_api(lead_id: int):
     """Get conversation history for a specific lead - optimized for Gemini API"""
     history = get_conversation_history(lead_id=lead_id)
     return jsonify({"conversation_history": history})
 
-@app.route("/lead-context", methods=["POST"])
+@bp.route("/lead-context", methods=["POST"])
 def get_lead_context_api():
     """
     Get lead context by phone/email - for Gemini to quickly lookup previous conversations
@@ -1317,23 +1604,25 @@ def get_lead_context_api():
         return jsonify({"error": "Phone or email required"}), 400
     
     # Get lead data
-    leads = load_leads_minimal()
-    
-    # For demo purposes, also check test data
-    try:
-        test_leads_path = os.path.join(CLIENT_DATA_FOLDER, "leads_minimal_test.json")
-        if os.path.exists(test_leads_path):
-            with open(test_leads_path, 'r', encoding='utf-8') as f:
-                test_leads = json.load(f)
-                leads.extend(test_leads)
-    except Exception:
-        pass
-    
     lead = None
     if phone:
-        lead = next((l for l in leads if l.get("phone") == phone), None)
+        lead = lead_registry.find_by_phone(phone)
     if not lead and email:
-        lead = next((l for l in leads if l.get("email") == email), None)
+        lead = lead_registry.find_by_email(email)
+    
+    # For demo purposes, also check test data
+    if not lead:
+        try:
+            test_leads_path = os.path.join(CLIENT_DATA_FOLDER, "leads_minimal_test.json")
+            if os.path.exists(test_leads_path):
+                with open(test_leads_path, 'r', encoding='utf-8') as f:
+                    test_leads = json.load(f)
+                if phone:
+                    lead = next((l for l in test_leads if l.get("phone") == phone), None)
+                if not lead and email:
+                    lead = next((l for l in test_leads if l.get("email") == email), None)
+        except Exception:
+            pass
     
     if not lead:
         return jsonify({"lead_found": False, "message": "No previous conversation found"})
@@ -1371,7 +1660,7 @@ def get_lead_context_api():
     
     return jsonify(context)
 
-@app.route("/link-conversation", methods=["POST"])
+@bp.route("/link-conversation", methods=["POST"])
 def link_conversation_api():
     """
     Link a conversation file to a lead - to be called when new conversations are created
@@ -1388,7 +1677,7 @@ def link_conversation_api():
     link_conversation_to_lead(conversation_file, phone, email, name)
     return jsonify({"success": True, "message": "Conversation linked to lead"})
 
-@app.route("/saba/book-meeting", methods=["POST"])
+@bp.route("/saba/book-meeting", methods=["POST"])
 def saba_book_meeting():
     data = request.json
     if not data:
@@ -1428,7 +1717,7 @@ def saba_book_meeting():
     except Exception as general_error:
         return jsonify({"error": f"Unexpected error: {general_error}"}), 500
 
-@app.route("/saba/book-meeting-oauth", methods=["POST"])
+@bp.route("/saba/book-meeting-oauth", methods=["POST"])
 def saba_book_meeting_oauth():
     data = request.json
     if not data:
@@ -1456,10 +1745,12 @@ def saba_book_meeting_oauth():
     except Exception as e:
         return jsonify({"error": f"Unexpected error: {e}"}), 500
 
-@app.route('/authorize')
+@bp.route('/authorize')
 def authorize():
     # Construct the redirect_uri using the current request's root URL
-    redirect_uri_val = f"{request.url_root.rstrip('/')}" + url_for('oauth2callback')
+    from google_auth_oauthlib.flow import Flow
+
+    redirect_uri_val = f"{request.url_root.rstrip('/')}" + url_for('.oauth2callback')
     flow = Flow.from_client_secrets_file(
         CLIENT_SECRETS_FILE,
         scopes=SCOPES,
@@ -1473,10 +1764,12 @@ def authorize():
     session['state'] = state
     return redirect(authorization_url)
 
-@app.route('/oauth2callback')
+@bp.route('/oauth2callback')
 def oauth2callback():
+    from google_auth_oauthlib.flow import Flow
+
     state = session.get('state')
-    redirect_uri_val = f"{request.url_root.rstrip('/')}" + url_for('oauth2callback')
+    redirect_uri_val = f"{request.url_root.rstrip('/')}" + url_for('.oauth2callback')
     flow = Flow.from_client_secrets_file(
         CLIENT_SECRETS_FILE,
         scopes=SCOPES,
@@ -1488,9 +1781,11 @@ def oauth2callback():
     # Save the credentials for future use
     with open('token.pickle', 'wb') as token:
         pickle.dump(credentials, token)
-    return redirect(url_for('leads_management'))
+    return redirect(url_for('.leads_management'))
 
 def create_meet_event_oauth(summary: str, start_time: str, end_time: str, attendees: List[str]) -> Dict[str, Any]:
+    from googleapiclient.discovery import build
+
     with open('token.pickle', 'rb') as token:
         credentials = pickle.load(token)
     service = build('calendar', 'v3', credentials=credentials)
@@ -1513,9 +1808,13 @@ def create_meet_event_oauth(summary: str, start_time: str, end_time: str, attend
     ).execute()
     return created_event
 
-@app.route("/leads/reports/generate", methods=["POST"])
+@bp.route("/leads/reports/generate", methods=["POST"])
 def generate_daily_lead_report() -> Response:
     try:
+        from openpyxl import Workbook
+        from openpyxl.styles import Font
+        from openpyxl.worksheet.worksheet import Worksheet
+
         leads_data: List[Dict[str, Any]] = load_leads_from_file()
         if not leads_data:
             return make_response(jsonify({"message": "No leads data available to generate a report."}), 200)
@@ -1615,7 +1914,7 @@ def generate_daily_lead_report() -> Response:
         logging.exception("Error generating daily lead report")
         return make_response(jsonify({"error": f"Failed to generate report: {str(e_report)}"}), 500)
 
-@app.route("/leads/reports", methods=["GET"])
+@bp.route("/leads/reports", methods=["GET"])
 def list_lead_reports() -> Response:
     try:
         if not os.path.exists(DAILY_REPORTS_FOLDER):
@@ -1645,7 +1944,7 @@ def list_lead_reports() -> Response:
         logging.exception("Error listing lead reports")
         return make_response(jsonify({"error": f"Failed to list reports: {str(e_list_reports)}"}), 500)
 
-@app.route("/leads/reports/download/<path:filename>", methods=["GET"])
+@bp.route("/leads/reports/download/<path:filename>", methods=["GET"])
 def download_lead_report(filename: str) -> Response:
     try:
         # Security: Ensure filename is not attempting to traverse directories
@@ -1668,7 +1967,7 @@ def download_lead_report(filename: str) -> Response:
         logging.exception(f"Error downloading report file {filename}")
         return make_response(jsonify({"error": f"Failed to download report: {str(e_download)}"}), 500)
 
-@app.route("/")
+@bp.route("/")
 def home():
     return "✅ IMJD Gemini API is running."
 
@@ -1684,22 +1983,23 @@ def generate_chat_summary(conversation_history: List[Dict[str, Any]]) -> str:
             break
     return " | ".join(summary_parts)
 
-def link_conversation_to_lead(conversation_file: str, phone: Optional[str] = None, email: Optional[str] = None, name: Optional[str] = None):
+def link_conversation_to_lead(conversation_file: str, phone: Optional[str] = None, email: Optional[str] = None, name: Optional[str] = None, new_user_messages: Optional[int] = None):
     """
     Link a conversation file to a lead in leads_minimal.json
     This function should be called whenever a new conversation is created
+
+    When the caller knows how many user messages it just appended it passes
+    new_user_messages, which avoids re-reading the whole conversation file.
     """
     if not phone and not email:
         return  # Need at least one identifier
     
-    leads = load_leads_minimal()
-    
     # Find existing lead by phone or email
     lead = None
     if phone:
-        lead = next((l for l in leads if l.get("phone") == phone), None)
+        lead = lead_registry.find_by_phone(phone)
     if not lead and email:
-        lead = next((l for l in leads if l.get("email") == email), None)
+        lead = lead_registry.find_by_email(email)
     
     if lead:
         # Update existing lead
@@ -1710,32 +2010,34 @@ def link_conversation_to_lead(conversation_file: str, phone: Optional[str] = Non
         lead["last_interaction"] = datetime.now().isoformat()
         
         # Update message count (count lines starting with 'user:' in the conversation file)
-        try:
-            conversation_path = os.path.join(CLIENT_DATA_FOLDER, conversation_file)
-            if os.path.exists(conversation_path):
-                with open(conversation_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                user_messages = len([line for line in content.split('\n') if line.startswith('user:')])
-                lead["total_messages"] = lead.get("total_messages", 0) + user_messages
-        except Exception:
-            pass
+        if new_user_messages is not None:
+            lead["total_messages"] = lead.get("total_messages", 0) + new_user_messages
+        else:
+            try:
+                conversation_path = os.path.join(CLIENT_DATA_FOLDER, conversation_file)
+                if os.path.exists(conversation_path):
+                    with open(conversation_path, 'r', encoding='utf-8') as f:
+                        content = f.read()
+                    user_messages = len([line for line in content.split('\n') if line.startswith('user:')])
+                    lead["total_messages"] = lead.get("total_messages", 0) + user_messages
+            except Exception:
+                pass
+        lead_registry.save_lead(lead)
     else:
         # Create new lead entry
-        new_id = max([l.get("id", 0) for l in leads] + [0]) + 1
-        
         # Count messages in conversation file
-        total_messages = 0
-        try:
-            conversation_path = os.path.join(CLIENT_DATA_FOLDER, conversation_file)
-            if os.path.exists(conversation_path):
-                with open(conversation_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                total_messages = len([line for line in content.split('\n') if line.startswith('user:')])
-        except Exception:
-            pass
-        
-        leads.append({
-            "id": new_id,
+        total_messages = new_user_messages or 0
+        if new_user_messages is None:
+            try:
+                conversation_path = os.path.join(CLIENT_DATA_FOLDER, conversation_file)
+                if os.path.exists(conversation_path):
+                    with open(conversation_path, 'r', encoding='utf-8') as f:
+                        content = f.read()
+                    total_messages = len([line for line in content.split('\n') if line.startswith('user:')])
+            except Exception:
+                pass
+        
+        lead_registry.add_lead({
             "name": name or "",
             "phone": phone or "",
             "email": email or "",
@@ -1748,101 +2050,75 @@ def link_conversation_to_lead(conversation_file: str, phone: Optional[str] = Non
             "last_interaction": datetime.now().isoformat(),
             "total_messages": total_messages
         })
-    
-    save_leads_minimal(leads)
 
 # Client data file paths
 LEAD_NOTES_FILE = os.path.join(EXCEL_FOLDER, "lead_notes.json")
-LEADS_MINIMAL_FILE = os.path.join(EXCEL_FOLDER, "leads_minimal.json")
 
 def load_lead_notes() -> Dict[str, str]:
     """Load sales team notes from lead_notes.json (read-only for Gemini)"""
     try:
-        if os.path.exists(LEAD_NOTES_FILE):
-            with open(LEAD_NOTES_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return {}
+        return lead_store.load_notes()
     except Exception as e:
         logging.error(f"Error loading lead notes: {e}")
         return {}
 
-def load_leads_minimal() -> List[Dict[str, Any]]:
-    """Load main leads data from leads_minimal.json (Gemini can read/write)"""
+def load_client_notes(client_id: str) -> str:
+    """Sales notes for one client, from memory while they are unchanged (see context_cache.py)"""
     try:
-        if os.path.exists(LEADS_MINIMAL_FILE):
-            with open(LEADS_MINIMAL_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return []
+        return notes_cache.get(client_id)
     except Exception as e:
-        logging.error(f"Error loading leads minimal: {e}")
-        return []
+        logging.error(f"Error loading lead notes: {e}")
+        return ""
+
+def load_leads_minimal() -> List[Dict[str, Any]]:
+    """Load main leads data from leads_minimal.json (Gemini can read/write)
+
+    Returns a copy of the registry's leads; the file is only parsed again
+    when it changed on disk.
+    """
+    return lead_registry.load()
 
 def save_leads_minimal(leads_data: List[Dict[str, Any]]) -> bool:
-    """Save leads data to leads_minimal.json"""
-    try:
-        with open(LEADS_MINIMAL_FILE, "w", encoding="utf-8") as f:
-            json.dump(leads_data, f, indent=2)
+    """Save leads data to leads_minimal.json and refresh the lookup indexes"""
+    if lead_registry.save(leads_data):
         logging.info(f"✅ Leads minimal data saved to {LEADS_MINIMAL_FILE}")
         return True
-    except Exception as e:
-        logging.error(f"❌ Error saving leads minimal: {e}")
-        return False
+    return False
 
 def find_client_by_contact(phone: str = None, email: str = None, client_id: str = None) -> Optional[Dict[str, Any]]:
     """Find client in leads_minimal.json by phone, email, or conversation file"""
-    leads = load_leads_minimal()
-    
-    for lead in leads:
-        # Check phone match (normalize phone numbers)
-        if phone and lead.get("phone"):
-            # Remove non-digits for comparison
-            lead_phone = re.sub(r'[^\d]', '', lead["phone"])
-            input_phone = re.sub(r'[^\d]', '', phone)
-            if lead_phone == input_phone or lead_phone.endswith(input_phone[-10:]):
-                return lead
-        
-        # Check email match
-        if email and lead.get("email") and lead["email"].lower() == email.lower():
-            return lead
+    lead = lead_registry.find_by_contact(phone, email)
+    if lead:
+        return lead
     
     # NEW: Check conversation files if client_id provided and no match found
     if client_id:
         # First try exact conversation file name match
-        for lead in leads:
-            conversation_files = lead.get("conversation_files", [])
-            for conv_file in conversation_files:
-                if client_id in conv_file:
-                    logging.info(f"✅ Found client by conversation file: {conv_file}")
-                    return lead
-        
-        # If still no match, check if conversation file exists in filesystem
-        # Extract normalized client ID for filesystem search
-        normalized_client_id = client_id.replace("@", "_")
+        lead = lead_registry.find_by_conversation_client(client_id)
+        if lead:
+            logging.info(f"✅ Found client by conversation file for: {client_id}")
+            return lead
         
+        # If still no match, check the client's conversation files on disk
         if os.path.exists(CLIENT_DATA_FOLDER):
-            for filename in os.listdir(CLIENT_DATA_FOLDER):
-                if filename.startswith("conversation_") and normalized_client_id in filename:
+            for filename in conversation_index.files_for(client_id):
+                if os.path.exists(os.path.join(CLIENT_DATA_FOLDER, filename)):
                     logging.info(f"📁 Found orphaned conversation file: {filename}")
                     # Check if we can extract client info from the conversation file
                     try:
-                        with open(os.path.join(CLIENT_DATA_FOLDER, filename), 'r', encoding='utf-8') as f:
-                            conversation_content = f.read()
-                        
-                        # Extract email from conversation file
-                        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-                        emails = re.findall(email_pattern, conversation_content)
-                        client_emails = [email for email in emails if email.lower() != "khanjawadkhalid@gmail.com"]
+                        # Emails in the conversation file (official email filtered out)
+                        client_emails = extraction_states.get(filename).client_emails
                         
                         if client_emails:
                             # Look for existing client with this email
-                            for lead in leads:
-                                if lead.get("email", "").lower() == client_emails[0].lower():
-                                    logging.info(f"🔗 Linked orphaned conversation to existing client via email: {client_emails[0]}")
-                                    # Add the conversation file to this client's files
-                                    if filename not in lead.get("conversation_files", []):
-                                        lead.setdefault("conversation_files", []).append(filename)
-                                        save_leads_minimal(leads)
-                                    return lead
+                            lead = lead_registry.find_by_email(client_emails[0])
+                            if lead:
+                                logging.info(f"🔗 Linked orphaned conversation to existing client via email: {client_emails[0]}")
+                                # Add the conversation file to this client's files
+                                if filename not in lead.get("conversation_files", []):
+                                    lead.setdefault("conversation_files", []).append(filename)
+                                    lead_registry.save_lead(lead)
+                                return lead
                     except Exception as e:
                         logging.error(f"❌ Error reading conversation file {filename}: {e}")
     
@@ -1859,8 +2135,7 @@ def get_client_context(client_id: str, phone: str = None, email: str = None) ->
     }
     
     # 1. Get sales team notes (read-only)
-    lead_notes = load_lead_notes()
-    context["sales_notes"] = lead_notes.get(client_id, "")
+    context["sales_notes"] = load_client_notes(client_id)
     
     # 2. Find client in leads_minimal by phone/email or client_id
     client_data = None
@@ -1869,11 +2144,7 @@ def get_client_context(client_id: str, phone: str = None, email: str = None) ->
     
     if not client_data:
         # Try to find by ID
-        leads = load_leads_minimal()
-        for lead in leads:
-            if str(lead.get("id")) == str(client_id):
-                client_data = lead
-                break
+        client_data = lead_registry.find_by_id(client_id)
     
     if client_data:
         context["client_data"] = client_data
@@ -1891,24 +2162,16 @@ def get_client_context(client_id: str, phone: str = None, email: str = None) ->
 def update_client_data(client_id: str, updates: Dict[str, Any], phone: str = None, email: str = None) -> bool:
     """Update or create client data in leads_minimal.json"""
     try:
-        leads = load_leads_minimal()
-        
-        # Find existing client using enhanced lookup
+        # Find existing client using enhanced lookup (returns the live lead entry)
         client_data = find_client_by_contact(phone, email, client_id)
-        client_index = -1
+        is_new = client_data is None
         
         if client_data:
-            # Find the index of the existing client
-            for i, lead in enumerate(leads):
-                if lead.get("id") == client_data.get("id"):
-                    client_index = i
-                    break
             logging.info(f"✅ Found existing client: {client_data.get('name', 'Unknown')} (ID: {client_data.get('id')})")
         else:
             # Create new client if not found
-            max_id = max([lead.get("id", 0) for lead in leads] + [0])
             client_data = {
-                "id": max_id + 1,
+                "id": None,
                 "name": "",
                 "phone": phone or "",
                 "email": email or "",
@@ -1921,9 +2184,6 @@ def update_client_data(client_id: str, updates: Dict[str, Any], phone: str = Non
                 "last_interaction": "",
                 "total_messages": 0
             }
-            leads.append(client_data)
-            client_index = len(leads) - 1
-            logging.info(f"🆕 Created new client: ID {client_data['id']}")
         
         # Update client data
         for key, value in updates.items():
@@ -1933,117 +2193,24 @@ def update_client_data(client_id: str, updates: Dict[str, Any], phone: str = Non
         # Update last interaction timestamp
         client_data["last_interaction"] = datetime.now().isoformat()
         
-        # Update in the list
-        leads[client_index] = client_data
-        
-        # Save back to file
-        return save_leads_minimal(leads)
+        # Save just this record back to the store
+        if is_new:
+            saved = lead_registry.add_lead(client_data)
+            logging.info(f"🆕 Created new client: ID {client_data['id']}")
+            return saved
+        return lead_registry.save_lead(client_data)
         
     except Exception as e:
         logging.error(f"❌ Error updating client data: {e}")
         return False
 
 def extract_client_info_from_conversation(conversation: str, reply: str) -> Dict[str, Any]:
-    """Extract client information from conversation using AI analysis"""
-    extracted_info = {}
-    
-    # Extract name - prioritize explicit name mentions
-    # High priority patterns - explicit name introductions
-    priority_name_patterns = [
-        r"(?:my name is|i'm|i am|this is|call me)\s+([a-zA-Z]+)",  # Only capture first word to avoid newlines
-        r"user:\s+My name is\s+([A-Z][a-zA-Z]+)",  # Specific for Salman's case - only first word
-        r"(?:Hi|Hello|Hey),?\s+I'm\s+([A-Z][a-zA-Z]+)",  # Only first word
-        r"(?:I'm|This is)\s+([A-Z][a-zA-Z]+)",  # Only first word to avoid capturing too much
-    ]
-    
-    # Lower priority patterns - more general
-    general_name_patterns = [
-        r"(?:^|\n)([A-Z][a-zA-Z]+)\s+(?:here|speaking)",  # Names followed by "here" or "speaking"
-        r"user:\s+([A-Z][a-zA-Z]+)(?:\s|,|$)",  # Names at start of user messages - moved to lower priority
-    ]
-    
-    # Extended false positive filters
-    false_positives = [
-        'saba', 'ai', 'bot', 'hello', 'help', 'please', 'thank', 'yes', 'no', 
-        'ok', 'great', 'good', 'sure', 'model', 'user', 'my', 'name', 'is',
-        'relevant', 'product', 'information', 'catalog', 'social', 'media',
-        'marketing', 'manager', 'automation', 'business', 'service', 'agency'
-    ]
-    
-    # First try high priority patterns
-    for pattern in priority_name_patterns:
-        matches = re.findall(pattern, conversation, re.IGNORECASE | re.MULTILINE)
-        for match in matches:
-            if isinstance(match, tuple):
-                name = match[0].strip().title()
-            else:
-                name = match.strip().title()
-            
-            # Filter out false positives
-            if (len(name) > 1 and len(name) < 30 and 
-                not any(word in name.lower().split() for word in false_positives) and 
-                not name.isdigit() and
-                not name.lower() in ['the', 'and', 'or', 'but', 'with', 'from']):
-                extracted_info["name"] = name
-                break
-        if "name" in extracted_info:
-            break
-    
-    # If no name found with priority patterns, try general patterns
-    if "name" not in extracted_info:
-        for pattern in general_name_patterns:
-            matches = re.findall(pattern, conversation, re.IGNORECASE | re.MULTILINE)
-            for match in matches:
-                if isinstance(match, tuple):
-                    name = match[0].strip().title()
-                else:
-                    name = match.strip().title()
-                
-                # More strict filtering for general patterns
-                if (len(name) > 1 and len(name) < 30 and 
-                    not any(word in name.lower().split() for word in false_positives) and 
-                    not name.isdigit() and
-                    not name.lower() in ['the', 'and', 'or', 'but', 'with', 'from'] and
-                    name.isalpha()):  # Only alphabetic names for general patterns
-                    extracted_info["name"] = name
-                    break
-            if "name" in extracted_info:
-                break
-    
-    # Extract phone
-    phone_pattern = r'(\+?[\d\s\-\(\)]{10,15})'
-    phone_match = re.search(phone_pattern, conversation)
-    if phone_match:
-        extracted_info["phone"] = phone_match.group(1).strip()
-    
-    # Extract email - prioritize client emails over official email
-    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-    email_matches = re.findall(email_pattern, conversation)
-    if email_matches:
-        # Filter out the official email and get client emails
-        official_email = "khanjawadkhalid@gmail.com"
-        client_emails = [email for email in email_matches if email.lower() != official_email.lower()]
-        if client_emails:
-            extracted_info["email"] = client_emails[0].lower()  # Use first client email
-        elif email_matches:
-            extracted_info["email"] = email_matches[0].lower()  # Fallback to any email
-    
-    # Generate conversation summary
-    if len(conversation) > 50:
-        # Simple summary - you could enhance this with AI
-        summary_parts = []
-        if "service" in conversation.lower() or "product" in conversation.lower():
-            summary_parts.append("Interested in services")
-        if "price" in conversation.lower() or "cost" in conversation.lower():
-            summary_parts.append("Asked about pricing")
-        if "meeting" in conversation.lower() or "call" in conversation.lower():
-            summary_parts.append("Requested meeting")
-        
-        extracted_info["chat_summary"] = ", ".join(summary_parts) if summary_parts else "General inquiry"
-    
-    return extracted_info
+    """Extract client information from conversation text (see extraction_state.py)"""
+    extraction = ExtractionState()
+    extraction.observe(conversation)
+    return extraction.client_info()
 
-@app.route("/notes/<client_id>", methods=["POST"])
+@bp.route("/notes/<client_id>", methods=["POST"])
 @limiter.limit("1000 per hour")
 def add_client_notes(client_id: str):
     """Add or update sales team notes for a client (lead_notes.json)"""
@@ -2054,16 +2221,10 @@ def add_client_notes(client_id: str):
         if not notes:
             return jsonify({"error": "Notes content required"}), 400
         
-        # Load existing notes
-        lead_notes = load_lead_notes()
-        
-        # Update notes for this client
-        lead_notes[client_id] = notes
-        
-        # Save back to file
+        # Update notes for this client only
         try:
-            with open(LEAD_NOTES_FILE, "w", encoding="utf-8") as f:
-                json.dump(lead_notes, f, indent=2)
+            lead_store.save_notes({client_id: notes})
+            notes_cache.invalidate(client_id)
             
             logging.info(f"✅ Added notes for client {client_id}: {len(notes)} characters")
             return jsonify({
@@ -2080,12 +2241,11 @@ def add_client_notes(client_id: str):
         logging.error(f"❌ Error in add_client_notes: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
-@app.route("/notes/<client_id>", methods=["GET"])
+@bp.route("/notes/<client_id>", methods=["GET"])
 def get_client_notes(client_id: str):
     """Get sales team notes for a specific client"""
     try:
-        lead_notes = load_lead_notes()
-        notes = lead_notes.get(client_id, "")
+        notes = load_client_notes(client_id)
         
         return jsonify({
             "client_id": client_id,
@@ -2097,7 +2257,7 @@ def get_client_notes(client_id: str):
         logging.error(f"❌ Error getting notes: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
-@app.route("/leads/minimal", methods=["GET"])
+@bp.route("/leads/minimal", methods=["GET"])
 def get_leads_minimal_for_frontend():
     """Frontend-compatible endpoint for leads_minimal.json"""
     try:
@@ -2111,7 +2271,7 @@ def get_leads_minimal_for_frontend():
         logging.error(f"❌ Error getting leads for frontend: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
-@app.route("/notes/sync", methods=["POST"])
+@bp.route("/notes/sync", methods=["POST"])
 def sync_notes_from_frontend():
     """Sync notes from frontend to backend (lead_notes.json)"""
     try:
@@ -2121,20 +2281,18 @@ def sync_notes_from_frontend():
         if not frontend_notes:
             return jsonify({"message": "No notes to sync"})
         
-        # Load existing notes
-        lead_notes = load_lead_notes()
-        
-        # Update with frontend notes
-        updated_count = 0
+        # Collect the frontend notes to update
+        changed_notes: Dict[str, str] = {}
         for client_id, note_content in frontend_notes.items():
             if note_content.strip():  # Only update non-empty notes
-                lead_notes[str(client_id)] = note_content.strip()
-                updated_count += 1
+                changed_notes[str(client_id)] = note_content.strip()
+        updated_count = len(changed_notes)
         
-        # Save back to file
+        # Save just the changed entries
         try:
-            with open(LEAD_NOTES_FILE, "w", encoding="utf-8") as f:
-                json.dump(lead_notes, f, indent=2)
+            if changed_notes:
+                lead_store.save_notes(changed_notes)
+                notes_cache.invalidate(*changed_notes)
             
             logging.info(f"✅ Synced {updated_count} notes from frontend")
             return jsonify({
@@ -2154,35 +2312,24 @@ def find_existing_conversation_file(client_id: str) -> Optional[str]:
     """Find the most recent conversation file for a client"""
     try:
         # Check if client exists in leads_minimal and has conversation files
-        leads = load_leads_minimal()
-        for lead in leads:
-            # Extract phone from client_id for comparison
-            client_phone = extract_phone_from_chat_id(client_id)
-            lead_phone = lead.get("phone", "")
-            
-            # Compare by phone number or direct ID match
-            if (client_phone and lead_phone and 
-                client_phone.replace("+", "").replace(" ", "") in lead_phone.replace("+", "").replace(" ", "")):
-                conversation_files = lead.get("conversation_files", [])
-                if conversation_files:
-                    # Return the most recent file (last in list)
-                    return conversation_files[-1]
-            
-            # Also check if any conversation file matches the client_id pattern
-            conversation_files = lead.get("conversation_files", [])
-            for conv_file in conversation_files:
-                if client_id in conv_file:
-                    return conv_file
-        
-        # If not found in database, check filesystem for existing files from today
+        # Extract phone from client_id for comparison
+        client_phone = extract_phone_from_chat_id(client_id)
+        lead = lead_registry.find_by_phone(client_phone)
+        if lead and lead.get("conversation_files"):
+            # Return the most recent file (last in list)
+            return lead["conversation_files"][-1]
+        
+        # Also check if any conversation file matches the client_id pattern
+        lead = lead_registry.find_by_conversation_client(client_id)
+        if lead:
+            matching = [f for f in lead.get("conversation_files", []) if conversation_key(f) == client_id]
+            if matching:
+                return matching[-1]
+        
+        # If not found in database, check the conversation index for files from today
         if os.path.exists(EXCEL_FOLDER):
             today = datetime.now().strftime('%Y-%m-%d')
-            matching_files = []
-            for filename in os.listdir(EXCEL_FOLDER):
-                if (filename.startswith(f"conversation_{client_id}_") and 
-                    filename.endswith(".txt") and 
-                    today in filename):
-                    matching_files.append(filename)
+            matching_files = [f for f in conversation_index.files_for(client_id) if today in f]
             
             # Return the most recent file from today if any found
             if matching_files:
@@ -2202,7 +2349,6 @@ def get_or_create_client_and_conversation(phone: str = None, email: str = None,
     - If found, returns existing client and latest conversation file
     - If not found, creates new client, assigns new ID, and starts new conversation file
     """
-    leads = load_leads_minimal()
     client = find_client_by_contact(phone, email, client_id)
     created = False
     if client:
@@ -2223,24 +2369,16 @@ def get_or_create_client_and_conversation(phone: str = None, email: str = None,
                 f.write(f"# Client ID: {client['id']}\n")
                 f.write(f"# Phone: {client.get('phone', 'N/A')}\n")
                 f.write(f"# Email: {client.get('email', 'N/A')}\n\n")
+            conversation_index.register(conversation_file)
             
-            save_leads_minimal(leads)
+            lead_registry.save_lead(client)
     else:
-        # Create new client
-        new_id = max([l.get("id", 0) for l in leads] + [0]) + 1
+        # Create new client (the store assigns the new ID)
         timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
         conversation_file = f"conversation_{phone or client_id or 'unknown'}_{timestamp}.txt"
         
-        # Create the actual file on disk
-        file_path = f"client_data/{conversation_file}"
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(f"# Conversation started: {datetime.now().isoformat()}\n")
-            f.write(f"# Client ID: {new_id}\n")
-            f.write(f"# Phone: {phone or 'N/A'}\n")
-            f.write(f"# Email: {email or 'N/A'}\n\n")
-        
         client = {
-            "id": new_id,
+            "id": None,
             "name": name or "",
             "phone": phone or "",
             "email": email or "",
@@ -2253,8 +2391,16 @@ def get_or_create_client_and_conversation(phone: str = None, email: str = None,
             "last_interaction": datetime.now().isoformat(),
             "total_messages": 0
         }
-        leads.append(client)
-        save_leads_minimal(leads)
+        lead_registry.add_lead(client)
+        
+        # Create the actual file on disk
+        file_path = f"client_data/{conversation_file}"
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(f"# Conversation started: {datetime.now().isoformat()}\n")
+            f.write(f"# Client ID: {client['id']}\n")
+            f.write(f"# Phone: {phone or 'N/A'}\n")
+            f.write(f"# Email: {email or 'N/A'}\n\n")
+        conversation_index.register(conversation_file)
         created = True
     return {"client": client, "conversation_file": conversation_file, "created": created}
 
@@ -2268,7 +2414,7 @@ def saba_greeting_with_client_id(client: dict) -> str:
 
 
 # 🎯 CLIENT DEDUPLICATION API ENDPOINTS
-@app.route('/api/get_or_create_client', methods=['POST'])
+@bp.route('/api/get_or_create_client', methods=['POST'])
 @limiter.limit("1000 per hour")
 def api_get_or_create_client():
     """
@@ -2289,7 +2435,7 @@ def api_get_or_create_client():
         logging.error(f"Error in get_or_create_client API: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/saba_greeting', methods=['POST'])
+@bp.route('/api/saba_greeting', methods=['POST'])
 @limiter.limit("1000 per hour")
 def api_saba_greeting():
     """
@@ -2310,6 +2456,71 @@ def api_saba_greeting():
         logging.error(f"Error in saba_greeting API: {e}")
         return jsonify({"error": str(e)}), 500
 
+@bp.route("/ready", methods=["GET"])
+def readiness_probe():
+    """Readiness probe: 200 once the Gemini key and model were validated, else 503"""
+    status = readiness.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+def init_storage() -> None:
+    """Create the data folders and the default system instruction"""
+    os.makedirs(EXCEL_FOLDER, exist_ok=True)
+    os.makedirs(DAILY_REPORTS_FOLDER, exist_ok=True)
+    if not os.path.exists(INSTRUCTION_FILE):
+        save_instruction(DEFAULT_SYSTEM_INSTRUCTION)
+        save_history([])
+
+def start_background_work() -> None:
+    """
+    Start this process's bookkeeping workers and readiness check. Safe to
+    call repeatedly; after a fork (gunicorn --preload) the worker starts
+    its own threads on its first request.
+    """
+    bookkeeping_queue.start()
+    readiness.start()
+
+def create_app() -> Flask:
+    """Application factory: a configured Flask app serving every route of this module"""
+    init_storage()
+
+    app = Flask(__name__)
+    CORS(app, supports_credentials=True)
+
+    # Session configuration (for cookie-based clients)
+    app.config["SECRET_KEY"] = os.urandom(24)
+    app.config["SESSION_TYPE"] = os.getenv("SESSION_TYPE", "redis")
+    app.config["SESSION_REDIS"] = redis_client
+    app.config["SESSION_PERMANENT"] = False
+    app.config["SESSION_USE_SIGNER"] = True
+    app.config["SESSION_COOKIE_SAMESITE"] = os.getenv("SESSION_COOKIE_SAMESITE", "None")
+    app.config["SESSION_COOKIE_SECURE"] = os.getenv("SESSION_COOKIE_SECURE", "True") == "True"
+    app.config["PERMANENT_SESSION_LIFETIME"] = int(os.getenv("SESSION_LIFETIME", 86400))  # 24 hours
+
+    Session(app)  # type: ignore
+    limiter.init_app(app)
+    app.register_blueprint(bp)
+    app.before_request(start_background_work)
+    return app
+
+_app: Optional[Flask] = None
+_app_lock = threading.Lock()
+
+def get_app() -> Flask:
+    """The app of this process, created on first use"""
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = create_app()
+    return _app
+
+def __getattr__(name: str) -> Any:
+    # `app` is created on first access, so `gunicorn app:app` and
+    # `from app import app` work while a plain import stays cheap
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == '__main__':
     port = 5000
     if len(sys.argv) > 1:
@@ -2317,4 +2528,4 @@ if __name__ == '__main__':
             port = int(sys.argv[1])
         except ValueError:
             print("Invalid port number. Using default port 5000.")
-    app.run(debug=True, port=port)
\ No newline at end of file
+    get_app().run(debug=True, port=port)
\ No newline at end of file
@@ -0,0 +1,330 @@
+"""
+ASGI entry point for the chat server.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+    hypercorn asgi_app:app --bind 0.0.0.0:5000
+
+app.py (Flask, WSGI) ties up a worker for the whole Gemini round trip, so
+concurrency equals the number of workers. Here one event loop serves many
+chats at once:
+
+- POST /gemini/train and /gemini/train/stream are served natively, with the
+  same request and response contracts. The Gemini call is awaited on
+  AsyncGeminiClient; idempotent replay (redis.asyncio), waiting for the
+  client's earlier turns and message coalescing hold no thread. The blocking work around the
+  call (session and lead lookups, file writes, meeting scheduling), i.e.
+  prepare_train_turn() and finalize_train_turn() from app.py, runs on a
+  bounded thread pool.
+- Every other route (/leads*, /notes*, /lead-context, reports, OAuth, ...)
+  is the Flask app itself, run on the same pool through WsgiBridge.
+
+A chat waiting on Gemini holds no thread, so a single process keeps hundreds
+of chats in flight while only ASGI_IO_THREADS threads do blocking work.
+
+Configuration (environment):
+    ASGI_IO_THREADS  threads for blocking file/Redis/Calendar work (default 32)
+"""
+
+import os
+import sys
+import json
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import redis.asyncio as aioredis
+from limits import parse_many
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+import app as chat
+from app import ResponseParts
+from client_lock import AsyncClientTurnLock, ClientBusy, CLIENT_TURN_LOCK
+from coalescer import AsyncMessageCoalescer, COALESCE_WINDOW
+from gemini_client import GeminiRequestError, get_async_gemini_client, close_async_gemini_clients
+from idempotency import AsyncIdempotencyStore, IdempotencyConflict
+from wsgi_bridge import Receive, Scope, Send, WsgiBridge, read_body
+
+ASGI_IO_THREADS = int(os.getenv("ASGI_IO_THREADS", 32))
+
+# Blocking work (Flask routes, session/lead bookkeeping, Calendar) runs here
+io_pool = ThreadPoolExecutor(max_workers=ASGI_IO_THREADS, thread_name_prefix="asgi-io")
+
+async_redis = aioredis.Redis(host=chat.redis_host, port=chat.redis_port, db=chat.redis_db)
+# Same Redis keys as the Flask workers, so both servers share replayed results and client turn queues
+idempotency_store = AsyncIdempotencyStore(async_redis)
+client_turns: Optional[AsyncClientTurnLock] = AsyncClientTurnLock(async_redis) if CLIENT_TURN_LOCK else None
+message_coalescer: Optional[AsyncMessageCoalescer] = AsyncMessageCoalescer() if COALESCE_WINDOW > 0 else None
+
+# The limits of the Flask /gemini/train routes, counted in the same Redis under flask-limiter's
+# keys (see within_rate_limit), so a client's requests to either server share one budget
+TRAIN_RATE_LIMITS = parse_many("200000 per day;10000 per hour")
+rate_limiter = FixedWindowRateLimiter(storage_from_string(chat.redis_url))
+
+
+def flask_app(environ, start_response):
+    """The Flask app of app.py, created on first use"""
+    return chat.get_app()(environ, start_response)
+
+
+flask_bridge = WsgiBridge(flask_app, io_pool)
+
+
+async def run_io(func, *args):
+    """Run a blocking call on the bounded I/O pool"""
+    return await asyncio.get_running_loop().run_in_executor(io_pool, func, *args)
+
+
+def header(scope: Scope, name: str) -> Optional[str]:
+    """First value of request header `name` (lower case)"""
+    raw_name = name.encode("latin-1")
+    for key, value in scope.get("headers", []):
+        if key == raw_name:
+            return value.decode("latin-1")
+    return None
+
+
+def parse_json(scope: Scope, body: bytes) -> Optional[Any]:
+    """The JSON request body, or None (like Flask's get_json(silent=True))"""
+    content_type = (header(scope, "content-type") or "").split(";")[0].strip().lower()
+    if content_type != "application/json" and not content_type.endswith("+json"):
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def response_headers(scope: Scope, content_type: str, headers: Dict[str, str]) -> List[Any]:
+    """ASGI response headers, with the CORS headers flask-cors adds (supports_credentials)"""
+    all_headers = {"Content-Type": content_type, **headers}
+    origin = header(scope, "origin")
+    if origin:
+        all_headers.update({"Access-Control-Allow-Origin": origin,
+                            "Access-Control-Allow-Credentials": "true",
+                            "Vary": "Origin"})
+    return [(name.lower().encode("latin-1"), str(value).encode("latin-1")) for name, value in all_headers.items()]
+
+
+async def send_json(scope: Scope, send: Send, body: Dict[str, Any], status: int,
+                    headers: Optional[Dict[str, str]] = None) -> None:
+    await send({"type": "http.response.start", "status": status,
+                "headers": response_headers(scope, "application/json", headers or {})})
+    await send({"type": "http.response.body", "body": json.dumps(body).encode("utf-8")})
+
+
+def within_rate_limit(endpoint: str, remote_addr: str) -> bool:
+    """
+    Count the request against TRAIN_RATE_LIMITS. flask-limiter (fixed window, no
+    key prefix) hits each limit with its key_func value and the endpoint name,
+    e.g. LIMITER/10.0.0.7/chat.gemini_train/10000/1/hour, and so does this.
+    """
+    return all(rate_limiter.hit(limit, remote_addr, endpoint) for limit in TRAIN_RATE_LIMITS)
+
+
+def client_turn(data: Any):
+    """app.client_turn for the event loop: waits for the client's earlier turns without a thread"""
+    key = chat.turn_key(data) if client_turns is not None else None
+    return client_turns.hold(key) if key else nullcontext()
+
+
+async def run_train_turn(data: Optional[Dict[str, Any]], deadline: float) -> ResponseParts:
+    """app.run_train_turn with the Gemini call awaited instead of blocking a thread"""
+    try:
+        async with client_turn(data):
+            turn = await run_io(chat.prepare_train_turn, data)
+            answer = await run_io(chat.answer_without_gemini, turn)
+            if answer is not None:
+                return answer
+
+            client = get_async_gemini_client(chat.GEMINI_API_KEY)
+            response = await client.generate_content(chat.GEMINI_MODEL, turn["payload"], deadline=deadline)
+            return await run_io(chat.complete_train_turn, turn, response)
+
+    except ClientBusy as e:
+        logging.warning(f"⏳ {e}")
+        return chat.CLIENT_BUSY
+    except GeminiRequestError as e:
+        return chat.gemini_unreachable_error(e)
+    except Exception as e:
+        logging.exception(f"🔥 Unhandled exception in /gemini/train: {e}")
+        return {"error": "Internal server error. Please try again."}, 500, {}
+
+
+async def train_response_parts(data: Optional[Dict[str, Any]], deadline: float) -> ResponseParts:
+    """app.train_response_parts for the event loop"""
+    client_key = chat.coalesce_key(data) if message_coalescer is not None else None
+    if client_key is not None:
+        try:
+            parts, position, size = await message_coalescer.submit(
+                client_key, data, lambda batch: run_train_turn(chat.merge_train_requests(batch), deadline))
+        except Exception as e:
+            logging.exception(f"🔥 Unhandled exception in coalesced /gemini/train: {e}")
+            return {"error": "Internal server error. Please try again."}, 500, {}
+        return chat.coalesced_parts(client_key, parts, position, size)
+
+    return await run_train_turn(data, deadline)
+
+
+async def gemini_train(scope: Scope, receive: Receive, send: Send) -> None:
+    """POST /gemini/train (see app.gemini_train)"""
+    # The deadline starts when the request arrives
+    deadline = chat.request_deadline(header(scope, "x-request-timeout"))
+    data = parse_json(scope, await read_body(receive))
+
+    key = chat.idempotency_key(data, header(scope, "idempotency-key"))
+    if key:
+        try:
+            (body, status, headers), replayed = await idempotency_store.run(
+                key, lambda: train_response_parts(data, deadline))
+        except IdempotencyConflict:
+            return await send_json(scope, send, *chat.IDEMPOTENCY_CONFLICT)
+        if replayed:
+            logging.info(f"🔁 Replayed result for message {key}")
+            headers = {**headers, "Idempotent-Replayed": "true"}
+        return await send_json(scope, send, body, status, headers)
+
+    body, status, headers = await train_response_parts(data, deadline)
+    await send_json(scope, send, body, status, headers)
+
+
+async def sse_events(stream, turn: Dict[str, Any]) -> AsyncIterator[str]:
+    """The events of app.gemini_train_stream for an open AsyncGeminiStream"""
+    parts: List[str] = []
+    last_chunk: Dict[str, Any] = {}
+    try:
+        async for chunk in stream:
+            last_chunk = chunk
+            candidates = chunk.get("candidates") or [{}]
+            for part in candidates[0].get("content", {}).get("parts", []):
+                if part.get("text"):
+                    parts.append(part["text"])
+                    yield chat.sse_event("chunk", {"text": part["text"]})
+    except GeminiRequestError as e:
+        logging.error(f"🔥 Gemini stream failed: {e}")
+        yield chat.sse_event("error", {"error": "Gemini API request failed.", "details": "Please try again later."})
+        return
+
+    streamed = "".join(parts)
+    if not streamed:
+        error_body, _ = chat.gemini_response_error(last_chunk) or ({"error": "Empty response from Gemini."}, 500)
+        yield chat.sse_event("error", error_body)
+        return
+
+    try:
+        reply = await run_io(chat.finalize_train_turn, turn, streamed)
+    except Exception as e:
+        logging.exception(f"🔥 Error finalizing streamed reply: {e}")
+        yield chat.sse_event("error", {"error": "Internal server error. Please try again."})
+        return
+    if len(reply) > len(streamed) and reply.startswith(streamed):
+        yield chat.sse_event("chunk", {"text": reply[len(streamed):]})
+    yield chat.sse_event("done", {"reply": reply})
+
+
+async def gemini_train_stream(scope: Scope, receive: Receive, send: Send) -> None:
+    """POST /gemini/train/stream (see app.gemini_train_stream)"""
+    deadline = chat.request_deadline(header(scope, "x-request-timeout"))
+    data = parse_json(scope, await read_body(receive))
+    try:
+        # Held until the streamed reply is finalized
+        async with client_turn(data):
+            await stream_train_turn(scope, send, data, deadline)
+    except ClientBusy as e:
+        logging.warning(f"⏳ {e}")
+        await send_json(scope, send, *chat.CLIENT_BUSY)
+
+
+async def stream_train_turn(scope: Scope, send: Send, data: Optional[Dict[str, Any]], deadline: float) -> None:
+    """Prepare the turn, stream Gemini's reply as SSE and finalize it"""
+    try:
+        turn = await run_io(chat.prepare_train_turn, data)
+        if "error" in turn:
+            return await send_json(scope, send, *turn["error"])
+        if "greeting" in turn:
+            events = [chat.sse_event("chunk", {"text": turn["greeting"]}),
+                      chat.sse_event("done", {"reply": turn["greeting"]})]
+        else:
+            client = get_async_gemini_client(chat.GEMINI_API_KEY)
+            stream = await client.stream_generate_content(chat.GEMINI_MODEL, turn["payload"], deadline=deadline)
+            if stream.status_code != 200:
+                logging.error("🔥 Gemini API Error (%s): %s", stream.status_code, await stream.text())
+                await stream.aclose()
+                return await send_json(scope, send, {"error": "Gemini API request failed.",
+                                                     "details": "Please try again later."}, stream.status_code)
+            events = None
+    except GeminiRequestError as e:
+        return await send_json(scope, send, *chat.gemini_unreachable_error(e))
+    except Exception as e:
+        logging.exception(f"🔥 Unhandled exception in /gemini/train/stream: {e}")
+        return await send_json(scope, send, {"error": "Internal server error. Please try again."}, 500)
+
+    await send({"type": "http.response.start", "status": 200,
+                "headers": response_headers(scope, "text/event-stream; charset=utf-8", chat.SSE_HEADERS)})
+    if events is None:
+        try:
+            async for event in sse_events(stream, turn):
+                await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+        finally:
+            await stream.aclose()
+    else:
+        for event in events:
+            await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+NATIVE_ROUTES = {
+    ("POST", "/gemini/train"): gemini_train,
+    ("POST", "/gemini/train/stream"): gemini_train_stream,
+}
+
+
+async def lifespan(receive: Receive, send: Send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await run_io(chat.get_app)
+            chat.start_background_work()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_gemini_clients()
+            io_pool.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    """The ASGI application"""
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        # No websocket routes
+        await send({"type": "websocket.close", "code": 1000})
+        return
+
+    handler = NATIVE_ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        return await flask_bridge(scope, receive, send)
+
+    # What the Flask app's before_request hook does for its own routes
+    chat.start_background_work()
+    remote_addr = (scope.get("client") or ("127.0.0.1", 0))[0]
+    # The Flask endpoint of the same route, e.g. "chat.gemini_train"
+    endpoint = f"{chat.bp.name}.{handler.__name__}"
+    if not await run_io(within_rate_limit, endpoint, remote_addr):
+        return await send_json(scope, send, {"error": "Rate limit exceeded. Please try again later."}, 429)
+    await handler(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = 5000
+    if len(sys.argv) > 1:
+        try:
+            port = int(sys.argv[1])
+        except ValueError:
+            print("Invalid port number. Using default port 5000.")
+    uvicorn.run(app, host="0.0.0.0", port=port)
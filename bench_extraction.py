@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the client-info extraction engine (client_extraction.py).
+
+Compares the compiled engine with the previous approach of one re call per
+pattern and keyword over the same text, and reports throughput in MB/s.
+Uses the conversation_*.txt files in client_data/ when there are any,
+otherwise a synthetic corpus of real-sized conversations.
+
+    python bench_extraction.py [--folder client_data] [--conversations 200] [--rounds 5]
+"""
+
+import os
+import re
+import time
+import random
+import argparse
+from typing import List, Dict, Any
+
+from client_extraction import CLIENT_INFO_ENGINE, CLIENT_NAME_RULES, EMAIL_PATTERN, PHONE_PATTERN, SUMMARY_GROUPS
+from keyword_matcher import KEYWORD_GROUPS
+
+USER_LINES = [
+    "Hello, I need help with social media marketing for my shop",
+    "My name is {name}, I run a small clothing business in Lahore",
+    "What is the price for the automation package?",
+    "Can we schedule a meeting tomorrow at 5 pm?",
+    "My email is {email} and my number is +92 300 {digits}",
+    "Yes, please go ahead and book it",
+    "Do you also build websites and product catalogs?",
+    "How much does the monthly service cost?",
+]
+MODEL_LINES = [
+    "Hi! I'm Saba from IMJD. How can I help you today?",
+    "Thanks {name}! Our social media management plans start from PKR 25,000 per month.",
+    "We can set up a Google Meet with our team. Which time suits you?",
+    "I have noted your details. Our team will call you shortly.",
+    "We offer WhatsApp automation, catalog design and paid ads management for businesses of every size.",
+]
+NAMES = ["Salman", "Ayesha", "Bilal", "Fatima", "Hamza", "Zainab", "Usman", "Mariam"]
+
+
+def synthetic_conversation(rng: random.Random, turns: int) -> str:
+    name = rng.choice(NAMES)
+    values = {"name": name, "email": f"{name.lower()}{rng.randint(1, 999)}@example.com",
+              "digits": f"{rng.randint(1000000, 9999999)}"}
+    lines = []
+    for _ in range(turns):
+        lines.append("user: " + rng.choice(USER_LINES).format(**values) + "\n")
+        lines.append("model: " + rng.choice(MODEL_LINES).format(**values) + "\n")
+    return "".join(lines)
+
+
+def load_corpus(folder: str, count: int) -> List[str]:
+    corpus: List[str] = []
+    if os.path.isdir(folder):
+        for fname in sorted(os.listdir(folder)):
+            if fname.startswith("conversation_") and fname.endswith(".txt"):
+                with open(os.path.join(folder, fname), "r", encoding="utf-8", errors="replace") as f:
+                    corpus.append(f.read())
+    if not corpus:
+        rng = random.Random(42)
+        corpus = [synthetic_conversation(rng, rng.randint(10, 60)) for _ in range(count)]
+    return corpus
+
+
+def legacy_extract(text: str) -> Dict[str, Any]:
+    """What the call sites did before: one re call per pattern and keyword."""
+    info: Dict[str, Any] = {}
+    for pattern, name_filter in CLIENT_NAME_RULES:
+        for match in re.findall(pattern, text, re.IGNORECASE | re.MULTILINE):
+            name = name_filter(match)
+            if name:
+                info["name"] = name
+                break
+        if "name" in info:
+            break
+    phone_match = re.search(PHONE_PATTERN, text)
+    if phone_match:
+        info["phone"] = phone_match.group(1).strip()
+    emails = re.findall(EMAIL_PATTERN, text)
+    if emails:
+        info["email"] = emails[0].lower()
+    info["keywords"] = {group for group in SUMMARY_GROUPS
+                        if any(keyword in text.lower() for keyword in KEYWORD_GROUPS[group])}
+    return info
+
+
+def engine_extract(text: str) -> Dict[str, Any]:
+    found = CLIENT_INFO_ENGINE.scan(text)
+    info: Dict[str, Any] = {}
+    if found.name:
+        info["name"] = found.name
+    if found.phone:
+        info["phone"] = found.phone
+    if found.emails:
+        info["email"] = found.emails[0].lower()
+    info["keywords"] = found.keywords
+    return info
+
+
+def bench(label: str, extract, corpus: List[str], rounds: int) -> float:
+    size_mb = sum(len(text.encode("utf-8")) for text in corpus) / (1024 * 1024)
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for text in corpus:
+            extract(text)
+        best = min(best, time.perf_counter() - start)
+    throughput = size_mb / best
+    print(f"{label:<14} {best * 1000:9.1f} ms   {throughput:8.2f} MB/s")
+    return throughput
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", default="client_data")
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.folder, args.conversations)
+    size_mb = sum(len(text.encode("utf-8")) for text in corpus) / (1024 * 1024)
+    print(f"Corpus: {len(corpus)} conversations, {size_mb:.2f} MB")
+
+    differences = sum(1 for text in corpus if engine_extract(text) != legacy_extract(text))
+    print(f"Conversations where the results differ: {differences}")
+
+    old = bench("per-pattern", legacy_extract, corpus, args.rounds)
+    new = bench("engine", engine_extract, corpus, args.rounds)
+    print(f"Speedup: {new / old:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
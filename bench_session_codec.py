@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the Redis session encodings (session_codec.py).
+
+Builds real session shapes with HistoryManager (a fresh chat, a typical
+chat, a chat that fills the token budget and has a rolling summary, and the
+per-turn items of the list backend) and compares json.dumps/json.loads with
+msgpack and msgpack+zstd: stored bytes, encode and decode time. Codecs whose
+package is not installed are skipped.
+
+    python bench_session_codec.py [--rounds 2000] [--compress-min-bytes 1024]
+"""
+
+import json
+import time
+import random
+import argparse
+from typing import Any, Callable, Dict, List, Tuple
+
+from history_manager import HistoryManager
+import session_codec
+
+USER_LINES = [
+    "Hello, I need help with social media marketing for my shop",
+    "My name is Ayesha, I run a small clothing business in Lahore",
+    "What is the price for the automation package?",
+    "Can we schedule a meeting tomorrow at 5 pm?",
+    "My email is ayesha123@example.com and my number is +92 300 1234567",
+    "Do you also build websites and product catalogs? We have around 300 products and sell on Instagram "
+    "and WhatsApp, and we want customers to be able to order online with cash on delivery.",
+]
+MODEL_LINES = [
+    "Hi! I'm Saba from IMJD. How can I help you today?",
+    "Thanks Ayesha! Our social media management plans start from PKR 25,000 per month and include "
+    "content calendars, post design, captions and monthly reporting.",
+    "We can set up a Google Meet with our team. Which time suits you?",
+    "We offer WhatsApp automation, catalog design and paid ads management for businesses of every size. "
+    "For 300 products a Shopify store with a WhatsApp order button usually works best; shall I share the "
+    "packages and timelines?",
+]
+
+
+def session_shape(exchanges: int, seed: int = 7) -> Dict[str, Any]:
+    """The session app.py stores after `exchanges` user/model exchanges."""
+    rng = random.Random(seed)
+    window = HistoryManager().load(None)
+    for _ in range(exchanges):
+        window.add({"role": "user", "parts": [{"text": rng.choice(USER_LINES)}]})
+        window.add({"role": "model", "parts": [{"text": rng.choice(MODEL_LINES)}]})
+    return {**window.session_fields(), "client_name": "Ayesha", "turn_seq": exchanges * 2}
+
+
+def codecs(compress_min_bytes: int) -> List[Tuple[str, Callable[[Any], bytes], Callable[[bytes], Any]]]:
+    found = [("json", lambda value: json.dumps(value).encode("utf-8"), json.loads)]
+    if session_codec.msgpack is None:
+        print("msgpack not installed (pip install msgpack): only JSON is measured")
+        return found
+    plain = session_codec.MsgpackCodec(compress_min_bytes=0)
+    found.append(("msgpack", plain.encode, session_codec.decode_value))
+    if session_codec.zstandard is None:
+        print("zstandard not installed (pip install zstandard): no compressed variant")
+    else:
+        compressed = session_codec.MsgpackCodec(compress_min_bytes=compress_min_bytes)
+        found.append((f"msgpack+zstd>={compress_min_bytes}", compressed.encode, session_codec.decode_value))
+    return found
+
+
+def bench(value: Any, encode: Callable[[Any], bytes], decode: Callable[[bytes], Any], rounds: int) -> Tuple[int, float, float]:
+    raw = encode(value)
+    assert decode(raw) == value
+    start = time.perf_counter()
+    for _ in range(rounds):
+        encode(value)
+    encode_us = (time.perf_counter() - start) / rounds * 1e6
+    start = time.perf_counter()
+    for _ in range(rounds):
+        decode(raw)
+    decode_us = (time.perf_counter() - start) / rounds * 1e6
+    return len(raw), encode_us, decode_us
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--compress-min-bytes", type=int, default=session_codec.SESSION_COMPRESS_MIN_BYTES)
+    args = parser.parse_args()
+
+    full = session_shape(60)
+    shapes = {
+        "fresh chat (1 exchange)": session_shape(1),
+        "typical chat (8 exchanges)": session_shape(8),
+        f"full window ({len(full['conversation_history'])} turns + summary)": full,
+        "list backend turn item": [full["history_tokens"][-1], full["conversation_history"][-1]],
+    }
+    available = codecs(args.compress_min_bytes)
+    for shape, value in shapes.items():
+        print(f"\n{shape}")
+        print(f"  {'codec':<24} {'bytes':>8} {'vs json':>8} {'encode us':>10} {'decode us':>10}")
+        json_size = None
+        for name, encode, decode in available:
+            size, encode_us, decode_us = bench(value, encode, decode, args.rounds)
+            json_size = json_size or size
+            print(f"  {name:<24} {size:>8} {size / json_size:>7.0%} {encode_us:>10.1f} {decode_us:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
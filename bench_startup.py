@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the chat server.
+
+Runs fresh interpreters and measures how long `import app` takes, how long
+create_app() takes on top of it, and which modules account for most of the
+import time (python -X importtime). Importing app.py makes no network calls
+and loads no models, so this runs offline; create_app() creates the data
+folders in the current directory like the server does.
+
+    python bench_startup.py [--module app] [--runs 5] [--top 15] [--no-create]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+SNIPPET = """
+import json, time
+started = time.perf_counter()
+import {module} as target
+imported = time.perf_counter()
+if {create}:
+    target.create_app()
+created = time.perf_counter()
+print(json.dumps({{"import": imported - started, "create": created - imported}}))
+"""
+
+
+def run_once(module: str, create: bool) -> Tuple[Dict[str, float], List[Tuple[int, str]]]:
+    """Timings of one cold start and (cumulative microseconds, module) from -X importtime."""
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "bench-placeholder")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SNIPPET.format(module=module, create=create)],
+        capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        sys.exit(f"Starting {module} failed:\n{result.stderr[-2000:]}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative), name.rstrip()))
+    return timings, imports
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--no-create", action="store_true", help="only measure the import")
+    args = parser.parse_args()
+
+    import_times, create_times = [], []
+    slowest: Dict[str, List[int]] = {}
+    for _ in range(args.runs):
+        timings, imports = run_once(args.module, not args.no_create)
+        import_times.append(timings["import"])
+        create_times.append(timings["create"])
+        for cumulative, name in imports:
+            # Only top-level entries (no leading spaces) add up to the total
+            if not name.startswith("  "):
+                slowest.setdefault(name.strip(), []).append(cumulative)
+
+    print(f"import {args.module}: median {statistics.median(import_times) * 1000:.0f} ms, "
+          f"min {min(import_times) * 1000:.0f} ms over {args.runs} runs")
+    if not args.no_create:
+        print(f"create_app(): median {statistics.median(create_times) * 1000:.0f} ms, "
+              f"min {min(create_times) * 1000:.0f} ms")
+    print(f"\nSlowest top-level imports (median cumulative):")
+    ranked = sorted(((statistics.median(times), name) for name, times in slowest.items()), reverse=True)
+    for micros, name in ranked[:args.top]:
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""
+Per-client serialization of chat turns.
+
+Two /gemini/train requests for the same client used to run side by side:
+both loaded the session, both called Gemini and both saved, so one turn was
+lost, and both updated the client's lead record. ClientTurnLock runs the
+turns of one client one at a time, in the order they arrived, on any
+worker; turns of different clients never wait for each other.
+
+Each client has a queue of turn tokens in Redis (client_turn:{key}:queue).
+A request appends its token and runs once it is at the head; when it is
+done it removes its token. Every token has a lease key
+(client_turn:{key}:lease:{token}) that a background thread renews every
+third of CLIENT_TURN_LEASE while the request waits or runs, so a worker that
+dies mid-turn holds up the client for at most CLIENT_TURN_LEASE seconds:
+the next waiter drops a head token whose lease is gone. A request that is
+not at the head after CLIENT_TURN_WAIT seconds gives up with ClientBusy.
+
+Without Redis (or when it is unreachable) turns are ordered within the
+worker only. AsyncClientTurnLock is the asyncio variant for the ASGI server
+(redis.asyncio client, same keys, so both servers can share them).
+
+Configuration (environment):
+    CLIENT_TURN_LOCK     "0" to let turns of one client run concurrently (default on)
+    CLIENT_TURN_LEASE    seconds a turn holds the client without renewal (default 30)
+    CLIENT_TURN_WAIT     longest a turn waits for the client's earlier turns (default 120)
+    CLIENT_TURN_POLL_MS  how often a waiting turn checks the queue (default 50)
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+CLIENT_TURN_LOCK = os.getenv("CLIENT_TURN_LOCK", "1").lower() in ("1", "true", "yes")
+CLIENT_TURN_LEASE = float(os.getenv("CLIENT_TURN_LEASE", 30))
+CLIENT_TURN_WAIT = float(os.getenv("CLIENT_TURN_WAIT", 120))
+CLIENT_TURN_POLL = int(os.getenv("CLIENT_TURN_POLL_MS", 50)) / 1000
+
+
+class ClientBusy(Exception):
+    """The client's earlier turns were still running after CLIENT_TURN_WAIT."""
+
+
+def _text(value: Any) -> Optional[str]:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class TurnLease:
+    """One request's place in a client's queue."""
+
+    def __init__(self, client_key: str, token: str):
+        self.client_key = client_key
+        self.token = token
+        # Ordered in this worker only (no Redis)
+        self.local = False
+        # Set when the lease expired while held: another worker may have started a turn
+        self.lost = False
+
+
+class _TurnKeys:
+    """Redis keys and settings shared by the sync and async locks."""
+
+    def __init__(self, redis_client, lease: float, wait: float, poll_interval: float):
+        self.redis = redis_client
+        self.lease = lease
+        self.wait = wait
+        self.poll_interval = poll_interval
+
+    @staticmethod
+    def queue_key(client_key: str) -> str:
+        return f"client_turn:{client_key}:queue"
+
+    @staticmethod
+    def lease_key(client_key: str, token: str) -> str:
+        return f"client_turn:{client_key}:lease:{token}"
+
+    @property
+    def lease_ms(self) -> int:
+        return max(1, int(self.lease * 1000))
+
+    @property
+    def queue_ms(self) -> int:
+        # Outlives every waiter and holder; refreshed with their leases
+        return max(1, int((self.wait + self.lease) * 1000))
+
+    def _queue_enqueue(self, pipe, lease: TurnLease) -> None:
+        pipe.rpush(self.queue_key(lease.client_key), lease.token)
+        pipe.set(self.lease_key(lease.client_key, lease.token), 1, px=self.lease_ms)
+        pipe.pexpire(self.queue_key(lease.client_key), self.queue_ms)
+
+    def _queue_renew(self, pipe, lease: TurnLease) -> None:
+        pipe.pexpire(self.lease_key(lease.client_key, lease.token), self.lease_ms)
+        pipe.pexpire(self.queue_key(lease.client_key), self.queue_ms)
+
+    def _queue_leave(self, pipe, lease: TurnLease) -> None:
+        pipe.lrem(self.queue_key(lease.client_key), 1, lease.token)
+        pipe.delete(self.lease_key(lease.client_key, lease.token))
+
+    @staticmethod
+    def _renewed(lease: TurnLease, results: List[Any]) -> None:
+        if not results[0] and not lease.lost:
+            lease.lost = True
+            logging.error(f"❌ Turn lease of client {lease.client_key} expired while held; "
+                          f"a later turn may have started")
+
+
+class _LocalQueues:
+    """Per-client FIFO of turn tokens within one process."""
+
+    def __init__(self):
+        self._queues: Dict[str, Deque[str]] = {}
+        self._changed = threading.Condition()
+
+    def acquire(self, client_key: str, token: str, timeout: float) -> bool:
+        with self._changed:
+            queue = self._queues.setdefault(client_key, deque())
+            queue.append(token)
+            if self._changed.wait_for(lambda: queue[0] == token, timeout):
+                return True
+            self._remove(client_key, token)
+            return False
+
+    def release(self, client_key: str, token: str) -> None:
+        with self._changed:
+            self._remove(client_key, token)
+
+    def _remove(self, client_key: str, token: str) -> None:
+        # Caller holds the condition
+        queue = self._queues.get(client_key)
+        if queue is not None and token in queue:
+            queue.remove(token)
+            if not queue:
+                del self._queues[client_key]
+        self._changed.notify_all()
+
+
+class ClientTurnLock(_TurnKeys):
+    """Runs the turns of each client one at a time, in arrival order, across workers."""
+
+    def __init__(self, redis_client=None, lease: float = CLIENT_TURN_LEASE,
+                 wait: float = CLIENT_TURN_WAIT, poll_interval: float = CLIENT_TURN_POLL):
+        super().__init__(redis_client, lease, wait, poll_interval)
+        self._local = _LocalQueues()
+        # Leases renewed by this process's renewal thread
+        self._leases: Dict[str, TurnLease] = {}
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        # Notified when a turn of this process ends, so local waiters need not poll
+        self._released = threading.Condition()
+
+    @contextmanager
+    def hold(self, client_key: str) -> Iterator[TurnLease]:
+        lease = self.acquire(client_key)
+        try:
+            yield lease
+        finally:
+            self.release(lease)
+
+    def acquire(self, client_key: str) -> TurnLease:
+        """Wait for the client's earlier turns; raises ClientBusy after `wait` seconds."""
+        lease = TurnLease(client_key, uuid.uuid4().hex)
+        give_up_at = time.monotonic() + self.wait
+        if self.redis is not None:
+            try:
+                with self.redis.pipeline(transaction=True) as pipe:
+                    self._queue_enqueue(pipe, lease)
+                    pipe.execute()
+                self._start_renewing(lease)
+                if self._wait_for_head(lease, give_up_at):
+                    return lease
+                self._leave(lease)
+                raise ClientBusy(f"Client {client_key} is still busy")
+            except ClientBusy:
+                raise
+            except Exception as e:
+                logging.warning(f"⚠️ Client turn queue unavailable, ordering {client_key} in this worker only: {e}")
+                self._leave(lease)
+        lease.local = True
+        if not self._local.acquire(client_key, lease.token, max(0.0, give_up_at - time.monotonic())):
+            raise ClientBusy(f"Client {client_key} is still busy")
+        return lease
+
+    def release(self, lease: TurnLease) -> None:
+        if lease.local:
+            self._local.release(lease.client_key, lease.token)
+            return
+        self._leave(lease)
+        with self._released:
+            self._released.notify_all()
+
+    def _wait_for_head(self, lease: TurnLease, give_up_at: float) -> bool:
+        queue_key = self.queue_key(lease.client_key)
+        while True:
+            tokens = [_text(token) for token in self.redis.lrange(queue_key, 0, -1)]
+            if lease.token not in tokens:
+                # The queue expired or was dropped (e.g. Redis restarted): take a new place
+                with self.redis.pipeline(transaction=True) as pipe:
+                    self._queue_enqueue(pipe, lease)
+                    pipe.execute()
+                continue
+            head = tokens[0]
+            if head == lease.token:
+                return True
+            if not self.redis.exists(self.lease_key(lease.client_key, head)):
+                logging.warning(f"⚠️ Skipping an abandoned turn of client {lease.client_key}")
+                self.redis.lrem(queue_key, 1, head)
+                continue
+            if time.monotonic() >= give_up_at:
+                return False
+            with self._released:
+                self._released.wait(self.poll_interval)
+
+    def _leave(self, lease: TurnLease) -> None:
+        with self._lock:
+            self._leases.pop(lease.token, None)
+        try:
+            with self.redis.pipeline(transaction=True) as pipe:
+                self._queue_leave(pipe, lease)
+                pipe.execute()
+        except Exception as e:
+            # The token is dropped by the next waiter once its lease expires
+            logging.warning(f"⚠️ Could not leave the turn queue of client {lease.client_key}: {e}")
+
+    def _start_renewing(self, lease: TurnLease) -> None:
+        with self._lock:
+            self._leases[lease.token] = lease
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._renew_loop, name="client-turn-leases", daemon=True).start()
+
+    def _renew_loop(self) -> None:
+        while True:
+            time.sleep(self.lease / 3)
+            with self._lock:
+                leases = list(self._leases.values())
+            if not leases:
+                continue
+            try:
+                with self.redis.pipeline(transaction=False) as pipe:
+                    for lease in leases:
+                        self._queue_renew(pipe, lease)
+                    results = pipe.execute()
+            except Exception as e:
+                logging.warning(f"⚠️ Could not renew client turn leases: {e}")
+                continue
+            for i, lease in enumerate(leases):
+                self._renewed(lease, results[2 * i:2 * i + 2])
+
+
+class AsyncClientTurnLock(_TurnKeys):
+    """ClientTurnLock for coroutines, on a redis.asyncio client."""
+
+    def __init__(self, redis_client=None, lease: float = CLIENT_TURN_LEASE,
+                 wait: float = CLIENT_TURN_WAIT, poll_interval: float = CLIENT_TURN_POLL):
+        super().__init__(redis_client, lease, wait, poll_interval)
+        # asyncio.Lock wakes its waiters in FIFO order; entries are dropped when unused
+        self._local: Dict[str, Tuple[asyncio.Lock, int]] = {}
+        self._renewals: Dict[str, "asyncio.Task[None]"] = {}
+
+    @asynccontextmanager
+    async def hold(self, client_key: str) -> AsyncIterator[TurnLease]:
+        lease = await self.acquire(client_key)
+        try:
+            yield lease
+        finally:
+            await self.release(lease)
+
+    async def acquire(self, client_key: str) -> TurnLease:
+        """See ClientTurnLock.acquire."""
+        lease = TurnLease(client_key, uuid.uuid4().hex)
+        give_up_at = time.monotonic() + self.wait
+        if self.redis is not None:
+            try:
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    self._queue_enqueue(pipe, lease)
+                    await pipe.execute()
+                self._renewals[lease.token] = asyncio.ensure_future(self._renew_loop(lease))
+                if await self._wait_for_head(lease, give_up_at):
+                    return lease
+                await self._leave(lease)
+                raise ClientBusy(f"Client {client_key} is still busy")
+            except ClientBusy:
+                raise
+            except asyncio.CancelledError:
+                await asyncio.shield(self._leave(lease))
+                raise
+            except Exception as e:
+                logging.warning(f"⚠️ Client turn queue unavailable, ordering {client_key} in this worker only: {e}")
+                await self._leave(lease)
+        lease.local = True
+        lock, users = self._local.get(client_key, (asyncio.Lock(), 0))
+        self._local[client_key] = (lock, users + 1)
+        try:
+            await asyncio.wait_for(lock.acquire(), max(0.0, give_up_at - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._forget_local(client_key)
+            raise ClientBusy(f"Client {client_key} is still busy")
+        except BaseException:
+            self._forget_local(client_key)
+            raise
+        return lease
+
+    async def release(self, lease: TurnLease) -> None:
+        if lease.local:
+            self._local[lease.client_key][0].release()
+            self._forget_local(lease.client_key)
+            return
+        await self._leave(lease)
+
+    def _forget_local(self, client_key: str) -> None:
+        lock, users = self._local[client_key]
+        if users > 1:
+            self._local[client_key] = (lock, users - 1)
+        else:
+            del self._local[client_key]
+
+    async def _wait_for_head(self, lease: TurnLease, give_up_at: float) -> bool:
+        queue_key = self.queue_key(lease.client_key)
+        while True:
+            tokens = [_text(token) for token in await self.redis.lrange(queue_key, 0, -1)]
+            if lease.token not in tokens:
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    self._queue_enqueue(pipe, lease)
+                    await pipe.execute()
+                continue
+            head = tokens[0]
+            if head == lease.token:
+                return True
+            if not await self.redis.exists(self.lease_key(lease.client_key, head)):
+                logging.warning(f"⚠️ Skipping an abandoned turn of client {lease.client_key}")
+                await self.redis.lrem(queue_key, 1, head)
+                continue
+            if time.monotonic() >= give_up_at:
+                return False
+            await asyncio.sleep(self.poll_interval)
+
+    async def _leave(self, lease: TurnLease) -> None:
+        renewal = self._renewals.pop(lease.token, None)
+        if renewal is not None:
+            renewal.cancel()
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                self._queue_leave(pipe, lease)
+                await pipe.execute()
+        except Exception as e:
+            logging.warning(f"⚠️ Could not leave the turn queue of client {lease.client_key}: {e}")
+
+    async def _renew_loop(self, lease: TurnLease) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    self._queue_renew(pipe, lease)
+                    self._renewed(lease, await pipe.execute())
+            except Exception as e:
+                logging.warning(f"⚠️ Could not renew the turn lease of client {lease.client_key}: {e}")
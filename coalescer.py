@@ -0,0 +1,150 @@
+"""
+Per-key debounce that coalesces bursts of requests into one unit of work.
+
+WhatsApp users often send several short messages in a row ("hi", "I need",
+"a website"). With coalescing on, the first message of a burst waits until
+no new message for the same client arrived for `window` seconds (but never
+longer than `max_wait` in total); every message that arrives meanwhile joins
+the burst. The first request then runs the handler once with all messages,
+and every request of the burst receives the same result.
+
+Bursts are tracked in process memory, so messages are only coalesced when
+they reach the same worker process (threaded workers, or sticky routing by
+client). Messages that land on different workers are simply handled
+separately, as without coalescing.
+
+MessageCoalescer is for threaded workers; AsyncMessageCoalescer does the
+same for coroutines on one event loop (asgi_app.py).
+
+Configuration (environment):
+    COALESCE_WINDOW      quiet time in seconds that ends a burst (default 0 = off)
+    COALESCE_MAX_WAIT    longest a burst is held open in seconds (default 5)
+    COALESCE_REPLY_MODE  "all" (every request gets the reply, default) or
+                         "last" (only the burst's last request gets it)
+"""
+
+import os
+import time
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", 0))
+COALESCE_MAX_WAIT = float(os.getenv("COALESCE_MAX_WAIT", 5))
+COALESCE_REPLY_MODE = os.getenv("COALESCE_REPLY_MODE", "all").lower()
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class _Burst(Generic[T]):
+    def __init__(self, now: float, done: Any):
+        self.items: List[T] = []
+        self.started_at = now
+        self.last_at = now
+        self.done = done
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _BurstTable:
+    """Open bursts by key; shared by the threaded and asyncio coalescers."""
+
+    def __init__(self, window: float, max_wait: float):
+        self.window = window
+        self.max_wait = max(window, max_wait)
+        self._bursts: Dict[str, _Burst] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"requests": 0, "bursts": 0}
+
+    def _join(self, key: str, item: Any, new_event: Callable[[], Any]) -> Tuple[_Burst, bool, int]:
+        """Add `item` to the open burst for `key` (opening one): (burst, opened it, position)."""
+        now = time.monotonic()
+        with self._lock:
+            self.stats["requests"] += 1
+            burst = self._bursts.get(key)
+            leader = burst is None
+            if leader:
+                burst = self._bursts[key] = _Burst(now, new_event())
+                self.stats["bursts"] += 1
+            position = len(burst.items)
+            burst.items.append(item)
+            burst.last_at = now
+        return burst, leader, position
+
+    def _quiet_in(self, key: str, burst: _Burst) -> float:
+        """Seconds until the burst closes; 0 once it is closed (later messages start a new one)."""
+        with self._lock:
+            now = time.monotonic()
+            close_at = min(burst.last_at + self.window, burst.started_at + self.max_wait)
+            if now < close_at:
+                return close_at - now
+            if self._bursts.get(key) is burst:
+                del self._bursts[key]
+            return 0.0
+
+
+class MessageCoalescer(_BurstTable):
+    """Groups items submitted for the same key within the debounce window."""
+
+    def __init__(self, window: float = COALESCE_WINDOW, max_wait: float = COALESCE_MAX_WAIT):
+        super().__init__(window, max_wait)
+
+    def submit(self, key: str, item: T, handler: Callable[[List[T]], R]) -> Tuple[R, int, int]:
+        """
+        Add `item` to the open burst for `key` (or open one) and wait for the
+        burst's result. Returns (result, position of this item, burst size).
+        The handler runs once per burst, on the thread that opened it; its
+        exception is raised in every request of the burst.
+        """
+        burst, leader, position = self._join(key, item, threading.Event)
+
+        if leader:
+            while True:
+                delay = self._quiet_in(key, burst)
+                if not delay:
+                    break
+                time.sleep(delay)
+            try:
+                burst.result = handler(list(burst.items))
+            except BaseException as e:
+                burst.error = e
+            finally:
+                burst.done.set()
+        else:
+            burst.done.wait()
+
+        if burst.error is not None:
+            raise burst.error
+        return burst.result, position, len(burst.items)
+
+
+class AsyncMessageCoalescer(_BurstTable):
+    """MessageCoalescer for coroutines: a waiting burst holds no thread."""
+
+    def __init__(self, window: float = COALESCE_WINDOW, max_wait: float = COALESCE_MAX_WAIT):
+        super().__init__(window, max_wait)
+
+    async def submit(self, key: str, item: T,
+                     handler: Callable[[List[T]], Awaitable[R]]) -> Tuple[R, int, int]:
+        """Same contract as MessageCoalescer.submit; `handler` is a coroutine function."""
+        burst, leader, position = self._join(key, item, asyncio.Event)
+
+        if leader:
+            while True:
+                delay = self._quiet_in(key, burst)
+                if not delay:
+                    break
+                await asyncio.sleep(delay)
+            try:
+                burst.result = await handler(list(burst.items))
+            except BaseException as e:
+                burst.error = e
+            finally:
+                burst.done.set()
+        else:
+            await burst.done.wait()
+
+        if burst.error is not None:
+            raise burst.error
+        return burst.result, position, len(burst.items)
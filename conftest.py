@@ -0,0 +1,278 @@
+"""
+Shared test fixtures: an in-memory stand-in for the Redis server
+"""
+
+import time
+import queue
+import functools
+import threading
+
+import pytest
+
+
+def _bytes(value):
+    """A value as redis-py sends it: bytes stay bytes, everything else is str()-encoded."""
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode("utf-8")
+
+
+def _command(method):
+    """A Redis command: one round trip when called directly, none inside a pipeline."""
+    @functools.wraps(method)
+    def call(self, *args, **kwargs):
+        with self._lock:
+            self._round_trip()
+            return method(self, *args, **kwargs)
+    return call
+
+
+class FakeRedis:
+    """
+    Dict-backed Redis with the calls the app makes: strings, hashes, lists,
+    expiry, pipelines and pub/sub. Values are returned as bytes, like a real
+    server. `round_trips`, `transactions` and `bytes_written` count the
+    traffic; setting `down` makes every command raise ConnectionError.
+    """
+
+    def __init__(self):
+        # key -> bytes, list of bytes (lists) or dict of bytes -> bytes (hashes)
+        self.data = {}
+        # key -> last TTL set, in seconds
+        self.ttls = {}
+        self.round_trips = 0
+        self.transactions = 0
+        self.bytes_written = 0
+        self.down = False
+        self._expires = {}
+        self._subscribers = {}
+        self._lock = threading.RLock()
+
+    def _round_trip(self):
+        if self.down:
+            raise ConnectionError("Redis is down")
+        self.round_trips += 1
+
+    def _live(self, key):
+        if key in self._expires and self._expires[key] <= time.monotonic():
+            self.data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self.data
+
+    def _expire_in(self, key, seconds):
+        self.ttls[key] = seconds
+        self._expires[key] = time.monotonic() + seconds
+
+    # -- strings -----------------------------------------------------------
+
+    @_command
+    def get(self, key):
+        return self.data.get(key) if self._live(key) else None
+
+    @_command
+    def set(self, key, value, nx=False, ex=None, px=None):
+        if nx and self._live(key):
+            return None
+        self.data[key] = _bytes(value)
+        self._expires.pop(key, None)
+        if ex is not None:
+            self._expire_in(key, ex)
+        elif px is not None:
+            self._expire_in(key, px / 1000)
+        return True
+
+    @_command
+    def setex(self, key, ttl, value):
+        self.data[key] = _bytes(value)
+        self._expire_in(key, ttl)
+        self.bytes_written += len(self.data[key])
+        return True
+
+    # -- keys --------------------------------------------------------------
+
+    @_command
+    def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            deleted += self._live(key)
+            self.data.pop(key, None)
+            self._expires.pop(key, None)
+        return deleted
+
+    @_command
+    def exists(self, *keys):
+        return sum(1 for key in keys if self._live(key))
+
+    @_command
+    def expire(self, key, seconds):
+        if not self._live(key):
+            return False
+        self._expire_in(key, seconds)
+        return True
+
+    @_command
+    def pexpire(self, key, ms):
+        if not self._live(key):
+            return False
+        self._expire_in(key, ms / 1000)
+        return True
+
+    # -- hashes ------------------------------------------------------------
+
+    @_command
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(_bytes(field)) if self._live(key) else None
+
+    @_command
+    def hgetall(self, key):
+        return dict(self.data.get(key, {})) if self._live(key) else {}
+
+    @_command
+    def hset(self, key, field=None, value=None, mapping=None):
+        self._live(key)
+        fields = self.data.setdefault(key, {})
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        for name, item in items.items():
+            fields[_bytes(name)] = _bytes(item)
+            self.bytes_written += len(fields[_bytes(name)])
+        return len(items)
+
+    @_command
+    def hincrby(self, key, field, amount=1):
+        self._live(key)
+        fields = self.data.setdefault(key, {})
+        value = int(fields.get(_bytes(field), 0)) + amount
+        fields[_bytes(field)] = _bytes(value)
+        return value
+
+    # -- lists -------------------------------------------------------------
+
+    @staticmethod
+    def _range(items, start, end):
+        return items[start:None if end == -1 else end + 1]
+
+    @_command
+    def rpush(self, key, *values):
+        self._live(key)
+        items = self.data.setdefault(key, [])
+        items.extend(_bytes(value) for value in values)
+        self.bytes_written += sum(len(_bytes(value)) for value in values)
+        return len(items)
+
+    @_command
+    def lrange(self, key, start, end):
+        return self._range(list(self.data.get(key, [])), start, end) if self._live(key) else []
+
+    @_command
+    def ltrim(self, key, start, end):
+        if self._live(key):
+            self.data[key] = self._range(self.data[key], start, end)
+        return True
+
+    @_command
+    def lrem(self, key, count, value):
+        items = self.data.get(key, []) if self._live(key) else []
+        removed = 0
+        while _bytes(value) in items and (count == 0 or removed < abs(count)):
+            items.remove(_bytes(value))
+            removed += 1
+        return removed
+
+    # -- pipelines and pub/sub ---------------------------------------------
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self, transaction)
+
+    @_command
+    def publish(self, channel, message):
+        subscribers = self._subscribers.get(channel, [])
+        for messages in subscribers:
+            messages.put({"type": "message", "channel": _bytes(channel), "data": _bytes(message)})
+        return len(subscribers)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+
+class FakePipeline:
+    """Queues commands and runs them in one round trip (atomically)."""
+
+    def __init__(self, redis, transaction):
+        self.redis = redis
+        self.transaction = transaction
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        method = getattr(FakeRedis, name).__wrapped__
+        return lambda *args, **kwargs: self.commands.append((method, args, kwargs))
+
+    def execute(self):
+        with self.redis._lock:
+            self.redis._round_trip()
+            self.redis.transactions += self.transaction
+            results = [method(self.redis, *args, **kwargs) for method, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+
+class FakePubSub:
+    def __init__(self, redis):
+        self.redis = redis
+        self.messages = queue.Queue()
+
+    def subscribe(self, *channels):
+        with self.redis._lock:
+            for channel in channels:
+                self.redis._subscribers.setdefault(channel, []).append(self.messages)
+
+    def listen(self):
+        while True:
+            yield self.messages.get()
+
+
+class AsyncFakePipeline(FakePipeline):
+    """A pipeline of a redis.asyncio client: commands queue synchronously, execute() is awaited."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self):
+        return FakePipeline.execute(self)
+
+
+class AsyncFakeRedis:
+    """The same server behind coroutine methods, like a redis.asyncio client."""
+
+    def __init__(self, sync):
+        self.sync = sync
+
+    def pipeline(self, transaction=True):
+        return AsyncFakePipeline(self.sync, transaction)
+
+    def __getattr__(self, name):
+        method = getattr(self.sync, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
+
+
+@pytest.fixture
+def async_fake_redis(fake_redis):
+    return AsyncFakeRedis(fake_redis)
@@ -0,0 +1,274 @@
+"""
+Read-through cache of per-client context: a bounded in-process LRU with a
+TTL in front of a Redis tier shared by all workers.
+
+A /gemini/train turn read the whole lead_notes.json from disk for one
+client's sales notes, and client info checks went to Redis every time.
+ContextCache serves a hot client (one in an active chat) from memory:
+
+- memory: LRU of up to CONTEXT_CACHE_SIZE entries per cache, each valid for
+  CONTEXT_CACHE_TTL seconds at most
+- Redis (optional per cache): context_cache:{name}:{key}, written by the
+  worker that loaded the value, so other workers skip the loader as well
+- loader: the source of truth (lead store, session store)
+
+Every key has a version in the hash context_cache:{name}:versions. A writer
+calls invalidate(key) after changing the source: the version is
+incremented, the Redis copy deleted and (name, key, version) published on
+CONTEXT_CACHE_CHANNEL. Each worker listens on that channel on a background
+thread and replaces its entry with a tombstone of the new version, so a
+value loaded before the change (by a request that raced the writer) is
+never stored over it; Redis copies carry the version they were loaded at
+and are ignored once it is outdated. While the subscription is down
+(messages may be missed) values are read from Redis, not from memory.
+
+Configuration (environment):
+    CONTEXT_CACHE_ENABLED    "0" to read every value from its source (default on)
+    CONTEXT_CACHE_SIZE       entries kept in memory per cache (default 5000)
+    CONTEXT_CACHE_TTL        seconds an entry is served from memory (default 60)
+    CONTEXT_CACHE_REDIS_TTL  seconds an entry is kept in the Redis tier (default 3600)
+    CONTEXT_CACHE_CHANNEL    pub/sub channel of invalidations (default context_cache:invalidate)
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from session_codec import JsonCodec, get_codec
+
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", 5000))
+CONTEXT_CACHE_TTL = float(os.getenv("CONTEXT_CACHE_TTL", 60))
+CONTEXT_CACHE_REDIS_TTL = int(os.getenv("CONTEXT_CACHE_REDIS_TTL", 3600))
+CONTEXT_CACHE_CHANNEL = os.getenv("CONTEXT_CACHE_CHANNEL", "context_cache:invalidate")
+
+# Seconds before a dropped subscription is tried again
+RESUBSCRIBE_DELAY = 1.0
+
+# Value of a tombstone: the key changed and must be loaded again
+_STALE: Any = object()
+
+
+class InvalidationBus:
+    """
+    Publishes invalidations and delivers those of every worker to the
+    caches registered in this process (one subscription per process).
+    """
+
+    def __init__(self, redis_client, channel: str = CONTEXT_CACHE_CHANNEL):
+        self.redis = redis_client
+        self.channel = channel
+        self._caches: Dict[str, "ContextCache"] = {}
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._subscribed = threading.Event()
+
+    def register(self, cache: "ContextCache") -> None:
+        self._caches[cache.name] = cache
+
+    def publish(self, name: str, key: str, version: int) -> None:
+        self.redis.publish(self.channel, f"{name}\n{version}\n{key}")
+
+    @property
+    def listening(self) -> bool:
+        """True while this process receives invalidations (entries may be served from memory)."""
+        self.start()
+        return self._subscribed.is_set() and self._pid == os.getpid()
+
+    def start(self) -> None:
+        """Start the listener thread once per process."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._subscribed = threading.Event()
+            threading.Thread(target=self._run, name="context-cache-invalidations", daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Invalidations published while we were not subscribed are lost
+                self._clear_all()
+                self._subscribed.set()
+                for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._deliver(message["data"])
+            except Exception as e:
+                logging.warning(f"⚠️ Context cache invalidations unavailable, retrying: {e}")
+            self._subscribed.clear()
+            self._clear_all()
+            time.sleep(RESUBSCRIBE_DELAY)
+
+    def _deliver(self, data: Any) -> None:
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        try:
+            name, version, key = data.split("\n", 2)
+            cache = self._caches.get(name)
+            if cache is not None:
+                cache.stale(key, int(version))
+        except ValueError:
+            logging.warning(f"⚠️ Malformed context cache invalidation: {data!r}")
+
+    def _clear_all(self) -> None:
+        for cache in list(self._caches.values()):
+            cache.clear()
+
+
+class ContextCache:
+    """
+    Values of `loader(key)` cached in memory and (when `shared`) in Redis,
+    until invalidate(key) is called by whoever changes the source.
+
+    Cached values are shared between callers and must not be modified.
+    """
+
+    def __init__(self, name: str, loader: Callable[[str], Any], redis_client=None,
+                 bus: Optional[InvalidationBus] = None, shared: bool = True,
+                 max_entries: int = CONTEXT_CACHE_SIZE, ttl: float = CONTEXT_CACHE_TTL,
+                 redis_ttl: int = CONTEXT_CACHE_REDIS_TTL, codec: Optional[JsonCodec] = None,
+                 enabled: bool = CONTEXT_CACHE_ENABLED):
+        self.name = name
+        self.loader = loader
+        self.redis = redis_client
+        self.bus = bus
+        # False when the source already is Redis: only the memory tier is used
+        self.shared = shared
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self.codec = codec or get_codec()
+        self.enabled = enabled and redis_client is not None
+        # key -> (expires_at, version, value or _STALE)
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {"memory_hits": 0, "redis_hits": 0, "loads": 0, "invalidations": 0}
+        if bus is not None:
+            bus.register(self)
+
+    def value_key(self, key: str) -> str:
+        return f"context_cache:{self.name}:{key}"
+
+    @property
+    def versions_key(self) -> str:
+        return f"context_cache:{self.name}:versions"
+
+    def get(self, key: str) -> Any:
+        if not self.enabled:
+            return self.loader(key)
+        # Without invalidations, memory entries could outlive a change on another worker
+        use_memory = self.bus is None or self.bus.listening
+        now = time.monotonic()
+        if use_memory:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now and entry[2] is not _STALE:
+                    self._entries.move_to_end(key)
+                    self._metrics["memory_hits"] += 1
+                    return entry[2]
+
+        try:
+            version, cached = self._redis_read(key)
+        except Exception as e:
+            logging.warning(f"⚠️ Context cache {self.name} unavailable, loading {key} directly: {e}")
+            return self.loader(key)
+        if cached is not None:
+            with self._lock:
+                self._metrics["redis_hits"] += 1
+            if use_memory:
+                self._store(key, version, cached[0])
+            return cached[0]
+
+        value = self.loader(key)
+        with self._lock:
+            self._metrics["loads"] += 1
+        if use_memory:
+            self._store(key, version, value)
+        if self.shared:
+            try:
+                # Tagged with the version it was loaded at; ignored once the key changed again
+                self.redis.setex(self.value_key(key), self.redis_ttl, self.codec.encode([version, value]))
+            except Exception as e:
+                logging.warning(f"⚠️ Could not write context cache entry {self.name}:{key}: {e}")
+        return value
+
+    def invalidate(self, *keys: str) -> None:
+        """Call after changing the source of `keys`: every worker loads them again."""
+        if not self.enabled or not keys:
+            return
+        try:
+            with self.redis.pipeline(transaction=True) as pipe:
+                for key in keys:
+                    pipe.hincrby(self.versions_key, key, 1)
+                if self.shared:
+                    pipe.delete(*[self.value_key(key) for key in keys])
+                versions = pipe.execute()[:len(keys)]
+        except Exception as e:
+            # Peers keep their entries until CONTEXT_CACHE_TTL; this worker drops its own
+            logging.error(f"❌ Could not invalidate context cache {self.name} {keys}: {e}")
+            with self._lock:
+                for key in keys:
+                    self._entries.pop(key, None)
+            return
+        for key, version in zip(keys, versions):
+            self.stale(key, int(version))
+            if self.bus is not None:
+                try:
+                    self.bus.publish(self.name, key, int(version))
+                except Exception as e:
+                    logging.error(f"❌ Could not publish context cache invalidation {self.name}:{key}: {e}")
+        with self._lock:
+            self._metrics["invalidations"] += len(keys)
+
+    def stale(self, key: str, version: int) -> None:
+        """Replace the entry with a tombstone of `version` (the key changed)."""
+        self._store(key, version, _STALE, newer_only=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._metrics)
+            stats["entries"] = len(self._entries)
+        lookups = stats["memory_hits"] + stats["redis_hits"] + stats["loads"]
+        stats["memory_hit_rate"] = round(stats["memory_hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _redis_read(self, key: str) -> Tuple[int, Optional[list]]:
+        """The key's current version and, when the Redis copy is of that version, [value]."""
+        if not self.shared:
+            return int(self.redis.hget(self.versions_key, key) or 0), None
+        with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hget(self.versions_key, key)
+            pipe.get(self.value_key(key))
+            raw_version, raw = pipe.execute()
+        version = int(raw_version or 0)
+        if not raw:
+            return version, None
+        try:
+            cached_version, value = self.codec.decode(raw)
+        except (ValueError, TypeError) as e:
+            logging.warning(f"⚠️ Unreadable context cache entry {self.name}:{key}: {e}")
+            return version, None
+        return version, [value] if cached_version == version else None
+
+    def _store(self, key: str, version: int, value: Any, newer_only: bool = False) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] > version or (newer_only and entry[1] == version)):
+                # Loaded before a change this worker has already been told about,
+                # or the invalidation arrived after the new value was loaded
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,142 @@
+"""
+Persistent client -> conversation files index for client_data/.
+
+client_data holds conversation logs next to Excel files, JSON stores and
+reports, so finding a client's latest conversation with os.listdir() and
+os.path.getctime() costs a full directory scan per lookup. This index keeps
+conversation_index.json with, for every client key (the part of the file
+name between "conversation_" and the timestamp), the client's conversation
+files in creation order. It is updated whenever a conversation file is
+created or removed and re-read only when another worker changed it.
+"""
+
+import os
+import json
+import logging
+import threading
+from typing import List, Dict, Optional
+
+from lead_registry import conversation_key
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+
+class ConversationIndex:
+    """Maps a client key to its conversation files, oldest first."""
+
+    def __init__(self, folder: str, index_file: Optional[str] = None):
+        self.folder = folder
+        self.index_file = index_file or os.path.join(folder, "conversation_index.json")
+        self._lock = threading.RLock()
+        self._files: Dict[str, List[str]] = {}
+        self._file_state = None
+        with self._lock:
+            if not os.path.exists(self.index_file):
+                os.makedirs(os.path.dirname(self.index_file) or ".", exist_ok=True)
+                self.rebuild()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.index_file)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _refresh(self) -> None:
+        state = self._stat()
+        if state is None or state == self._file_state:
+            return
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._files = data if isinstance(data, dict) else {}
+        except (json.JSONDecodeError, IOError) as e:
+            # Callers may hold the file lock already (_modify), so rebuild in memory only;
+            # the next change writes the rebuilt index back
+            logging.error(f"Error loading conversation index, rebuilding: {e}")
+            self._files = self._scan()
+        self._file_state = state
+
+    def _write(self) -> None:
+        tmp_path = f"{self.index_file}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._files, f)
+        os.replace(tmp_path, self.index_file)
+        self._file_state = self._stat()
+
+    def _modify(self, change) -> None:
+        """Apply `change` to the freshest on-disk index under a cross-process lock."""
+        with self._lock:
+            lock_handle = None
+            try:
+                if fcntl is not None:
+                    lock_handle = open(f"{self.index_file}.lock", "w")
+                    fcntl.flock(lock_handle, fcntl.LOCK_EX)
+                self._refresh()
+                change()
+                self._write()
+            finally:
+                if lock_handle is not None:
+                    fcntl.flock(lock_handle, fcntl.LOCK_UN)
+                    lock_handle.close()
+
+    def _scan(self) -> Dict[str, List[str]]:
+        """The index as found in the folder."""
+        found: Dict[str, List[str]] = {}
+        if os.path.isdir(self.folder):
+            names = [n for n in os.listdir(self.folder) if n.startswith("conversation_") and n.endswith(".txt")]
+            names.sort(key=lambda n: os.path.getctime(os.path.join(self.folder, n)))
+            for name in names:
+                key = conversation_key(name)
+                if key:
+                    found.setdefault(key, []).append(name)
+        logging.info(f"📁 Conversation index built: {sum(len(v) for v in found.values())} files")
+        return found
+
+    def rebuild(self) -> None:
+        """Scan the folder once and rewrite the index from scratch."""
+        def scan() -> None:
+            self._files = self._scan()
+        self._modify(scan)
+
+    def register(self, filename: str) -> None:
+        """Record a newly created conversation file."""
+        key = conversation_key(filename)
+        if not key:
+            return
+        with self._lock:
+            self._refresh()
+            if filename in self._files.get(key, []):
+                return
+
+            def add() -> None:
+                files = self._files.setdefault(key, [])
+                if filename not in files:
+                    files.append(filename)
+            self._modify(add)
+
+    def remove(self, filename: str) -> None:
+        """Forget a deleted conversation file."""
+        key = conversation_key(filename)
+
+        def drop() -> None:
+            files = self._files.get(key, [])
+            if filename in files:
+                files.remove(filename)
+                if not files:
+                    del self._files[key]
+        self._modify(drop)
+
+    def files_for(self, client_key: str) -> List[str]:
+        """All conversation files of a client, oldest first."""
+        with self._lock:
+            self._refresh()
+            return list(self._files.get(client_key.replace("@", "_"), []))
+
+    def latest(self, client_key: str) -> Optional[str]:
+        """The client's most recently created conversation file, if any."""
+        files = self.files_for(client_key)
+        return files[-1] if files else None
@@ -0,0 +1,200 @@
+"""
+Append-only writer for the client_data/conversation_*.txt logs.
+
+Each chat turn carries a sequence number that keeps increasing for the life
+of a chat session (it is stored in the Redis session next to the trimmed
+history, with the session's epoch, a random id). Only the new turns are
+written, so the cost of a save no longer grows with the length of the
+conversation.
+
+A retried save of the same turns does not duplicate lines: the writer
+remembers, per file, the epoch and the numbers of the last turns written
+(in Redis, conversation_log_seq:{file}, so every worker process and a
+restarted one see it; in memory without Redis) and skips turns at or below
+them. A new epoch (after /gemini/reset or the session TTL) or numbers going
+backwards start the count over, since the conversation file outlives its
+sessions.
+
+What this covers: the job queue retrying the save_conversation job, in any
+process. A gateway retry of /gemini/train with the same message key is
+answered by idempotency.py and never reaches the log; a retry without a key,
+or after IDEMPOTENCY_TTL, runs a new turn with new numbers and is logged
+again.
+
+fsync is batched: a file is synced after CONVERSATION_FSYNC_EVERY appends or
+CONVERSATION_FSYNC_INTERVAL seconds, whichever comes first, and on shutdown.
+
+Configuration (environment):
+    CONVERSATION_SEQ_TTL  seconds the last written numbers of a file are kept in Redis (default 604800)
+"""
+
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, TextIO, Tuple
+
+CONVERSATION_FSYNC_EVERY = int(os.getenv("CONVERSATION_FSYNC_EVERY", 8))
+CONVERSATION_FSYNC_INTERVAL = float(os.getenv("CONVERSATION_FSYNC_INTERVAL", 1.0))
+CONVERSATION_MAX_OPEN_FILES = int(os.getenv("CONVERSATION_MAX_OPEN_FILES", 64))
+CONVERSATION_SEQ_TTL = int(os.getenv("CONVERSATION_SEQ_TTL", 86400 * 7))
+
+# (session epoch, first and last sequence number) of the turns last written to a file
+Position = Tuple[str, int, int]
+_NO_POSITION: Position = ("", 0, 0)
+
+
+def format_turns(turns: List[Dict[str, Any]]) -> str:
+    """Render turns in the "role: text" line format used by the log files."""
+    lines: List[str] = []
+    for entry in turns:
+        role: str = entry.get("role", "unknown")
+        for part in entry.get("parts", []):
+            lines.append(f"{role}: {part.get('text', '')}\n")
+    return "".join(lines)
+
+
+class _OpenLog:
+    def __init__(self, handle: TextIO):
+        self.handle = handle
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+
+class ConversationLogWriter:
+    """Appends new turns to conversation files exactly once per sequence number."""
+
+    def __init__(self, folder: str, redis_client=None,
+                 fsync_every: int = CONVERSATION_FSYNC_EVERY,
+                 fsync_interval: float = CONVERSATION_FSYNC_INTERVAL,
+                 max_open_files: int = CONVERSATION_MAX_OPEN_FILES,
+                 seq_ttl: int = CONVERSATION_SEQ_TTL):
+        self.folder = folder
+        self.redis = redis_client
+        self.seq_ttl = seq_ttl
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        self.max_open_files = max(1, max_open_files)
+        self._lock = threading.Lock()
+        self._open: "OrderedDict[str, _OpenLog]" = OrderedDict()
+        # Position of each file written by this process (the only one without Redis)
+        self._positions: Dict[str, Position] = {}
+        atexit.register(self.close)
+
+    @staticmethod
+    def _seq_key(filename: str) -> str:
+        return f"conversation_log_seq:{filename}"
+
+    def position(self, filename: str) -> Position:
+        """(session epoch, first, last sequence number) of the turns last written to `filename`."""
+        with self._lock:
+            return self._load_position(filename)
+
+    def last_seq(self, filename: str) -> int:
+        """Highest sequence number written to `filename` in its current session (0 if none)."""
+        return self.position(filename)[2]
+
+    def _load_position(self, filename: str) -> Position:
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(self._seq_key(filename))
+                if not raw:
+                    return _NO_POSITION
+                first, last, session = raw.decode("utf-8").split(":", 2)
+                return session, int(first), int(last)
+            except Exception as e:
+                logging.warning(f"⚠️ Conversation log position of {filename} unavailable, using this process's: {e}")
+        return self._positions.get(filename, _NO_POSITION)
+
+    def _store_position(self, filename: str, position: Position) -> None:
+        self._positions[filename] = position
+        if self.redis is not None:
+            session, first, last = position
+            try:
+                self.redis.set(self._seq_key(filename), f"{first}:{last}:{session}", ex=self.seq_ttl)
+            except Exception as e:
+                logging.warning(f"⚠️ Could not store the conversation log position of {filename}: {e}")
+
+    def _get_handle(self, filename: str) -> _OpenLog:
+        log = self._open.get(filename)
+        if log is not None and not os.path.exists(os.path.join(self.folder, filename)):
+            # The file was removed (e.g. /logs/clear); start a fresh one
+            self._close_log(self._open.pop(filename))
+            log = None
+        if log is not None:
+            self._open.move_to_end(filename)
+            return log
+        while len(self._open) >= self.max_open_files:
+            _, evicted = self._open.popitem(last=False)
+            self._close_log(evicted)
+        log = _OpenLog(open(os.path.join(self.folder, filename), "a", encoding="utf-8"))
+        self._open[filename] = log
+        return log
+
+    @staticmethod
+    def _sync(log: _OpenLog) -> None:
+        log.handle.flush()
+        os.fsync(log.handle.fileno())
+        log.unsynced = 0
+        log.last_sync = time.monotonic()
+
+    def _close_log(self, log: _OpenLog) -> None:
+        try:
+            if log.unsynced:
+                self._sync(log)
+            log.handle.close()
+        except OSError as e:
+            logging.error(f"Error closing conversation log: {e}")
+
+    def append(self, filename: str, turns: List[Dict[str, Any]], first_seq: int, session: str = "") -> int:
+        """
+        Append `turns` (numbered first_seq, first_seq + 1, ... in the chat
+        session with epoch `session`) to `filename`.
+
+        Turns of the same session whose number is not above the last one
+        written are skipped. Returns the number of turns actually written.
+        """
+        with self._lock:
+            last_session, last_first, last_seq = self._load_position(filename)
+            if session != last_session or first_seq < last_first:
+                # A new session numbers its turns from 1 again
+                last_first = last_seq = 0
+            new_turns = turns[max(0, last_seq - first_seq + 1):]
+            if not new_turns:
+                return 0
+            log = self._get_handle(filename)
+            log.handle.write(format_turns(new_turns))
+            log.handle.flush()
+            log.unsynced += 1
+            if log.unsynced >= self.fsync_every or time.monotonic() - log.last_sync >= self.fsync_interval:
+                self._sync(log)
+            self._store_position(filename, (session, first_seq, first_seq + len(turns) - 1))
+            return len(new_turns)
+
+    def forget(self, filename: str) -> None:
+        """Drop the open handle and sequence state of a deleted or reset conversation file."""
+        with self._lock:
+            log = self._open.pop(filename, None)
+            if log is not None:
+                self._close_log(log)
+            self._positions.pop(filename, None)
+            if self.redis is not None:
+                try:
+                    self.redis.delete(self._seq_key(filename))
+                except Exception as e:
+                    logging.warning(f"⚠️ Could not clear the conversation log position of {filename}: {e}")
+
+    def flush(self) -> None:
+        """fsync every open file with unsynced appends."""
+        with self._lock:
+            for log in self._open.values():
+                if log.unsynced:
+                    self._sync(log)
+
+    def close(self) -> None:
+        with self._lock:
+            while self._open:
+                _, log = self._open.popitem(last=False)
+                self._close_log(log)
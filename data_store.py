@@ -0,0 +1,503 @@
+"""
+Pluggable storage for leads, sales notes, meeting leads and MBTI assessments.
+
+Two backends are available, selected with DATA_STORE_BACKEND:
+
+- "json" (default): the original files (leads_minimal.json, lead_notes.json,
+  leads.json, student_assessments.json). Every change rewrites the file, but
+  writes are atomic (temp file + rename) so readers never see half a file.
+- "sqlite": a single SQLite database in WAL mode with indexed columns for
+  phone, email, id and last_interaction. Changes are row-level updates and
+  concurrent gunicorn workers are serialized by SQLite's own locking.
+
+The JSON files remain the import/export format: an empty SQLite database is
+seeded from the JSON files on first use, and
+
+    python data_store.py export   # SQLite -> JSON files
+    python data_store.py import   # JSON files -> SQLite
+
+move data between the two.
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from lead_registry import canonical_phone, PHONE_SUFFIX_DIGITS
+
+DATA_STORE_BACKEND = os.getenv("DATA_STORE_BACKEND", "json").lower()
+
+
+def _read_json(path: str, default: Any) -> Any:
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        logging.error(f"Error loading {path}: {e}")
+        return default
+
+
+def _write_json(path: str, data: Any, **dump_kwargs: Any) -> None:
+    """Write JSON atomically so a concurrent reader never sees a partial file."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, **dump_kwargs)
+    os.replace(tmp_path, path)
+
+
+def _file_version(path: str) -> Any:
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+class LeadStore:
+    """Storage interface for the chat server's lead data."""
+
+    # True when upsert_lead() writes a single record instead of the whole set
+    supports_row_updates = False
+
+    def load_leads(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save_leads(self, leads: List[Dict[str, Any]]) -> None:
+        """
+        Write the given leads, assigning missing ids. Stores with row updates
+        only write the leads that changed and keep leads missing from `leads`
+        (another worker may have added them); remove leads with delete_leads().
+        """
+        raise NotImplementedError
+
+    def delete_leads(self, lead_ids: List[Any]) -> None:
+        """Remove the leads with these ids."""
+        raise NotImplementedError
+
+    def upsert_lead(self, lead: Dict[str, Any]) -> None:
+        """Insert or update one lead. Assigns lead["id"] when it is missing."""
+        raise NotImplementedError
+
+    def version(self) -> Any:
+        """Opaque token that changes whenever the leads are changed by anyone."""
+        raise NotImplementedError
+
+    def changes_since(self, version: Any) -> Optional[List[Dict[str, Any]]]:
+        """Leads changed after `version`, or None if only a full reload is possible (e.g. after deletes)."""
+        return None
+
+    def load_notes(self) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def save_notes(self, notes: Dict[str, str]) -> None:
+        """Insert or update the given client_id -> notes entries."""
+        raise NotImplementedError
+
+    def load_meeting_leads(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save_meeting_leads(self, leads: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def append_meeting_lead(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Store a meeting lead, assigning entry["id"]."""
+        raise NotImplementedError
+
+
+class JsonLeadStore(LeadStore):
+    """The original JSON file layout in client_data/."""
+
+    def __init__(self, folder: str):
+        self.leads_file = os.path.join(folder, "leads_minimal.json")
+        self.notes_file = os.path.join(folder, "lead_notes.json")
+        self.meeting_leads_file = os.path.join(folder, "leads.json")
+        self._lock = threading.Lock()
+
+    def load_leads(self) -> List[Dict[str, Any]]:
+        data = _read_json(self.leads_file, [])
+        if not isinstance(data, list):
+            logging.error(f"Leads file {self.leads_file} does not contain a JSON list")
+            return []
+        return data
+
+    def save_leads(self, leads: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            _write_json(self.leads_file, leads, indent=2)
+
+    def delete_leads(self, lead_ids: List[Any]) -> None:
+        with self._lock:
+            leads = [lead for lead in self.load_leads() if lead.get("id") not in lead_ids]
+            _write_json(self.leads_file, leads, indent=2)
+
+    def upsert_lead(self, lead: Dict[str, Any]) -> None:
+        with self._lock:
+            leads = self.load_leads()
+            if lead.get("id") is None:
+                lead["id"] = max([l.get("id", 0) for l in leads if isinstance(l.get("id"), int)] + [0]) + 1
+            for i, existing in enumerate(leads):
+                if existing.get("id") == lead["id"]:
+                    leads[i] = lead
+                    break
+            else:
+                leads.append(lead)
+            _write_json(self.leads_file, leads, indent=2)
+
+    def version(self) -> Any:
+        return _file_version(self.leads_file)
+
+    def load_notes(self) -> Dict[str, str]:
+        data = _read_json(self.notes_file, {})
+        return data if isinstance(data, dict) else {}
+
+    def save_notes(self, notes: Dict[str, str]) -> None:
+        with self._lock:
+            all_notes = self.load_notes()
+            all_notes.update(notes)
+            _write_json(self.notes_file, all_notes, indent=2)
+
+    def load_meeting_leads(self) -> List[Dict[str, Any]]:
+        data = _read_json(self.meeting_leads_file, [])
+        return data if isinstance(data, list) else []
+
+    def save_meeting_leads(self, leads: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            _write_json(self.meeting_leads_file, leads, indent=4)
+
+    def append_meeting_lead(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            leads = self.load_meeting_leads()
+            entry["id"] = len(leads) + 1
+            leads.append(entry)
+            _write_json(self.meeting_leads_file, leads, indent=4)
+        return entry
+
+
+class _SqliteDatabase:
+    """One WAL-mode SQLite connection per thread."""
+
+    def __init__(self, path: str, schema: str):
+        self.path = path
+        self._schema = schema
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection().executescript(schema)
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def write(self):
+        """Context manager for a write transaction (BEGIN IMMEDIATE ... COMMIT)."""
+        return _WriteTransaction(self.connection())
+
+
+class _WriteTransaction:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+
+
+LEADS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leads (
+    id INTEGER PRIMARY KEY,
+    phone TEXT,
+    phone_key TEXT,
+    email TEXT,
+    last_interaction TEXT,
+    rev INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leads_phone_key ON leads(phone_key);
+CREATE INDEX IF NOT EXISTS idx_leads_email ON leads(email);
+CREATE INDEX IF NOT EXISTS idx_leads_last_interaction ON leads(last_interaction);
+CREATE INDEX IF NOT EXISTS idx_leads_rev ON leads(rev);
+
+-- Ids of deleted leads and the rev that deleted them, so changes_since() notices
+CREATE TABLE IF NOT EXISTS lead_deletions (
+    id INTEGER PRIMARY KEY,
+    rev INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS lead_notes (
+    client_id TEXT PRIMARY KEY,
+    notes TEXT NOT NULL,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS meeting_leads (
+    id INTEGER PRIMARY KEY,
+    source_client_id TEXT,
+    timestamp TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_meeting_leads_client ON meeting_leads(source_client_id);
+CREATE INDEX IF NOT EXISTS idx_meeting_leads_timestamp ON meeting_leads(timestamp);
+"""
+
+
+_UPSERT_LEAD = """
+INSERT INTO leads (id, phone, phone_key, email, last_interaction, rev, data) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET phone = excluded.phone, phone_key = excluded.phone_key, email = excluded.email,
+    last_interaction = excluded.last_interaction, rev = excluded.rev, data = excluded.data
+"""
+
+
+class SqliteLeadStore(LeadStore):
+    """Leads, notes and meeting leads in one SQLite (WAL) database."""
+
+    supports_row_updates = True
+
+    def __init__(self, path: str, import_folder: Optional[str] = None):
+        self.db = _SqliteDatabase(path, LEADS_SCHEMA)
+        if import_folder and self._is_empty():
+            import_json_leads(JsonLeadStore(import_folder), self)
+
+    def _is_empty(self) -> bool:
+        conn = self.db.connection()
+        for table in ("leads", "lead_notes", "meeting_leads"):
+            if conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                return False
+        return True
+
+    @staticmethod
+    def _next_rev(conn: sqlite3.Connection) -> int:
+        return conn.execute(
+            "SELECT MAX((SELECT COALESCE(MAX(rev), 0) FROM leads), (SELECT COALESCE(MAX(rev), 0) FROM lead_deletions)) + 1"
+        ).fetchone()[0]
+
+    @staticmethod
+    def _lead_row(lead: Dict[str, Any], rev: int) -> tuple:
+        phone = canonical_phone(lead.get("phone"))
+        return (
+            lead.get("id"),
+            phone,
+            phone[-PHONE_SUFFIX_DIGITS:] if phone else None,
+            (lead.get("email") or "").strip().lower() or None,
+            lead.get("last_interaction") or None,
+            rev,
+            json.dumps(lead, ensure_ascii=False),
+        )
+
+    def load_leads(self) -> List[Dict[str, Any]]:
+        rows = self.db.connection().execute("SELECT data FROM leads ORDER BY id").fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def _upsert(self, conn: sqlite3.Connection, lead: Dict[str, Any], rev: int) -> None:
+        if lead.get("id") is None:
+            lead["id"] = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM leads").fetchone()[0]
+        conn.execute(_UPSERT_LEAD, self._lead_row(lead, rev))
+
+    def save_leads(self, leads: List[Dict[str, Any]]) -> None:
+        with self.db.write() as conn:
+            rev = self._next_rev(conn)
+            stored = {row["id"]: row["data"] for row in conn.execute("SELECT id, data FROM leads")}
+            for lead in leads:
+                # Unchanged leads keep their rev, so changes_since() stays small
+                if lead.get("id") is not None and stored.get(lead["id"]) == json.dumps(lead, ensure_ascii=False):
+                    continue
+                self._upsert(conn, lead, rev)
+                stored[lead["id"]] = json.dumps(lead, ensure_ascii=False)
+
+    def delete_leads(self, lead_ids: List[Any]) -> None:
+        with self.db.write() as conn:
+            rev = self._next_rev(conn)
+            for lead_id in lead_ids:
+                conn.execute("DELETE FROM leads WHERE id = ?", (lead_id,))
+                conn.execute("INSERT OR REPLACE INTO lead_deletions (id, rev) VALUES (?, ?)", (lead_id, rev))
+
+    def upsert_lead(self, lead: Dict[str, Any]) -> None:
+        with self.db.write() as conn:
+            self._upsert(conn, lead, self._next_rev(conn))
+
+    def version(self) -> Any:
+        return self._next_rev(self.db.connection()) - 1
+
+    def changes_since(self, version: Any) -> Optional[List[Dict[str, Any]]]:
+        if not isinstance(version, int):
+            return None
+        conn = self.db.connection()
+        if conn.execute("SELECT 1 FROM lead_deletions WHERE rev > ? LIMIT 1", (version,)).fetchone():
+            return None
+        rows = conn.execute("SELECT data FROM leads WHERE rev > ? ORDER BY id", (version,)).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def load_notes(self) -> Dict[str, str]:
+        rows = self.db.connection().execute("SELECT client_id, notes FROM lead_notes").fetchall()
+        return {row["client_id"]: row["notes"] for row in rows}
+
+    def save_notes(self, notes: Dict[str, str]) -> None:
+        now = datetime.now().isoformat()
+        with self.db.write() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO lead_notes (client_id, notes, updated_at) VALUES (?, ?, ?)",
+                [(str(client_id), text, now) for client_id, text in notes.items()],
+            )
+
+    def load_meeting_leads(self) -> List[Dict[str, Any]]:
+        rows = self.db.connection().execute("SELECT data FROM meeting_leads ORDER BY id").fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def save_meeting_leads(self, leads: List[Dict[str, Any]]) -> None:
+        with self.db.write() as conn:
+            conn.execute("DELETE FROM meeting_leads")
+            seen = set()
+            for entry in leads:
+                if entry.get("id") in seen:
+                    # leads.json may repeat an id: keep both meetings, the later one under a new id
+                    entry["id"] = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM meeting_leads").fetchone()[0]
+                seen.add(entry.get("id"))
+                conn.execute(
+                    "INSERT INTO meeting_leads (id, source_client_id, timestamp, data) VALUES (?, ?, ?, ?)",
+                    (entry.get("id"), entry.get("source_client_id"), entry.get("timestamp"), json.dumps(entry, ensure_ascii=False)),
+                )
+
+    def append_meeting_lead(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        with self.db.write() as conn:
+            entry["id"] = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM meeting_leads").fetchone()[0]
+            conn.execute(
+                "INSERT INTO meeting_leads (id, source_client_id, timestamp, data) VALUES (?, ?, ?, ?)",
+                (entry["id"], entry.get("source_client_id"), entry.get("timestamp"), json.dumps(entry, ensure_ascii=False)),
+            )
+        return entry
+
+
+class AssessmentStore:
+    """Storage interface for completed MBTI assessments."""
+
+    def load_assessments(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def add_assessment(self, assessment: Dict[str, Any]) -> Dict[str, Any]:
+        """Store an assessment, assigning assessment["id"]."""
+        raise NotImplementedError
+
+    def get_assessment(self, assessment_id: int) -> Optional[Dict[str, Any]]:
+        return next((a for a in self.load_assessments() if a.get("id") == assessment_id), None)
+
+
+class JsonAssessmentStore(AssessmentStore):
+    def __init__(self, folder: str):
+        self.assessments_file = os.path.join(folder, "student_assessments.json")
+        self._lock = threading.Lock()
+
+    def load_assessments(self) -> List[Dict[str, Any]]:
+        data = _read_json(self.assessments_file, [])
+        return data if isinstance(data, list) else []
+
+    def add_assessment(self, assessment: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            assessments = self.load_assessments()
+            assessment["id"] = len(assessments) + 1
+            assessments.append(assessment)
+            _write_json(self.assessments_file, assessments, indent=4)
+        return assessment
+
+
+ASSESSMENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS assessments (
+    id INTEGER PRIMARY KEY,
+    student_id TEXT,
+    timestamp TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_assessments_student ON assessments(student_id);
+"""
+
+
+class SqliteAssessmentStore(AssessmentStore):
+    def __init__(self, path: str, import_folder: Optional[str] = None):
+        self.db = _SqliteDatabase(path, ASSESSMENTS_SCHEMA)
+        if import_folder and not self.db.connection().execute("SELECT 1 FROM assessments LIMIT 1").fetchone():
+            for assessment in JsonAssessmentStore(import_folder).load_assessments():
+                self._insert(assessment)
+
+    def _insert(self, assessment: Dict[str, Any]) -> None:
+        with self.db.write() as conn:
+            if assessment.get("id") is None:
+                assessment["id"] = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM assessments").fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO assessments (id, student_id, timestamp, data) VALUES (?, ?, ?, ?)",
+                (assessment["id"], assessment.get("student_id"), assessment.get("timestamp"), json.dumps(assessment, ensure_ascii=False)),
+            )
+
+    def load_assessments(self) -> List[Dict[str, Any]]:
+        rows = self.db.connection().execute("SELECT data FROM assessments ORDER BY id").fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def add_assessment(self, assessment: Dict[str, Any]) -> Dict[str, Any]:
+        assessment.pop("id", None)
+        self._insert(assessment)
+        return assessment
+
+    def get_assessment(self, assessment_id: int) -> Optional[Dict[str, Any]]:
+        row = self.db.connection().execute("SELECT data FROM assessments WHERE id = ?", (assessment_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+
+def import_json_leads(source: JsonLeadStore, target: LeadStore) -> None:
+    """Copy leads, notes and meeting leads from the JSON files into another store."""
+    target.save_leads(source.load_leads())
+    notes = source.load_notes()
+    if notes:
+        target.save_notes(notes)
+    target.save_meeting_leads(source.load_meeting_leads())
+    logging.info(f"Imported JSON lead data from {os.path.dirname(source.leads_file)}")
+
+
+def export_json_leads(source: LeadStore, target: JsonLeadStore) -> None:
+    """Write a store's contents out in the original JSON file format."""
+    target.save_leads(source.load_leads())
+    _write_json(target.notes_file, source.load_notes(), indent=2)
+    target.save_meeting_leads(source.load_meeting_leads())
+    logging.info(f"Exported lead data to {os.path.dirname(target.leads_file)}")
+
+
+def create_lead_store(folder: str) -> LeadStore:
+    """Build the lead store selected by DATA_STORE_BACKEND."""
+    if DATA_STORE_BACKEND == "sqlite":
+        db_path = os.getenv("LEADS_DB_PATH", os.path.join(folder, "leads.db"))
+        return SqliteLeadStore(db_path, import_folder=folder)
+    return JsonLeadStore(folder)
+
+
+def create_assessment_store(folder: str) -> AssessmentStore:
+    """Build the assessment store selected by DATA_STORE_BACKEND."""
+    if DATA_STORE_BACKEND == "sqlite":
+        db_path = os.getenv("ASSESSMENTS_DB_PATH", os.path.join(folder, "assessments.db"))
+        return SqliteAssessmentStore(db_path, import_folder=folder)
+    return JsonAssessmentStore(folder)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    folder = sys.argv[2] if len(sys.argv) > 2 else "client_data"
+    db_path = os.getenv("LEADS_DB_PATH", os.path.join(folder, "leads.db"))
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        export_json_leads(SqliteLeadStore(db_path), JsonLeadStore(folder))
+    elif len(sys.argv) > 1 and sys.argv[1] == "import":
+        import_json_leads(JsonLeadStore(folder), SqliteLeadStore(db_path))
+    else:
+        print("Usage: python data_store.py [export|import] [client_data folder]")
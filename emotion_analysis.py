@@ -1,16 +1,13 @@
 from flask import Flask, request, jsonify
-from transformers import pipeline
-import torch
 import numpy as np
 
+from emotion_service import EMOTION_MAX_BATCH_TEXTS, GO_EMOTIONS_MODEL, classify
+
 app = Flask(__name__)
 
-# Initialize emotion classifier
-emotion_classifier = pipeline(
-    "text-classification",
-    model="SamLowe/roberta-base-go_emotions",
-    return_all_scores=True
-)
+def emotion_classifier(text):
+    """go_emotions scores for `text`, from the shared emotion service (loaded on first use)"""
+    return classify(GO_EMOTIONS_MODEL, [text])
 
 def normalize_emotions(emotions):
     """Convert raw emotion scores to probabilities."""
@@ -25,6 +22,47 @@ def softmax(x):
     e_x = np.exp(x - np.max(x))
     return e_x / e_x.sum()
 
+def simplify_emotions(emotion_scores):
+    """Map the go_emotions labels to five simpler categories that sum to 1."""
+    simplified_emotions = {
+        'joy': sum([
+            emotion_scores.get('admiration', 0),
+            emotion_scores.get('joy', 0),
+            emotion_scores.get('amusement', 0),
+            emotion_scores.get('gratitude', 0)
+        ]),
+        'sadness': sum([
+            emotion_scores.get('sadness', 0),
+            emotion_scores.get('disappointment', 0),
+            emotion_scores.get('grief', 0)
+        ]),
+        'anger': sum([
+            emotion_scores.get('anger', 0),
+            emotion_scores.get('annoyance', 0),
+            emotion_scores.get('disapproval', 0)
+        ]),
+        'fear': sum([
+            emotion_scores.get('fear', 0),
+            emotion_scores.get('nervousness', 0),
+            emotion_scores.get('anxiety', 0)
+        ]),
+        'neutral': emotion_scores.get('neutral', 0)
+    }
+
+    # Normalize simplified emotions
+    total = sum(simplified_emotions.values())
+    if total > 0:
+        simplified_emotions = {k: v/total for k, v in simplified_emotions.items()}
+    return simplified_emotions
+
+def emotion_result(emotions):
+    """Response entry for the scores of one text."""
+    emotion_scores = {label: float(score) for label, score in normalize_emotions(emotions).items()}
+    return {
+        'emotions': simplify_emotions(emotion_scores),
+        'raw_emotions': emotion_scores
+    }
+
 @app.route('/analyze/emotions', methods=['POST'])
 def analyze_emotions():
     try:
@@ -36,46 +74,24 @@ def analyze_emotions():
 
         # Get emotion predictions
         emotions = emotion_classifier(text)
-        
-        # Normalize and simplify emotions
-        emotion_scores = normalize_emotions(emotions)
-        
-        # Map complex emotions to simpler categories
-        simplified_emotions = {
-            'joy': sum([
-                emotion_scores.get('admiration', 0),
-                emotion_scores.get('joy', 0),
-                emotion_scores.get('amusement', 0),
-                emotion_scores.get('gratitude', 0)
-            ]),
-            'sadness': sum([
-                emotion_scores.get('sadness', 0),
-                emotion_scores.get('disappointment', 0),
-                emotion_scores.get('grief', 0)
-            ]),
-            'anger': sum([
-                emotion_scores.get('anger', 0),
-                emotion_scores.get('annoyance', 0),
-                emotion_scores.get('disapproval', 0)
-            ]),
-            'fear': sum([
-                emotion_scores.get('fear', 0),
-                emotion_scores.get('nervousness', 0),
-                emotion_scores.get('anxiety', 0)
-            ]),
-            'neutral': emotion_scores.get('neutral', 0)
-        }
 
-        # Normalize simplified emotions
-        total = sum(simplified_emotions.values())
-        if total > 0:
-            simplified_emotions = {k: v/total for k, v in simplified_emotions.items()}
+        return jsonify(emotion_result(emotions))
 
-        return jsonify({
-            'emotions': simplified_emotions,
-            'raw_emotions': emotion_scores
-        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
+@app.route('/analyze/emotions/batch', methods=['POST'])
+def analyze_emotions_batch():
+    """{"texts": [...]} -> {"results": [{"emotions", "raw_emotions"} per text]}, one model call."""
+    data = request.get_json(silent=True)
+    texts = data.get('texts') if isinstance(data, dict) else None
+    if not isinstance(texts, list) or not texts or not all(isinstance(text, str) and text for text in texts):
+        return jsonify({'error': "'texts' must be a non-empty list of texts"}), 400
+    if len(texts) > EMOTION_MAX_BATCH_TEXTS:
+        return jsonify({'error': f'At most {EMOTION_MAX_BATCH_TEXTS} texts per request'}), 400
+
+    try:
+        return jsonify({'results': [emotion_result([scores]) for scores in classify(GO_EMOTIONS_MODEL, texts)]})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,455 @@
+"""
+Process-shared emotion inference service.
+
+Every gunicorn worker used to load its own copy of a RoBERTa emotion model
+(app.py: j-hartmann/emotion-english-distilroberta-base, emotion_analysis.py:
+SamLowe/roberta-base-go_emotions), so memory grew with the worker count.
+Instead one local service process holds the models and the workers send it
+texts over a Unix socket (multiprocessing.connection, pickled dicts):
+
+    python emotion_service.py                 # run it yourself (systemd, compose, ...)
+
+or leave it to the first worker that needs a prediction: with
+EMOTION_SERVICE_AUTOSTART=1 the client starts the service in its own session
+(one process per host, guarded by a lock file) and it outlives the worker.
+
+The socket, its lock file and its key file live in a directory only this
+user may write to ($XDG_RUNTIME_DIR, else run/ next to this file, created
+0700), since pickles are only safe between processes that trust each other.
+Both sides authenticate with a shared key (EMOTION_SERVICE_AUTHKEY, else a
+random key in {socket}.key, created 0600 on first use), and a client only
+connects to a socket owned by its own user.
+A model is loaded on its first request, so an idle deployment never pays for
+transformers at all.
+
+Concurrent requests are micro-batched: a model's batcher thread collects the
+texts that arrive within EMOTION_BATCH_WAIT_MS of the oldest waiting one (or
+until EMOTION_BATCH_SIZE texts are waiting) and runs them through the
+pipeline as one padded batch, which uses the matrix units far better than
+one text per forward pass.
+
+    classify(EMOTION_MODEL, ["I love it"]) -> [[{"label": "joy", "score": 0.97}, ...]]
+
+Configuration (environment):
+    EMOTION_SERVICE_SOCKET     Unix socket path; empty runs the models in-process
+                               (default $XDG_RUNTIME_DIR/chatimjd-emotion.sock, else run/emotion.sock)
+    EMOTION_SERVICE_AUTHKEY    key shared by the service and its clients (default: the {socket}.key file)
+    EMOTION_SERVICE_AUTOSTART  start the service on first use when it is not running (default 1)
+    EMOTION_SERVICE_TIMEOUT    seconds to wait for a prediction (default 30)
+    EMOTION_LOAD_TIMEOUT       seconds to wait for the service and a model to come up (default 180)
+    EMOTION_BATCH_SIZE         most texts per forward pass (default 32)
+    EMOTION_BATCH_WAIT_MS      how long a text may wait for others to join its batch (default 10)
+    EMOTION_MAX_BATCH_TEXTS    most texts per /analyze/emotions/batch request (default 256)
+"""
+
+import os
+import sys
+import time
+import fcntl
+import socket
+import logging
+import argparse
+import threading
+import subprocess
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Callable, Dict, List, Optional
+
+from startup import Lazy
+
+
+
+def default_socket_path() -> str:
+    """$XDG_RUNTIME_DIR/chatimjd-emotion.sock, else run/emotion.sock next to this file."""
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "chatimjd-emotion.sock")
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "run", "emotion.sock")
+
+
+EMOTION_SERVICE_SOCKET = os.getenv("EMOTION_SERVICE_SOCKET", default_socket_path())
+EMOTION_SERVICE_AUTHKEY = os.getenv("EMOTION_SERVICE_AUTHKEY", "")
+EMOTION_SERVICE_AUTOSTART = os.getenv("EMOTION_SERVICE_AUTOSTART", "1") == "1"
+EMOTION_SERVICE_TIMEOUT = float(os.getenv("EMOTION_SERVICE_TIMEOUT", 30))
+EMOTION_LOAD_TIMEOUT = float(os.getenv("EMOTION_LOAD_TIMEOUT", 180))
+EMOTION_BATCH_SIZE = int(os.getenv("EMOTION_BATCH_SIZE", 32))
+EMOTION_BATCH_WAIT_MS = float(os.getenv("EMOTION_BATCH_WAIT_MS", 10))
+# Most texts one /analyze/emotions/batch request may send
+EMOTION_MAX_BATCH_TEXTS = int(os.getenv("EMOTION_MAX_BATCH_TEXTS", 256))
+
+# Model of app.analyze_emotion and of emotion_analysis.py
+EMOTION_MODEL = "j-hartmann/emotion-english-distilroberta-base"
+GO_EMOTIONS_MODEL = "SamLowe/roberta-base-go_emotions"
+
+# Only these models are served, so a client cannot make the service download others
+SERVED_MODELS = (EMOTION_MODEL, GO_EMOTIONS_MODEL)
+
+Scores = List[Dict[str, Any]]
+
+
+class EmotionServiceError(Exception):
+    """The service is unreachable, timed out or could not classify the texts."""
+
+
+def _check_private(path: str, what: str, writable_mode: int = 0o022) -> os.stat_result:
+    info = os.lstat(path)
+    if info.st_uid != os.getuid():
+        raise EmotionServiceError(f"{what} {path} is owned by another user")
+    if info.st_mode & writable_mode:
+        raise EmotionServiceError(f"{what} {path} is accessible to other users")
+    return info
+
+
+def private_dir(address: str) -> str:
+    """The socket's directory, created 0700; raises when other users could write to it."""
+    directory = os.path.dirname(os.path.abspath(address))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    _check_private(directory, "Emotion service directory")
+    return directory
+
+
+def load_authkey(address: str) -> bytes:
+    """EMOTION_SERVICE_AUTHKEY, else the key in {address}.key (created 0600 on first use)."""
+    if EMOTION_SERVICE_AUTHKEY:
+        return EMOTION_SERVICE_AUTHKEY.encode("utf-8")
+    private_dir(address)
+    path = f"{address}.key"
+    if not os.path.exists(path):
+        # Written aside and linked into place, so a concurrent reader never sees half a key
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(os.urandom(32).hex().encode("ascii"))
+        try:
+            os.link(temp, path)
+        except FileExistsError:
+            pass  # Another process created it first
+        finally:
+            os.unlink(temp)
+    _check_private(path, "Emotion service key file", 0o077)
+    with open(path, "rb") as f:
+        return f.read().strip()
+
+
+def _is_listening(address: str) -> bool:
+    """Whether something accepts connections on `address` (without the key handshake)."""
+    probe = socket.socket(socket.AF_UNIX)
+    try:
+        probe.connect(address)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def load_pipeline(model: str) -> Callable[..., List[Scores]]:
+    """The Hugging Face text-classification pipeline for `model` (all scores per text)."""
+    from transformers import pipeline
+
+    logging.info(f"🧠 Loading emotion model {model}")
+    return pipeline("text-classification", model=model, return_all_scores=True)
+
+
+def run_model(classifier: Callable[..., List[Scores]], texts: List[str],
+              batch_size: int = EMOTION_BATCH_SIZE) -> List[Scores]:
+    """Plain [[{"label", "score"}, ...] per text] from a pipeline, `batch_size` texts per forward pass."""
+    scores_per_text = classifier(texts, batch_size=max(1, min(batch_size, len(texts))))
+    return [[{"label": item["label"], "score": float(item["score"])} for item in scores]
+            for scores in scores_per_text]
+
+
+class MicroBatcher:
+    """
+    Runs concurrent submit() calls through `run` together: waits up to
+    `max_wait` seconds after the oldest pending request, or until `max_batch`
+    texts are pending, then runs their texts as one batch.
+    """
+
+    def __init__(self, run: Callable[[List[str]], List[Scores]], max_batch: int = EMOTION_BATCH_SIZE,
+                 max_wait: float = EMOTION_BATCH_WAIT_MS / 1000):
+        self.run = run
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        # (texts, arrival time, future) in arrival order
+        self._pending: List[tuple] = []
+        self._pending_texts = 0
+        self._cond = threading.Condition()
+        self._pid: Optional[int] = None
+
+    def submit(self, texts: List[str]) -> List[Scores]:
+        """Scores for `texts`, computed in a shared batch."""
+        if not texts:
+            return []
+        future: "Future[List[Scores]]" = Future()
+        with self._cond:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pending, self._pending_texts = [], 0
+                threading.Thread(target=self._loop, name="emotion-batcher", daemon=True).start()
+            self._pending.append((texts, time.monotonic(), future))
+            self._pending_texts += len(texts)
+            self._cond.notify()
+        return future.result()
+
+    def _next_batch(self) -> List[tuple]:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            run_at = self._pending[0][1] + self.max_wait
+            while self._pending_texts < self.max_batch:
+                remaining = run_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            # At least one request; a request bigger than max_batch runs on its own
+            batch, size = [], 0
+            while self._pending and (not batch or size + len(self._pending[0][0]) <= self.max_batch):
+                request = self._pending.pop(0)
+                batch.append(request)
+                size += len(request[0])
+            self._pending_texts -= size
+            return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._next_batch()
+            texts = [text for request in batch for text in request[0]]
+            try:
+                results = self.run(texts)
+            except BaseException as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for request_texts, _, future in batch:
+                future.set_result(results[start:start + len(request_texts)])
+                start += len(request_texts)
+
+
+class ModelRunner:
+    """The served models, each loaded on first use and fed by its own MicroBatcher."""
+
+    def __init__(self, load: Callable[[str], Callable[..., List[Scores]]] = load_pipeline,
+                 max_batch: int = EMOTION_BATCH_SIZE, max_wait: float = EMOTION_BATCH_WAIT_MS / 1000):
+        self.models: Dict[str, Lazy] = {model: Lazy(lambda model=model: load(model)) for model in SERVED_MODELS}
+        self.batchers = {
+            model: MicroBatcher(lambda texts, model=model: run_model(self.models[model].get(), texts, max_batch),
+                                max_batch, max_wait)
+            for model in SERVED_MODELS
+        }
+
+    def classify(self, model: str, texts: List[str]) -> List[Scores]:
+        if model not in self.batchers:
+            raise EmotionServiceError(f"Model {model} is not served")
+        return self.batchers[model].submit(texts)
+
+
+class EmotionServer:
+    """
+    Serves classify requests on a Unix socket, one thread per connected
+    worker; the requests of all workers are micro-batched per model.
+    """
+
+    def __init__(self, address: str = EMOTION_SERVICE_SOCKET, runner: Optional[ModelRunner] = None,
+                 authkey: Optional[bytes] = None):
+        self.address = address
+        self.runner = runner or ModelRunner()
+        self.authkey = authkey
+        self._listener: Optional[Listener] = None
+        self._closed = threading.Event()
+
+    def bind(self) -> None:
+        private_dir(self.address)
+        if self.authkey is None:
+            self.authkey = load_authkey(self.address)
+        if os.path.exists(self.address):
+            if _is_listening(self.address):
+                raise EmotionServiceError(f"An emotion service is already listening on {self.address}")
+            os.unlink(self.address)  # Left behind by a service that died
+        self._listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        os.chmod(self.address, 0o600)
+
+    def serve_forever(self) -> None:
+        if self._listener is None:
+            self.bind()
+        logging.info(f"🧠 Emotion service listening on {self.address}")
+        while not self._closed.is_set():
+            try:
+                conn = self._listener.accept()
+            except (AuthenticationError, EOFError, ConnectionError) as e:
+                # The key handshake failed: drop that connection, keep serving
+                if self._closed.is_set():
+                    break
+                logging.warning(f"⚠️ Rejected emotion service connection: {e!r}")
+                continue
+            except OSError:
+                if self._closed.is_set():
+                    break
+                raise
+            if self._closed.is_set():
+                conn.close()
+                break
+            threading.Thread(target=self._serve, args=(conn,), name="emotion-conn", daemon=True).start()
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._listener is not None:
+            # Wake up accept() so serve_forever() returns
+            _is_listening(self.address)
+            self._listener.close()
+
+    def _serve(self, conn: Connection) -> None:
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply: Dict[str, Any] = {"results": self.runner.classify(request["model"], list(request["texts"]))}
+                except Exception as e:
+                    logging.error(f"❌ Emotion classification failed: {e}")
+                    reply = {"error": str(e)}
+                try:
+                    conn.send(reply)
+                except OSError:
+                    return
+
+
+class EmotionServiceClient:
+    """
+    Thread-safe client of the shared service: one connection per thread,
+    re-established after the service restarts or this process forks.
+    """
+
+    def __init__(self, address: str = EMOTION_SERVICE_SOCKET, autostart: bool = EMOTION_SERVICE_AUTOSTART,
+                 timeout: float = EMOTION_SERVICE_TIMEOUT, load_timeout: float = EMOTION_LOAD_TIMEOUT,
+                 authkey: Optional[bytes] = None):
+        self.address = address
+        self.authkey = authkey
+        self.autostart = autostart
+        self.timeout = timeout
+        self.load_timeout = load_timeout
+        self._local = threading.local()
+        self._loaded_models: set = set()
+
+    def classify(self, model: str, texts: List[str]) -> List[Scores]:
+        """Scores for each of `texts`; raises EmotionServiceError."""
+        # The first request for a model waits for it to load
+        timeout = self.timeout if model in self._loaded_models else max(self.timeout, self.load_timeout)
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.send({"model": model, "texts": texts})
+                if not conn.poll(timeout):
+                    self._drop()
+                    raise EmotionServiceError(f"No reply from the emotion service within {timeout:.0f}s")
+                reply = conn.recv()
+                break
+            except (EOFError, OSError) as e:
+                # The service restarted since this connection was opened: reconnect once
+                self._drop()
+                if attempt:
+                    raise EmotionServiceError(f"Emotion service connection lost: {e}")
+        if "error" in reply:
+            raise EmotionServiceError(reply["error"])
+        self._loaded_models.add(model)
+        return reply["results"]
+
+    def _connection(self) -> Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        try:
+            conn = self._connect()
+        except OSError:
+            if not self.autostart:
+                raise EmotionServiceError(f"Emotion service is not running on {self.address}")
+            conn = self._start_service()
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _connect(self) -> Connection:
+        """Connect to the service if its socket belongs to this user; OSError when it is not running."""
+        if self.authkey is None:
+            self.authkey = load_authkey(self.address)
+        if os.path.exists(self.address):
+            _check_private(self.address, "Emotion service socket", 0)
+        try:
+            return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        except AuthenticationError as e:
+            raise EmotionServiceError(f"Emotion service on {self.address} rejected the key: {e}")
+
+    def _drop(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _start_service(self) -> Connection:
+        """Start the service (one process per host) and connect to it."""
+        private_dir(self.address)
+        fd = os.open(f"{self.address}.lock", os.O_WRONLY | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        with os.fdopen(fd, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Another worker may have started it while this one waited for the lock
+                return self._connect()
+            except OSError:
+                pass
+            logging.info(f"🧠 Starting emotion service on {self.address}")
+            subprocess.Popen([sys.executable, os.path.abspath(__file__), "--socket", self.address],
+                             stdin=subprocess.DEVNULL, start_new_session=True)
+            give_up_at = time.monotonic() + self.load_timeout
+            while time.monotonic() < give_up_at:
+                try:
+                    return self._connect()
+                except OSError:
+                    time.sleep(0.1)
+        raise EmotionServiceError(f"Emotion service did not start on {self.address}")
+
+
+class _InProcessModels(ModelRunner):
+    """EMOTION_SERVICE_SOCKET="": the models are loaded in this process (one copy per worker)."""
+
+    def classify(self, model: str, texts: List[str]) -> List[Scores]:
+        try:
+            return super().classify(model, texts)
+        except ImportError as e:
+            raise EmotionServiceError(f"transformers not installed: {e}")
+
+
+_default_client = Lazy(lambda: EmotionServiceClient() if EMOTION_SERVICE_SOCKET else _InProcessModels())
+
+
+def classify(model: str, texts: List[str]) -> List[Scores]:
+    """Scores per text from the shared service (or in-process when no socket is configured)."""
+    return _default_client.classify(model, texts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Shared emotion inference service")
+    parser.add_argument("--socket", default=EMOTION_SERVICE_SOCKET or default_socket_path())
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s emotion-service %(levelname)s %(message)s")
+    server = EmotionServer(args.socket)
+    try:
+        server.bind()
+    except EmotionServiceError as e:
+        logging.info(str(e))
+        return
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
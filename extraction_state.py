@@ -0,0 +1,180 @@
+"""
+Incremental client-info extraction for conversation files.
+
+Extracting the client's name, phone, email and summary tags used to mean
+reading the whole conversation file and running every regex over it on each
+turn. The results only depend on the first match of each pattern and on
+whether a few keywords were seen (see client_extraction.py), so they can be
+kept per conversation and updated with just the text appended since the
+last turn. ExtractionStateStore remembers, per conversation file, what has
+been found so far and the byte offset already processed, in memory and in
+conversation_meta/<file>.extract.json.
+"""
+
+import os
+import json
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+
+from client_extraction import CLIENT_INFO_ENGINE, OFFICIAL_EMAIL
+
+MAX_TRACKED_EMAILS = 20
+
+# Summary tag -> keyword group that sets it (see keyword_matcher.py)
+SUMMARY_TAGS = {
+    "Interested in services": "services",
+    "Asked about pricing": "pricing",
+    "Requested meeting": "meeting_request",
+}
+
+
+class ExtractionState:
+    """What has been extracted from one conversation so far."""
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        data = data or {}
+        self.offset: int = data.get("offset", 0)
+        self.chars_seen: int = data.get("chars_seen", 0)
+        self.names: List[Optional[str]] = data.get("names") or [None] * len(CLIENT_INFO_ENGINE.name_rules)
+        self.phone: Optional[str] = data.get("phone")
+        self.emails: List[str] = data.get("emails", [])
+        self.tags: List[str] = data.get("tags", [])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "offset": self.offset,
+            "chars_seen": self.chars_seen,
+            "names": self.names,
+            "phone": self.phone,
+            "emails": self.emails,
+            "tags": self.tags,
+        }
+
+    def observe(self, text: str) -> None:
+        """
+        Fold new conversation text into the state.
+
+        Only the first match of each pattern matters, so observing the same
+        text twice does not change the result.
+        """
+        if not text:
+            return
+        self.chars_seen += len(text)
+        # Rules after the one that already gave a name can no longer win
+        best = next((i for i, name in enumerate(self.names) if name), None)
+        found = CLIENT_INFO_ENGINE.scan(text, name_rules=best)
+
+        for i, name in enumerate(found.names):
+            if self.names[i] is None and name:
+                self.names[i] = name
+
+        if self.phone is None and found.phone:
+            self.phone = found.phone
+
+        for email in found.emails:
+            if len(self.emails) >= MAX_TRACKED_EMAILS:
+                break
+            if email not in self.emails:
+                self.emails.append(email)
+
+        for tag, group in SUMMARY_TAGS.items():
+            if tag not in self.tags and group in found.keywords:
+                self.tags.append(tag)
+
+    @property
+    def name(self) -> Optional[str]:
+        return next((name for name in self.names if name), None)
+
+    @property
+    def client_emails(self) -> List[str]:
+        """Emails seen in the conversation, without the official address."""
+        return [email for email in self.emails if email.lower() != OFFICIAL_EMAIL]
+
+    @property
+    def email(self) -> Optional[str]:
+        """The first client email, falling back to any email seen."""
+        emails = self.client_emails or self.emails
+        return emails[0].lower() if emails else None
+
+    def client_info(self) -> Dict[str, Any]:
+        """Same shape as app.extract_client_info_from_conversation()."""
+        info: Dict[str, Any] = {}
+        if self.name:
+            info["name"] = self.name
+        if self.phone:
+            info["phone"] = self.phone
+        if self.email:
+            info["email"] = self.email
+        if self.chars_seen > 50:
+            # Keep the tag order of the old full-text summary
+            tags = [tag for tag in SUMMARY_TAGS if tag in self.tags]
+            info["chat_summary"] = ", ".join(tags) if tags else "General inquiry"
+        return info
+
+
+class ExtractionStateStore:
+    """Keeps an ExtractionState per conversation file, caught up on demand."""
+
+    def __init__(self, folder: str, meta_folder: Optional[str] = None):
+        self.folder = folder
+        self.meta_folder = meta_folder or os.path.join(folder, "conversation_meta")
+        self._lock = threading.Lock()
+        self._states: Dict[str, ExtractionState] = {}
+        os.makedirs(self.meta_folder, exist_ok=True)
+
+    def _state_path(self, filename: str) -> str:
+        return os.path.join(self.meta_folder, f"{filename}.extract.json")
+
+    def _load(self, filename: str) -> ExtractionState:
+        state = self._states.get(filename)
+        if state is None:
+            try:
+                with open(self._state_path(filename), "r", encoding="utf-8") as f:
+                    state = ExtractionState(json.load(f))
+            except (OSError, ValueError):
+                state = ExtractionState()
+            self._states[filename] = state
+        return state
+
+    def _persist(self, filename: str, state: ExtractionState) -> None:
+        tmp_path = f"{self._state_path(filename)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state.to_dict(), f)
+        os.replace(tmp_path, self._state_path(filename))
+
+    def get(self, filename: str) -> ExtractionState:
+        """Return the state of `filename` after processing any text appended to it."""
+        path = os.path.join(self.folder, filename)
+        with self._lock:
+            state = self._load(filename)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return state
+            if size < state.offset:
+                # The file was replaced; start over
+                state = self._states[filename] = ExtractionState()
+            if size == state.offset:
+                return state
+            try:
+                with open(path, "rb") as f:
+                    f.seek(state.offset)
+                    delta = f.read(size - state.offset)
+                # Only consume complete lines; a partial line is picked up next time
+                end = delta.rfind(b"\n") + 1
+                if end:
+                    state.observe(delta[:end].decode("utf-8", errors="replace"))
+                    state.offset += end
+                    self._persist(filename, state)
+            except OSError as e:
+                logging.error(f"Error updating extraction state for {filename}: {e}")
+            return state
+
+    def forget(self, filename: str) -> None:
+        with self._lock:
+            self._states.pop(filename, None)
+            try:
+                os.remove(self._state_path(filename))
+            except OSError:
+                pass
@@ -0,0 +1,639 @@
+"""
+Shared HTTP client for the Gemini REST API.
+
+Every chat reply used to call requests.post() without a session, paying a
+new TCP + TLS handshake to generativelanguage.googleapis.com per message,
+and without a timeout. GeminiClient keeps one pooled keep-alive connection
+pool per worker process, applies connect/read timeouts to every call and
+speaks HTTP/2 when httpx and h2 are installed (falling back to a
+requests.Session otherwise).
+
+generateContent and streamGenerateContent calls are also guarded:
+
+- 429 and 5xx replies, timeouts and connection errors are retried with
+  jittered exponential backoff (honouring Retry-After)
+- every call has a deadline: the caller's (e.g. derived from the incoming
+  request) or GEMINI_DEADLINE; attempt timeouts and backoff sleeps never
+  run past it
+- a circuit breaker refuses calls with GeminiUnavailableError while the
+  recent error rate is high, instead of tying up workers on a dead upstream
+- optionally (GEMINI_HEDGE=1) a duplicate generateContent request is sent
+  when the first one is slower than the recent p95 latency, and the first
+  good reply wins. The losing request is not cancelled, so hedging costs
+  extra quota for about 1 in 20 calls.
+
+AsyncGeminiClient is the asyncio counterpart used by the ASGI server
+(asgi_app.py). It needs httpx, applies the same retries, deadline, breaker
+and hedging, and cancels the losing request of a hedge. Waiting for a reply
+holds no thread, so one process can keep hundreds of calls in flight.
+
+Configuration (environment):
+    GEMINI_POOL_SIZE         connections kept open per worker (default 10)
+    GEMINI_CONNECT_TIMEOUT   seconds to establish a connection (default 5)
+    GEMINI_READ_TIMEOUT      seconds to wait for the response (default 60)
+    GEMINI_HTTP2             "auto" (default), "1" to require, "0" to disable
+    GEMINI_DEADLINE          total seconds per call incl. retries (default 90)
+    GEMINI_MAX_RETRIES       retries after the first attempt (default 2)
+    GEMINI_RETRY_BASE        first backoff ceiling in seconds (default 0.5)
+    GEMINI_RETRY_MAX         backoff ceiling in seconds (default 8)
+    GEMINI_BREAKER_ERROR_RATE  failure share that opens the breaker (default 0.5)
+    GEMINI_BREAKER_MIN_CALLS   calls in the window before it may open (default 10)
+    GEMINI_BREAKER_WINDOW      seconds of outcomes considered (default 30)
+    GEMINI_BREAKER_COOLDOWN    seconds before a probe call (default 15)
+    GEMINI_HEDGE             "1" to send hedged requests (default off)
+    GEMINI_HEDGE_PERCENTILE  latency percentile that triggers a hedge (default 95)
+    GEMINI_ASYNC_POOL_SIZE   connections of the async client (default 100)
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional, Iterator, AsyncIterator, Callable, Awaitable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from resilience import CircuitBreaker, LatencyTracker, backoff_delay, parse_retry_after
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+    HTTP2_AVAILABLE = httpx is not None
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", 10))
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", 5))
+GEMINI_READ_TIMEOUT = float(os.getenv("GEMINI_READ_TIMEOUT", 60))
+GEMINI_HTTP2 = os.getenv("GEMINI_HTTP2", "auto").lower()
+GEMINI_DEADLINE = float(os.getenv("GEMINI_DEADLINE", 90))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 2))
+GEMINI_RETRY_BASE = float(os.getenv("GEMINI_RETRY_BASE", 0.5))
+GEMINI_RETRY_MAX = float(os.getenv("GEMINI_RETRY_MAX", 8))
+GEMINI_BREAKER_ERROR_RATE = float(os.getenv("GEMINI_BREAKER_ERROR_RATE", 0.5))
+GEMINI_BREAKER_MIN_CALLS = int(os.getenv("GEMINI_BREAKER_MIN_CALLS", 10))
+GEMINI_BREAKER_WINDOW = float(os.getenv("GEMINI_BREAKER_WINDOW", 30))
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", 15))
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "0").lower() in ("1", "true", "yes")
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", 95))
+GEMINI_ASYNC_POOL_SIZE = int(os.getenv("GEMINI_ASYNC_POOL_SIZE", 100))
+
+# Upstream replies worth another attempt
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class GeminiRequestError(Exception):
+    """The request did not get an HTTP response (timeout, connection error)."""
+
+    def __init__(self, message: str, timeout: bool = False):
+        super().__init__(message)
+        self.timeout = timeout
+
+
+class GeminiUnavailableError(GeminiRequestError):
+    """The circuit breaker is open; the call was not attempted."""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class GeminiStream:
+    """
+    An open streamGenerateContent?alt=sse response.
+
+    status_code and text are available before iterating; iterating yields
+    each streamed GenerateContentResponse chunk as a dict.
+    """
+
+    def __init__(self, response, http2: bool):
+        self._response = response
+        self._http2 = http2
+        self.status_code: int = response.status_code
+
+    @property
+    def text(self) -> str:
+        if self._http2:
+            self._response.read()
+        return self._response.text
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        try:
+            # chunk_size=None hands over data as it arrives instead of waiting for 512 bytes
+            lines = (self._response.iter_lines() if self._http2
+                     else self._response.iter_lines(chunk_size=None, decode_unicode=True))
+            for line in lines:
+                if line and line.startswith("data:"):
+                    yield json.loads(line[5:])
+        except requests.exceptions.RequestException as e:
+            raise GeminiRequestError(f"Gemini stream interrupted: {e}",
+                                     timeout=isinstance(e, requests.exceptions.Timeout)) from e
+        except Exception as e:
+            if httpx is not None and isinstance(e, httpx.HTTPError):
+                raise GeminiRequestError(f"Gemini stream interrupted: {e}",
+                                         timeout=isinstance(e, httpx.TimeoutException)) from e
+            raise
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self._response.close()
+
+
+class _CallPolicy:
+    """Retry, deadline and circuit-breaker bookkeeping shared by the sync and async clients."""
+
+    def __init__(self, api_key: str, base_url: str, connect_timeout: float, read_timeout: float,
+                 http2: str, deadline: float, max_retries: int, retry_base: float, retry_max: float,
+                 breaker: Optional[CircuitBreaker], hedge: bool, hedge_percentile: float):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Content-Type": "application/json", "x-goog-api-key": api_key}
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.max_retries = max(0, max_retries)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.breaker = breaker or CircuitBreaker(GEMINI_BREAKER_ERROR_RATE, GEMINI_BREAKER_MIN_CALLS,
+                                                 GEMINI_BREAKER_WINDOW, GEMINI_BREAKER_COOLDOWN)
+        self.latency = LatencyTracker()
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.stats: Dict[str, int] = {"calls": 0, "retries": 0, "hedged": 0, "hedge_wins": 0, "rejected": 0}
+        # The client is shared by request threads (and hedge threads)
+        self._stats_lock = threading.Lock()
+
+        use_http2 = http2 not in ("0", "false", "no") and HTTP2_AVAILABLE
+        if http2 in ("1", "true", "yes") and not HTTP2_AVAILABLE:
+            logging.warning("⚠️ GEMINI_HTTP2 requested but httpx[http2] is not installed; using HTTP/1.1")
+        self.http2 = use_http2
+
+    def _timeouts(self, timeout: Optional[float]):
+        """(connect, read) timeouts of one request"""
+        read_timeout = timeout if timeout is not None else self.read_timeout
+        return min(self.connect_timeout, read_timeout), read_timeout
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _admit(self, deadline: float) -> float:
+        """Seconds left before `deadline`; raises when it passed or the breaker is open."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise GeminiRequestError("Gemini deadline exceeded", timeout=True)
+        if not self.breaker.allow():
+            self._count("rejected")
+            retry_after = self.breaker.retry_in()
+            raise GeminiUnavailableError(
+                f"Gemini circuit breaker is open; retry in {retry_after:.0f}s", retry_after=retry_after)
+        return remaining
+
+    def _settle(self, response, error: Optional[GeminiRequestError]) -> bool:
+        """Record an attempt's outcome with the breaker; True when it should not be retried."""
+        retryable = error is not None or response.status_code in RETRY_STATUSES
+        self.breaker.record(not retryable)
+        return not retryable
+
+    def _retry_delay(self, attempt: int, response, error: Optional[GeminiRequestError],
+                     deadline: float) -> Optional[float]:
+        """Backoff before retry number `attempt`, or None when out of retries or time."""
+        retry_after = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        delay = backoff_delay(attempt, self.retry_base, self.retry_max, retry_after)
+        if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+            return None
+        status = response.status_code if response is not None else error
+        logging.warning(f"⚠️ Gemini attempt {attempt} failed ({status}); retrying in {delay:.2f}s")
+        self._count("retries")
+        return delay
+
+
+class GeminiClient(_CallPolicy):
+    """
+    Pooled keep-alive client for one API key.
+
+    Methods return the HTTP response object (requests or httpx, both expose
+    status_code, text and json()) and raise GeminiRequestError when no
+    response was received.
+    """
+
+    def __init__(self, api_key: str, base_url: str = GEMINI_BASE_URL,
+                 pool_size: int = GEMINI_POOL_SIZE,
+                 connect_timeout: float = GEMINI_CONNECT_TIMEOUT,
+                 read_timeout: float = GEMINI_READ_TIMEOUT,
+                 http2: str = GEMINI_HTTP2,
+                 deadline: float = GEMINI_DEADLINE,
+                 max_retries: int = GEMINI_MAX_RETRIES,
+                 retry_base: float = GEMINI_RETRY_BASE,
+                 retry_max: float = GEMINI_RETRY_MAX,
+                 breaker: Optional[CircuitBreaker] = None,
+                 hedge: bool = GEMINI_HEDGE,
+                 hedge_percentile: float = GEMINI_HEDGE_PERCENTILE):
+        super().__init__(api_key, base_url, connect_timeout, read_timeout, http2, deadline,
+                         max_retries, retry_base, retry_max, breaker, hedge, hedge_percentile)
+        self._hedge_pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="gemini-hedge") if hedge else None
+        use_http2 = self.http2
+
+        if use_http2:
+            self._client = httpx.Client(
+                http2=True,
+                headers=self.headers,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            )
+        else:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(self.headers)
+            self._client = session
+        logging.info(f"🔌 Gemini client ready (pool={pool_size}, http2={use_http2})")
+
+    def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                 timeout: Optional[float] = None, params: Optional[Dict[str, str]] = None,
+                 stream: bool = False):
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        connect_timeout, read_timeout = self._timeouts(timeout)
+        try:
+            if self.http2:
+                request = self._client.build_request(
+                    method, url, json=payload, params=params,
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+                return self._client.send(request, stream=stream)
+            return self._client.request(method, url, json=payload, params=params, stream=stream,
+                                        timeout=(connect_timeout, read_timeout))
+        except requests.exceptions.Timeout as e:
+            raise GeminiRequestError(f"Gemini request timed out: {e}", timeout=True) from e
+        except requests.exceptions.RequestException as e:
+            raise GeminiRequestError(f"Gemini request failed: {e}") from e
+        except Exception as e:
+            if httpx is not None and isinstance(e, httpx.TimeoutException):
+                raise GeminiRequestError(f"Gemini request timed out: {e}", timeout=True) from e
+            if httpx is not None and isinstance(e, httpx.HTTPError):
+                raise GeminiRequestError(f"Gemini request failed: {e}") from e
+            raise
+
+    def _attempt(self, send: Callable[[float], Any], timeout: float):
+        """One request; successful latencies feed the hedging percentile."""
+        started = time.monotonic()
+        response = send(timeout)
+        if response.status_code not in RETRY_STATUSES:
+            self.latency.add(time.monotonic() - started)
+        return response
+
+    def _hedged_attempt(self, send: Callable[[float], Any], timeout: float):
+        """
+        Send the request; if it is still running after the p95 latency, send a
+        duplicate and return whichever good reply arrives first.
+        """
+        threshold = self.latency.percentile(self.hedge_percentile)
+        if self._hedge_pool is None or threshold is None or threshold >= timeout:
+            return self._attempt(send, timeout)
+        primary = self._hedge_pool.submit(self._attempt, send, timeout)
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            return primary.result()
+
+        self._count("hedged")
+        hedge = self._hedge_pool.submit(self._attempt, send, max(0.1, timeout - threshold))
+        pending = {primary, hedge}
+        result: Any = None
+        error: Optional[GeminiRequestError] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except GeminiRequestError as e:
+                    error = e
+                    continue
+                if response.status_code not in RETRY_STATUSES:
+                    if future is hedge:
+                        self._count("hedge_wins")
+                    # The other request finishes in the background; release its connection
+                    for other in pending:
+                        other.add_done_callback(_close_result)
+                    return response
+                result = response
+        if result is not None:
+            return result
+        raise error  # type: ignore[misc]
+
+    def _call(self, send: Callable[[float], Any], deadline: Optional[float] = None,
+              timeout: Optional[float] = None, hedge: bool = False):
+        """
+        Run `send(read_timeout)` with retries, the circuit breaker and the
+        deadline (a time.monotonic() value; default now + GEMINI_DEADLINE).
+        Returns the last response (which may be an error status) or raises
+        GeminiRequestError.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.deadline
+        attempt_timeout = timeout if timeout is not None else self.read_timeout
+        self._count("calls")
+        attempt = 0
+        while True:
+            remaining = self._admit(deadline)
+            response = None
+            error: Optional[GeminiRequestError] = None
+            try:
+                if hedge:
+                    response = self._hedged_attempt(send, min(attempt_timeout, remaining))
+                else:
+                    response = self._attempt(send, min(attempt_timeout, remaining))
+            except GeminiRequestError as e:
+                error = e
+            except BaseException:
+                # Anything else (a bug, a cancelled task) still ends the attempt, or a
+                # half-open breaker would keep its probe in flight and reject every call
+                self.breaker.record(False)
+                raise
+            if self._settle(response, error):
+                return response
+
+            attempt += 1
+            delay = self._retry_delay(attempt, response, error, deadline)
+            if delay is None:
+                if response is not None:
+                    return response
+                raise error  # type: ignore[misc]
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+
+    def generate_content(self, model: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+                         deadline: Optional[float] = None):
+        """
+        POST models/<model>:generateContent with retries, circuit breaker and
+        optional hedging. `timeout` limits each attempt, `deadline`
+        (time.monotonic()) the whole call.
+        """
+        path = f"models/{model}:generateContent"
+        return self._call(lambda t: self._request("POST", path, payload, t),
+                          deadline, timeout, hedge=self.hedge)
+
+    def stream_generate_content(self, model: str, payload: Dict[str, Any],
+                                timeout: Optional[float] = None,
+                                deadline: Optional[float] = None) -> GeminiStream:
+        """
+        POST models/<model>:streamGenerateContent?alt=sse and return the open
+        stream. Opening the stream is retried like generate_content; the read
+        timeout then applies between chunks, not to the whole reply.
+        """
+        path = f"models/{model}:streamGenerateContent"
+        response = self._call(lambda t: self._request("POST", path, payload, t, params={"alt": "sse"}, stream=True),
+                              deadline, timeout)
+        return GeminiStream(response, self.http2)
+
+    def list_models(self, timeout: Optional[float] = None):
+        """GET models (used to validate the key and model name)."""
+        return self._request("GET", "models", timeout=timeout)
+
+    def close(self) -> None:
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+        self._client.close()
+
+
+def _close_result(future) -> None:
+    """Close the response of a hedged request that lost the race."""
+    try:
+        future.result().close()
+    except Exception:
+        pass
+
+
+class AsyncGeminiStream:
+    """
+    An open streamGenerateContent?alt=sse response of AsyncGeminiClient.
+
+    status_code is available before iterating; `async for` yields each
+    streamed GenerateContentResponse chunk as a dict.
+    """
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code: int = response.status_code
+
+    async def text(self) -> str:
+        await self._response.aread()
+        return self._response.text
+
+    async def __aiter__(self) -> AsyncIterator[Dict[str, Any]]:
+        try:
+            async for line in self._response.aiter_lines():
+                if line and line.startswith("data:"):
+                    yield json.loads(line[5:])
+        except httpx.HTTPError as e:
+            raise GeminiRequestError(f"Gemini stream interrupted: {e}",
+                                     timeout=isinstance(e, httpx.TimeoutException)) from e
+        finally:
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._response.aclose()
+
+
+class AsyncGeminiClient(_CallPolicy):
+    """
+    asyncio client for one API key (httpx.AsyncClient).
+
+    Same methods and guards as GeminiClient, as coroutines. Responses are
+    httpx responses (status_code, text, json()).
+    """
+
+    def __init__(self, api_key: str, base_url: str = GEMINI_BASE_URL,
+                 pool_size: int = GEMINI_ASYNC_POOL_SIZE,
+                 connect_timeout: float = GEMINI_CONNECT_TIMEOUT,
+                 read_timeout: float = GEMINI_READ_TIMEOUT,
+                 http2: str = GEMINI_HTTP2,
+                 deadline: float = GEMINI_DEADLINE,
+                 max_retries: int = GEMINI_MAX_RETRIES,
+                 retry_base: float = GEMINI_RETRY_BASE,
+                 retry_max: float = GEMINI_RETRY_MAX,
+                 breaker: Optional[CircuitBreaker] = None,
+                 hedge: bool = GEMINI_HEDGE,
+                 hedge_percentile: float = GEMINI_HEDGE_PERCENTILE):
+        if httpx is None:
+            raise RuntimeError('AsyncGeminiClient needs httpx: pip install "httpx[http2]"')
+        super().__init__(api_key, base_url, connect_timeout, read_timeout, http2, deadline,
+                         max_retries, retry_base, retry_max, breaker, hedge, hedge_percentile)
+        self._client = httpx.AsyncClient(
+            http2=self.http2,
+            headers=self.headers,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        logging.info(f"🔌 Async Gemini client ready (pool={pool_size}, http2={self.http2})")
+
+    async def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                       timeout: Optional[float] = None, params: Optional[Dict[str, str]] = None,
+                       stream: bool = False):
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        connect_timeout, read_timeout = self._timeouts(timeout)
+        request = self._client.build_request(
+            method, url, json=payload, params=params,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+        try:
+            return await self._client.send(request, stream=stream)
+        except httpx.TimeoutException as e:
+            raise GeminiRequestError(f"Gemini request timed out: {e}", timeout=True) from e
+        except httpx.HTTPError as e:
+            raise GeminiRequestError(f"Gemini request failed: {e}") from e
+
+    async def _attempt(self, send: Callable[[float], Awaitable[Any]], timeout: float):
+        """One request; successful latencies feed the hedging percentile."""
+        started = time.monotonic()
+        response = await send(timeout)
+        if response.status_code not in RETRY_STATUSES:
+            self.latency.add(time.monotonic() - started)
+        return response
+
+    async def _hedged_attempt(self, send: Callable[[float], Awaitable[Any]], timeout: float):
+        """
+        Like GeminiClient._hedged_attempt, but the request that loses the
+        race is cancelled instead of left to finish.
+        """
+        threshold = self.latency.percentile(self.hedge_percentile)
+        if threshold is None or threshold >= timeout:
+            return await self._attempt(send, timeout)
+        primary = asyncio.ensure_future(self._attempt(send, timeout))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=threshold)
+            if done:
+                return primary.result()
+
+            self._count("hedged")
+            hedge = asyncio.ensure_future(self._attempt(send, max(0.1, timeout - threshold)))
+            tasks.append(hedge)
+            pending = set(tasks)
+            result: Any = None
+            error: Optional[GeminiRequestError] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        response = task.result()
+                    except GeminiRequestError as e:
+                        error = e
+                        continue
+                    if response.status_code not in RETRY_STATUSES:
+                        if task is hedge:
+                            self._count("hedge_wins")
+                        return response
+                    result = response
+            if result is not None:
+                return result
+            raise error  # type: ignore[misc]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _call(self, send: Callable[[float], Awaitable[Any]], deadline: Optional[float] = None,
+                    timeout: Optional[float] = None, hedge: bool = False):
+        """GeminiClient._call for coroutines: backoff sleeps hold no thread."""
+        if deadline is None:
+            deadline = time.monotonic() + self.deadline
+        attempt_timeout = timeout if timeout is not None else self.read_timeout
+        self._count("calls")
+        attempt = 0
+        while True:
+            remaining = self._admit(deadline)
+            response = None
+            error: Optional[GeminiRequestError] = None
+            try:
+                if hedge:
+                    response = await self._hedged_attempt(send, min(attempt_timeout, remaining))
+                else:
+                    response = await self._attempt(send, min(attempt_timeout, remaining))
+            except GeminiRequestError as e:
+                error = e
+            except BaseException:
+                # Anything else (a bug, a cancelled task) still ends the attempt, or a
+                # half-open breaker would keep its probe in flight and reject every call
+                self.breaker.record(False)
+                raise
+            if self._settle(response, error):
+                return response
+
+            attempt += 1
+            delay = self._retry_delay(attempt, response, error, deadline)
+            if delay is None:
+                if response is not None:
+                    return response
+                raise error  # type: ignore[misc]
+            if response is not None:
+                await response.aclose()
+            await asyncio.sleep(delay)
+
+    async def generate_content(self, model: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+                               deadline: Optional[float] = None):
+        """POST models/<model>:generateContent (see GeminiClient.generate_content)."""
+        path = f"models/{model}:generateContent"
+        return await self._call(lambda t: self._request("POST", path, payload, t),
+                                deadline, timeout, hedge=self.hedge)
+
+    async def stream_generate_content(self, model: str, payload: Dict[str, Any],
+                                      timeout: Optional[float] = None,
+                                      deadline: Optional[float] = None) -> AsyncGeminiStream:
+        """POST models/<model>:streamGenerateContent?alt=sse and return the open stream."""
+        path = f"models/{model}:streamGenerateContent"
+        response = await self._call(
+            lambda t: self._request("POST", path, payload, t, params={"alt": "sse"}, stream=True),
+            deadline, timeout)
+        return AsyncGeminiStream(response)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+_clients: Dict[Any, GeminiClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_gemini_client(api_key: str) -> GeminiClient:
+    """
+    Return this worker's shared client for `api_key`.
+
+    Clients are keyed by process id as well, so a worker forked from a
+    preloaded master opens its own connections instead of sharing sockets.
+    """
+    key = (os.getpid(), api_key)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = GeminiClient(api_key)
+    return client
+
+
+_async_clients: Dict[Any, AsyncGeminiClient] = {}
+
+
+def get_async_gemini_client(api_key: str) -> AsyncGeminiClient:
+    """This process's shared AsyncGeminiClient for `api_key` (call from the event loop)."""
+    key = (os.getpid(), api_key)
+    client = _async_clients.get(key)
+    if client is None:
+        client = _async_clients[key] = AsyncGeminiClient(api_key)
+    return client
+
+
+async def close_async_gemini_clients() -> None:
+    """Close this process's async clients (ASGI lifespan shutdown)."""
+    while _async_clients:
+        _, client = _async_clients.popitem()
+        await client.aclose()
@@ -2,9 +2,9 @@ import os
 import uuid
 import pickle
 from typing import List, Dict, Any
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
+
+# The Google client libraries take a second or more to import, so they are
+# imported where an event is created rather than when the app starts.
 
 # Adjust the path based on where you put the JSON key
 SERVICE_ACCOUNT_FILE = 'backend/service_account.json'  # ✅ Update this if needed
@@ -34,6 +34,9 @@ def create_meet_event(summary: str, start_time: str, end_time: str, attendees: L
     
     # Fallback to service account method (without attendees if it causes issues)
     try:
+        from google.oauth2 import service_account
+        from googleapiclient.discovery import build
+
         creds = service_account.Credentials.from_service_account_file(
             SERVICE_ACCOUNT_FILE, scopes=SCOPES
         )
@@ -93,6 +96,9 @@ def create_meet_event_oauth(summary: str, start_time: str, end_time: str, attend
     Creates a Google Meet event using OAuth authentication.
     """
     try:
+        from googleapiclient.discovery import build
+        from google.auth.transport.requests import Request
+
         with open('token.pickle', 'rb') as token:
             credentials = pickle.load(token)
         
@@ -0,0 +1,149 @@
+"""
+Token-budget-aware conversation history for Gemini requests.
+
+Chat sessions used to keep the last N turns regardless of their size, so
+one long pasted message could blow up the prompt while ten short turns
+wasted the window. HistoryManager keeps the newest turns that fit in a
+token budget instead, and folds the turns it drops into a rolling summary
+that is sent ahead of them as one user/model exchange.
+
+Token counts are estimated from the text length (about 4 characters per
+token for Gemini models) once per turn and stored in the session next to
+the turns, so a request never re-measures old turns. The summary is
+extractive (the start of each dropped message, oldest lines dropped first
+once it exceeds its own budget), which costs no extra model call.
+
+Session fields written by session_fields():
+    conversation_history  the turns that still fit, oldest first
+    history_tokens        estimated tokens of each of those turns
+    history_summary       the rolling summary of the dropped turns
+
+Configuration (environment):
+    HISTORY_TOKEN_BUDGET     tokens of recent turns to send (default 4000)
+    HISTORY_SUMMARY_TOKENS   tokens of rolling summary to keep (default 400)
+    HISTORY_CHARS_PER_TOKEN  characters per estimated token (default 4)
+"""
+
+import os
+import math
+from typing import Dict, Any, List, Optional, Tuple
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 4000))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", 400))
+HISTORY_CHARS_PER_TOKEN = float(os.getenv("HISTORY_CHARS_PER_TOKEN", 4))
+
+# Role/formatting overhead per turn
+TURN_OVERHEAD_TOKENS = 4
+# Characters of each dropped message kept in the summary
+SUMMARY_LINE_CHARS = 160
+SUMMARY_PREFIX = "Summary of our earlier conversation:\n"
+SUMMARY_ACK = "Noted, I will keep that earlier conversation in mind."
+
+
+def turn_text(turn: Dict[str, Any]) -> str:
+    return " ".join(part.get("text", "") for part in turn.get("parts", []) if isinstance(part, dict))
+
+
+class ConversationWindow:
+    """The turns sent to Gemini and the summary of the turns that no longer fit."""
+
+    def __init__(self, manager: "HistoryManager", turns: List[Dict[str, Any]],
+                 tokens: List[int], summary: str = ""):
+        self.manager = manager
+        self.turns = turns
+        self.tokens = tokens
+        self.summary = summary
+        # Turns as stored, and how many of the oldest were dropped since (see unsaved())
+        self.stored = len(turns)
+        self.dropped = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens)
+
+    def add(self, turn: Dict[str, Any]) -> None:
+        """Append a turn and drop the oldest turns that no longer fit the budget."""
+        self.turns.append(turn)
+        self.tokens.append(self.manager.estimate_tokens(turn))
+        self.manager.compact(self)
+
+    def contents(self) -> List[Dict[str, Any]]:
+        """The `contents` of a Gemini request: summary exchange, then the turns."""
+        if not self.summary:
+            return list(self.turns)
+        return [
+            {"role": "user", "parts": [{"text": SUMMARY_PREFIX + self.summary}]},
+            {"role": "model", "parts": [{"text": SUMMARY_ACK}]},
+        ] + self.turns
+
+    def unsaved(self) -> Tuple[int, List[Tuple[int, Dict[str, Any]]]]:
+        """
+        Changes since load or mark_saved(), for stores that append turns:
+        (number of stored turns to drop from the front, [(tokens, turn)] to append).
+        """
+        new_turns = max(0, self.stored - self.dropped)
+        return min(self.dropped, self.stored), list(zip(self.tokens[new_turns:], self.turns[new_turns:]))
+
+    def mark_saved(self) -> None:
+        self.stored, self.dropped = len(self.turns), 0
+
+    def session_fields(self) -> Dict[str, Any]:
+        """Fields to store in the Redis session."""
+        return {
+            "conversation_history": self.turns,
+            "history_tokens": self.tokens,
+            "history_summary": self.summary,
+        }
+
+
+class HistoryManager:
+    """Keeps conversation windows within a token budget."""
+
+    def __init__(self, token_budget: int = HISTORY_TOKEN_BUDGET,
+                 summary_tokens: int = HISTORY_SUMMARY_TOKENS,
+                 chars_per_token: float = HISTORY_CHARS_PER_TOKEN):
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.chars_per_token = chars_per_token
+
+    def estimate_tokens(self, turn: Dict[str, Any]) -> int:
+        return math.ceil(len(turn_text(turn)) / self.chars_per_token) + TURN_OVERHEAD_TOKENS
+
+    def load(self, session_data: Optional[Dict[str, Any]]) -> ConversationWindow:
+        """Window from a stored session (sessions written before token counts are re-measured)."""
+        session_data = session_data or {}
+        turns: List[Dict[str, Any]] = session_data.get("conversation_history", [])
+        tokens: List[int] = session_data.get("history_tokens") or []
+        if len(tokens) != len(turns):
+            tokens = [self.estimate_tokens(turn) for turn in turns]
+        window = ConversationWindow(self, turns, tokens, session_data.get("history_summary", ""))
+        self.compact(window)
+        return window
+
+    def compact(self, window: ConversationWindow) -> None:
+        """
+        Drop the oldest turns until the rest fit the budget, always keeping
+        the newest turn and starting the window with a user turn.
+        """
+        evicted: List[Dict[str, Any]] = []
+        while len(window.turns) > 1 and (
+                window.total_tokens > self.token_budget or window.turns[0].get("role") != "user"):
+            evicted.append(window.turns.pop(0))
+            window.tokens.pop(0)
+            window.dropped += 1
+        if evicted:
+            window.summary = self.summarize(window.summary, evicted)
+
+    def summarize(self, summary: str, evicted: List[Dict[str, Any]]) -> str:
+        """Append one line per dropped turn, then trim the oldest lines to the summary budget."""
+        lines = summary.splitlines() if summary else []
+        for turn in evicted:
+            text = " ".join(turn_text(turn).split())
+            if len(text) > SUMMARY_LINE_CHARS:
+                text = text[:SUMMARY_LINE_CHARS].rsplit(" ", 1)[0] + " ..."
+            if text:
+                lines.append(f"- {turn.get('role', 'user')}: {text}")
+        budget_chars = self.summary_tokens * self.chars_per_token
+        while lines and sum(len(line) + 1 for line in lines) > budget_chars:
+            lines.pop(0)
+        return "\n".join(lines)
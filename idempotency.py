@@ -0,0 +1,307 @@
+"""
+Idempotency keys for slow, retried requests.
+
+The WhatsApp gateway retries /gemini/train on timeouts, often while the
+first call is still running, which used to double the Gemini cost and
+append the user turn twice. IdempotencyStore.run(key, handler):
+
+- runs `handler` once per key; a duplicate arriving in the same worker while
+  it runs waits for and shares its result
+- marks the key in-flight in Redis (SET NX), so a duplicate that reaches
+  another worker polls for the result instead of running again
+- keeps completed results (status < 500) in Redis for IDEMPOTENCY_TTL
+  seconds, so later retries are answered without any work
+
+Failed results (5xx) are not stored, so a retry after an upstream error
+gets a fresh attempt. Without Redis (or when it is unreachable) results are
+shared within the worker only.
+
+AsyncIdempotencyStore is the asyncio variant for the ASGI server: same keys
+in Redis (so both servers can share them), but it takes a redis.asyncio
+client and awaits the handler, and its waits hold no thread.
+
+Configuration (environment):
+    IDEMPOTENCY_TTL   seconds a completed result is replayed (default 600)
+    IDEMPOTENCY_WAIT  longest a duplicate waits for the in-flight call (default 120)
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 600))
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", 120))
+
+RESULT_PREFIX = "idempotency:result:"
+LOCK_PREFIX = "idempotency:lock:"
+# Results kept in process memory (used without Redis, and as a first tier)
+LOCAL_RESULTS = 1000
+
+ResponseParts = Tuple[Dict[str, Any], int, Dict[str, str]]
+
+
+class IdempotencyConflict(Exception):
+    """The request with this key is still running elsewhere after IDEMPOTENCY_WAIT."""
+
+
+class _LocalResults:
+    """Completed results kept in process memory (first tier, and the only one without Redis)."""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._results: "OrderedDict[str, Tuple[float, ResponseParts]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[ResponseParts]:
+        with self._lock:
+            cached = self._results.get(key)
+        if cached is not None and cached[0] > time.time():
+            return cached[1]
+        return None
+
+    def put(self, key: str, result: ResponseParts) -> None:
+        with self._lock:
+            self._results[key] = (time.time() + self.ttl, result)
+            self._results.move_to_end(key)
+            while len(self._results) > LOCAL_RESULTS:
+                self._results.popitem(last=False)
+
+
+def _decode_result(raw: Any) -> Optional[ResponseParts]:
+    if raw is None:
+        return None
+    body, status, headers = json.loads(raw)
+    return body, status, headers
+
+
+def _is_token(current: Any, token: str) -> bool:
+    return current is not None and (current.decode("utf-8") if isinstance(current, bytes) else current) == token
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[ResponseParts] = None
+        self.error: Optional[BaseException] = None
+
+
+class IdempotencyStore:
+    """Runs each keyed request once and replays its (body, status, headers)."""
+
+    def __init__(self, redis_client=None, ttl: int = IDEMPOTENCY_TTL,
+                 wait: float = IDEMPOTENCY_WAIT, poll_interval: float = 0.1):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self._flights: Dict[str, _Flight] = {}
+        self._results = _LocalResults(ttl)
+        self._lock = threading.Lock()
+
+    def run(self, key: str, handler: Callable[[], ResponseParts]) -> Tuple[ResponseParts, bool]:
+        """Result for `key` and whether it was replayed rather than computed by this call."""
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                return cached, True
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if not flight.done.wait(self.wait):
+                raise IdempotencyConflict(f"Request {key} is still in progress")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True  # type: ignore[return-value]
+
+        replayed = True
+        try:
+            result = self._redis_result(key)
+            if result is None:
+                token = self._acquire(key)
+                try:
+                    # Another worker may have finished just before the lock was taken
+                    result = self._redis_result(key)
+                    if result is None:
+                        replayed = False
+                        result = handler()
+                        # Store before releasing, so a waiting worker finds the result
+                        if result[1] < 500:
+                            self._store(key, result)
+                finally:
+                    self._release(key, token)
+            flight.result = result
+            return result, replayed
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _acquire(self, key: str) -> Optional[str]:
+        """
+        Take the in-flight marker. Returns its token, or None when Redis is
+        unavailable or another worker stored the result while we waited.
+        """
+        if self.redis is None:
+            return None
+        token = uuid.uuid4().hex
+        give_up_at = time.monotonic() + self.wait
+        try:
+            while True:
+                if self.redis.set(LOCK_PREFIX + key, token, nx=True, ex=max(1, int(self.wait))):
+                    return token
+                if self._redis_result(key) is not None:
+                    return None
+                if time.monotonic() >= give_up_at:
+                    raise IdempotencyConflict(f"Request {key} is still in progress")
+                time.sleep(self.poll_interval)
+        except IdempotencyConflict:
+            raise
+        except Exception as e:
+            logging.warning(f"⚠️ Idempotency lock unavailable, running {key} without it: {e}")
+            return None
+
+    def _release(self, key: str, token: Optional[str]) -> None:
+        if self.redis is None or token is None:
+            return
+        try:
+            if _is_token(self.redis.get(LOCK_PREFIX + key), token):
+                self.redis.delete(LOCK_PREFIX + key)
+        except Exception as e:
+            logging.warning(f"⚠️ Could not release idempotency lock {key}: {e}")
+
+    def _redis_result(self, key: str) -> Optional[ResponseParts]:
+        if self.redis is None:
+            return None
+        try:
+            raw = self.redis.get(RESULT_PREFIX + key)
+        except Exception as e:
+            logging.warning(f"⚠️ Could not read idempotent result {key}: {e}")
+            return None
+        return _decode_result(raw)
+
+    def _store(self, key: str, result: ResponseParts) -> None:
+        self._results.put(key, result)
+        if self.redis is not None:
+            try:
+                self.redis.setex(RESULT_PREFIX + key, self.ttl, json.dumps(list(result)))
+            except Exception as e:
+                logging.warning(f"⚠️ Could not store idempotent result {key}: {e}")
+
+
+class AsyncIdempotencyStore:
+    """IdempotencyStore for coroutines, on a redis.asyncio client."""
+
+    def __init__(self, redis_client=None, ttl: int = IDEMPOTENCY_TTL,
+                 wait: float = IDEMPOTENCY_WAIT, poll_interval: float = 0.1):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self._flights: Dict[str, "asyncio.Future[ResponseParts]"] = {}
+        self._results = _LocalResults(ttl)
+
+    async def run(self, key: str, handler: Callable[[], Awaitable[ResponseParts]]) -> Tuple[ResponseParts, bool]:
+        """Result for `key` and whether it was replayed rather than computed by this call."""
+        cached = self._results.get(key)
+        if cached is not None:
+            return cached, True
+        flight = self._flights.get(key)
+        if flight is not None:
+            try:
+                return await asyncio.wait_for(asyncio.shield(flight), self.wait), True
+            except asyncio.TimeoutError:
+                raise IdempotencyConflict(f"Request {key} is still in progress")
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # The first request was abandoned; this one takes over
+                return await self.run(key, handler)
+
+        flight = self._flights[key] = asyncio.get_running_loop().create_future()
+        replayed = True
+        try:
+            result = await self._redis_result(key)
+            if result is None:
+                token = await self._acquire(key)
+                try:
+                    # Another worker may have finished just before the lock was taken
+                    result = await self._redis_result(key)
+                    if result is None:
+                        replayed = False
+                        result = await handler()
+                        # Store before releasing, so a waiting worker finds the result
+                        if result[1] < 500:
+                            await self._store(key, result)
+                finally:
+                    await self._release(key, token)
+            flight.set_result(result)
+            return result, replayed
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            flight.exception()  # retrieved here, so an unawaited flight is not reported
+            raise
+        finally:
+            self._flights.pop(key, None)
+
+    async def _acquire(self, key: str) -> Optional[str]:
+        """See IdempotencyStore._acquire."""
+        if self.redis is None:
+            return None
+        token = uuid.uuid4().hex
+        give_up_at = time.monotonic() + self.wait
+        try:
+            while True:
+                if await self.redis.set(LOCK_PREFIX + key, token, nx=True, ex=max(1, int(self.wait))):
+                    return token
+                if await self._redis_result(key) is not None:
+                    return None
+                if time.monotonic() >= give_up_at:
+                    raise IdempotencyConflict(f"Request {key} is still in progress")
+                await asyncio.sleep(self.poll_interval)
+        except IdempotencyConflict:
+            raise
+        except Exception as e:
+            logging.warning(f"⚠️ Idempotency lock unavailable, running {key} without it: {e}")
+            return None
+
+    async def _release(self, key: str, token: Optional[str]) -> None:
+        if self.redis is None or token is None:
+            return
+        try:
+            if _is_token(await self.redis.get(LOCK_PREFIX + key), token):
+                await self.redis.delete(LOCK_PREFIX + key)
+        except Exception as e:
+            logging.warning(f"⚠️ Could not release idempotency lock {key}: {e}")
+
+    async def _redis_result(self, key: str) -> Optional[ResponseParts]:
+        if self.redis is None:
+            return None
+        try:
+            raw = await self.redis.get(RESULT_PREFIX + key)
+        except Exception as e:
+            logging.warning(f"⚠️ Could not read idempotent result {key}: {e}")
+            return None
+        return _decode_result(raw)
+
+    async def _store(self, key: str, result: ResponseParts) -> None:
+        self._results.put(key, result)
+        if self.redis is not None:
+            try:
+                await self.redis.setex(RESULT_PREFIX + key, self.ttl, json.dumps(list(result)))
+            except Exception as e:
+                logging.warning(f"⚠️ Could not store idempotent result {key}: {e}")
@@ -0,0 +1,160 @@
+"""
+Cached assembly of the Gemini system instruction.
+
+Every /gemini/train call used to read system_instruction.txt from disk, run
+an uncompiled multi-line date regex over it (splitting and re-joining the
+whole text by lines when the date block was missing) and concatenate the
+client's context on top. InstructionCache instead
+
+- re-reads the file only when its stat (inode, size, mtime) changes, so an
+  edit saved by any worker is picked up by all of them on their next call
+- splits the text once into the static pieces around the date slot(s)
+- renders the date block once per day
+
+ClientContextCache keeps each client's context block (sales notes, client
+information, meeting) and rebuilds it only when one of those values changed.
+"""
+
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+DATE_SLOT_PATTERN = re.compile(r"📅 CURRENT DATE & TIME CONTEXT\s*\nToday's date is: [^\n]+\nCurrent time zone: [^\n]+")
+TIME_ZONE_LABEL = "Pakistan Standard Time (PST/PKT)"
+# Without a date block, the date goes after the header (the first 9 lines)
+HEADER_LINES = 9
+
+CLIENT_CONTEXT_CACHE_SIZE = int(os.getenv("CLIENT_CONTEXT_CACHE_SIZE", 2000))
+
+
+def date_context(today: str) -> str:
+    return f"📅 CURRENT DATE & TIME CONTEXT\nToday's date is: {today}\nCurrent time zone: {TIME_ZONE_LABEL}"
+
+
+def _file_key(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class InstructionCache:
+    """The system instruction file, parsed once per version and dated once per day."""
+
+    def __init__(self, path: str, default: str = ""):
+        self.path = path
+        self.default = default
+        self._lock = threading.Lock()
+        self._key: Any = object()
+        self._text: Optional[str] = None
+        self._version = ""
+        # Static text around the date slot(s); a single piece when there is no slot
+        self._pieces: List[str] = []
+        self._dated: Tuple[str, str] = ("", "")
+
+    def _load(self) -> None:
+        key = _file_key(self.path)
+        if key == self._key:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                text: Optional[str] = f.read()
+        except OSError:
+            text = None
+        self._key = key
+        self._text = text
+        base = text if text is not None else self.default
+        self._version = hashlib.sha1(base.encode("utf-8")).hexdigest()[:12]
+        self._pieces = DATE_SLOT_PATTERN.split(base)
+        if len(self._pieces) == 1:
+            lines = base.split("\n")
+            if len(lines) >= HEADER_LINES:
+                self._pieces = ["\n".join(lines[:HEADER_LINES]) + "\n\n",
+                                "".join("\n" + line for line in lines[HEADER_LINES:])]
+        self._dated = ("", "")
+        logging.info(f"📜 Loaded system instruction version {self._version}")
+
+    def raw(self) -> Optional[str]:
+        """The file's text, or None when it does not exist."""
+        with self._lock:
+            self._load()
+            return self._text
+
+    @property
+    def version(self) -> str:
+        """Hash of the current base instruction."""
+        with self._lock:
+            self._load()
+            return self._version
+
+    def render(self, now: Optional[datetime] = None) -> str:
+        """The base instruction (or the default) with today's date filled in."""
+        today = (now or datetime.now()).strftime("%B %d, %Y")
+        with self._lock:
+            self._load()
+            if self._dated[0] != today:
+                self._dated = (today, date_context(today).join(self._pieces))
+            return self._dated[1]
+
+    def invalidate(self) -> None:
+        """Forget the parsed file (other workers notice the new file by its stat)."""
+        with self._lock:
+            self._key = object()
+
+
+class ClientContextCache:
+    """Per-client context blocks, rebuilt when the notes or lead data behind them change."""
+
+    LEAD_FIELDS = ("name", "phone", "email", "chat_summary", "last_interaction",
+                   "meet_link", "meeting_date", "meeting_time")
+
+    def __init__(self, max_entries: int = CLIENT_CONTEXT_CACHE_SIZE):
+        self.max_entries = max(1, max_entries)
+        self._blocks: "OrderedDict[str, Tuple[Any, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def block(self, client_id: str, sales_notes: str, client_data: Optional[Dict[str, Any]]) -> str:
+        """The context appended to the system instruction for this client ('' if none)."""
+        fingerprint = (sales_notes, tuple(client_data.get(field) for field in self.LEAD_FIELDS)
+                       if client_data else None)
+        with self._lock:
+            cached = self._blocks.get(client_id)
+            if cached is not None and cached[0] == fingerprint:
+                self._blocks.move_to_end(client_id)
+                return cached[1]
+        block = self.build(sales_notes, client_data)
+        with self._lock:
+            self._blocks[client_id] = (fingerprint, block)
+            self._blocks.move_to_end(client_id)
+            while len(self._blocks) > self.max_entries:
+                self._blocks.popitem(last=False)
+        return block
+
+    @staticmethod
+    def build(sales_notes: str, client_data: Optional[Dict[str, Any]]) -> str:
+        context_injection = ""
+        if sales_notes:
+            context_injection += f"\n\n📝 SALES TEAM NOTES FOR THIS CLIENT:\n{sales_notes}\n"
+        if client_data:
+            context_injection += f"\n\n👤 CLIENT INFORMATION:\n"
+            context_injection += f"- Name: {client_data.get('name', 'Unknown')}\n"
+            context_injection += f"- Phone: {client_data.get('phone', 'N/A')}\n"
+            context_injection += f"- Email: {client_data.get('email', 'N/A')}\n"
+            context_injection += f"- Previous Summary: {client_data.get('chat_summary', 'N/A')}\n"
+            context_injection += f"- Last Interaction: {client_data.get('last_interaction', 'N/A')}\n"
+            if client_data.get("meet_link"):
+                context_injection += f"- Meeting Scheduled: {client_data.get('meeting_date')} at {client_data.get('meeting_time')}\n"
+                context_injection += f"- Meeting Link: {client_data.get('meet_link')}\n"
+        if context_injection:
+            context_injection += "\nUse this information to provide personalized, context-aware responses. Reference previous conversations and notes when relevant.\n"
+        return context_injection
+
+    def forget(self, client_id: str) -> None:
+        with self._lock:
+            self._blocks.pop(client_id, None)
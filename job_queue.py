@@ -0,0 +1,203 @@
+"""
+Durable local job queue with a worker pool.
+
+Jobs are rows in a SQLite (WAL) database, so work accepted before a crash or
+restart is picked up again when the app comes back. Each job has a key (for
+chat bookkeeping, the client id); jobs with the same key run one at a time in
+the order they were enqueued, while jobs for different keys run in parallel
+on the worker threads. Several processes can share one database: a job is
+claimed inside a write transaction and a claim that is not finished within
+JOB_LEASE_SECONDS (worker died) is handed to another worker.
+
+A failing job is retried with exponential backoff up to JOB_MAX_ATTEMPTS
+times and then kept with status "failed" for inspection.
+
+With workers=0 the queue runs every job inline in enqueue(), which is handy
+for tests and single-process debugging.
+"""
+
+import os
+import json
+import time
+import uuid
+import atexit
+import logging
+import threading
+from typing import Dict, Any, Callable, List, Optional
+
+from data_store import _SqliteDatabase
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_BASE = float(os.getenv("JOB_RETRY_BASE", 2.0))
+JOB_RETRY_MAX = float(os.getenv("JOB_RETRY_MAX", 300.0))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 300.0))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    job_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    claimed_at REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, run_after, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs(job_key, status, id);
+"""
+
+# The oldest runnable job whose key has no earlier unfinished job
+_CLAIM_SQL = """
+SELECT id, kind, job_key, payload, attempts FROM jobs AS j
+WHERE j.status = 'pending' AND j.run_after <= ?
+  AND NOT EXISTS (
+      SELECT 1 FROM jobs AS k
+      WHERE k.job_key = j.job_key AND k.id < j.id AND k.status IN ('pending', 'running'))
+ORDER BY j.id
+LIMIT 1
+"""
+
+
+class JobQueue:
+    """SQLite-backed queue; register handlers, start() workers, enqueue() jobs."""
+
+    def __init__(self, path: str, workers: int = 2, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 retry_base: float = JOB_RETRY_BASE, lease_seconds: float = JOB_LEASE_SECONDS,
+                 poll_interval: float = JOB_POLL_INTERVAL):
+        self.db = _SqliteDatabase(path, JOBS_SCHEMA)
+        self.workers = max(0, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base = retry_base
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+
+    def register(self, kind: str, handler: Callable[[Dict[str, Any]], None]) -> None:
+        """Run `handler(payload)` for jobs of `kind`."""
+        self._handlers[kind] = handler
+
+    def start(self) -> None:
+        """Start the workers; no-op when they already run in this process."""
+        if self.workers == 0 or (self._threads and self._pid == os.getpid()):
+            return
+        with self._start_lock:
+            if self._threads and self._pid == os.getpid():
+                return
+            # Threads started before a fork (gunicorn --preload) do not exist in the child
+            self._pid = os.getpid()
+            self._threads = []
+            self._worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        atexit.register(self.stop)
+        logging.info(f"🧵 Job queue started with {self.workers} workers ({self.db.path})")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the workers; unfinished jobs stay in the database."""
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], key: str = "") -> Optional[int]:
+        """Persist a job and wake a worker. Returns the job id (None if run inline)."""
+        if self.workers == 0:
+            try:
+                self._handlers[kind](payload)
+            except Exception as e:
+                logging.error(f"❌ Inline job ({kind}) failed: {e}")
+            return None
+        with self.db.write() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, job_key, payload, created_at) VALUES (?, ?, ?, ?)",
+                (kind, key, json.dumps(payload), time.time()))
+            job_id = cursor.lastrowid
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status."""
+        rows = self.db.connection().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self.db.write() as conn:
+            # Hand jobs of dead workers back to the queue
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', claimed_by = NULL WHERE status = 'running' AND claimed_at < ?",
+                (now - self.lease_seconds,))
+            row = conn.execute(_CLAIM_SQL, (now,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET status = 'running', claimed_by = ?, claimed_at = ? WHERE id = ?",
+                         (self._worker_id, now, row["id"]))
+            return dict(row)
+
+    def _finish(self, job: Dict[str, Any], error: Optional[str]) -> None:
+        with self.db.write() as conn:
+            if error is None:
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job["id"],))
+                return
+            attempts = job["attempts"] + 1
+            if attempts >= self.max_attempts:
+                conn.execute("UPDATE jobs SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                             (attempts, error, job["id"]))
+                logging.error(f"❌ Job {job['id']} ({job['kind']}) failed after {attempts} attempts: {error}")
+                return
+            delay = min(self.retry_base * (2 ** (attempts - 1)), JOB_RETRY_MAX)
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = ?, run_after = ?, claimed_by = NULL, last_error = ? "
+                "WHERE id = ?",
+                (attempts, time.time() + delay, error, job["id"]))
+            logging.warning(f"⚠️ Job {job['id']} ({job['kind']}) failed, retrying in {delay:.0f}s: {error}")
+
+    def run_pending(self) -> int:
+        """Run runnable jobs in the calling thread until none is left; returns how many ran."""
+        ran = 0
+        while True:
+            job = self._claim()
+            if job is None:
+                return ran
+            self._execute(job)
+            ran += 1
+
+    def _execute(self, job: Dict[str, Any]) -> None:
+        handler = self._handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind '{job['kind']}'")
+            handler(json.loads(job["payload"]))
+        except Exception as e:
+            self._finish(job, f"{type(e).__name__}: {e}")
+        else:
+            self._finish(job, None)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = self._claim()
+            except Exception as e:
+                logging.error(f"❌ Error claiming job: {e}")
+                job = None
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            self._execute(job)
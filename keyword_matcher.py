@@ -0,0 +1,130 @@
+"""
+Keyword group classifier shared by meeting detection, summary tags and logs.
+
+Keywords are grouped by intent (meeting, confirmation, pricing, callback,
+...). classify() lowercases the text once, runs it through a single
+Aho-Corasick automaton holding the keywords of every group, and returns the
+names of all groups that matched. Adding an intent is one more entry in
+KEYWORD_GROUPS (or in the JSON file named by KEYWORD_GROUPS_FILE), not
+another pass over the text.
+
+The automaton comes from pyahocorasick when it is installed. Without it
+the matcher falls back to one substring search per keyword on the
+lowercased copy. In CPython those C-level searches are faster than an
+automaton walked character by character in Python.
+"""
+
+import os
+import json
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Intent -> keywords (matched as lowercase substrings, like the old `in` checks)
+KEYWORD_GROUPS: Dict[str, List[str]] = {
+    # detect_and_schedule_meeting
+    "meeting": [
+        'meeting', 'schedule', 'google meet', 'meet link', 'appointment',
+        'call', 'discussion', 'consultation', 'demo', 'presentation'
+    ],
+    "confirmation": [
+        'yes', 'confirm', 'proceed', 'go ahead', 'schedule it', 'book it',
+        'correct', 'right', 'that\'s right', 'exactly', 'perfect'
+    ],
+    # Chat summary tags
+    "services": ['service', 'product'],
+    "pricing": ['price', 'cost'],
+    "meeting_request": ['meeting', 'call'],
+    # Conversation logs kept by /logs/clear
+    "flagged": ['callback', 'google meet'],
+    "callback": ['callback', 'call back', 'call me'],
+    "demo": ['demo', 'presentation'],
+}
+
+KEYWORD_GROUPS_FILE = os.getenv("KEYWORD_GROUPS_FILE", "")
+
+
+def load_keyword_groups(path: str = KEYWORD_GROUPS_FILE) -> Dict[str, List[str]]:
+    """Default groups, extended/overridden by the JSON file at `path` if set."""
+    groups = {name: list(keywords) for name, keywords in KEYWORD_GROUPS.items()}
+    if path:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                groups.update({name: list(keywords) for name, keywords in json.load(f).items()})
+        except (OSError, ValueError, AttributeError) as e:
+            logging.error(f"Error loading keyword groups from {path}: {e}")
+    return groups
+
+
+class KeywordMatcher:
+    """Finds which keyword groups occur in a text in one pass."""
+
+    def __init__(self, groups: Optional[Dict[str, Iterable[str]]] = None):
+        self.groups: Dict[str, List[str]] = {}
+        self._keywords: Dict[str, Tuple[str, ...]] = {}
+        self._automaton = None
+        for name, keywords in (groups if groups is not None else load_keyword_groups()).items():
+            self.groups[name] = [keyword.lower() for keyword in keywords]
+        self._build()
+
+    def add_group(self, name: str, keywords: Iterable[str]) -> None:
+        """Add (or replace) an intent and rebuild the automaton."""
+        self.groups[name] = [keyword.lower() for keyword in keywords]
+        self._build()
+
+    def _build(self) -> None:
+        # keyword -> every group it belongs to
+        owners: Dict[str, List[str]] = {}
+        for name, keywords in self.groups.items():
+            for keyword in keywords:
+                if keyword and name not in owners.setdefault(keyword, []):
+                    owners[keyword].append(name)
+        self._keywords = {keyword: tuple(names) for keyword, names in owners.items()}
+        if ahocorasick is not None and self._keywords:
+            automaton = ahocorasick.Automaton()
+            for keyword, names in self._keywords.items():
+                automaton.add_word(keyword, names)
+            automaton.make_automaton()
+            self._automaton = automaton
+        else:
+            self._automaton = None
+
+    def classify(self, text: str, only: Optional[Iterable[str]] = None) -> Set[str]:
+        """
+        Return the names of the groups with at least one keyword in `text`.
+
+        With `only`, just those groups are looked for and the scan stops as
+        soon as all of them have matched.
+        """
+        found: Set[str] = set()
+        if not text:
+            return found
+        wanted = set(only) if only is not None else None
+        lowered = text.lower()
+        if self._automaton is not None:
+            for _, names in self._automaton.iter(lowered):
+                found.update(names)
+                if wanted is not None and wanted <= found:
+                    break
+        else:
+            for keyword, names in self._keywords.items():
+                if wanted is not None and not wanted.intersection(names):
+                    continue
+                if found.issuperset(names):
+                    continue
+                if keyword in lowered:
+                    found.update(names)
+                    if wanted is not None and wanted <= found:
+                        break
+        return found & wanted if wanted is not None else found
+
+    def matches(self, text: str, group: str) -> bool:
+        return group in self.classify(text, only=[group])
+
+
+# Shared matcher with the default (and KEYWORD_GROUPS_FILE) groups
+KEYWORD_MATCHER = KeywordMatcher()
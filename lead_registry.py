@@ -0,0 +1,311 @@
+"""
+In-memory lead registry with hash indexes over the leads store.
+
+The registry loads the leads once and keeps them in memory together with
+lookup indexes on canonical phone, lowercase email, lead id and conversation
+file name. The backing store (see data_store.py) is only read again when its
+version token changes (for example after another worker saved a lead), and a
+store that can report its changed rows is applied incrementally. A chat turn
+therefore no longer parses the same JSON file several times or scans every
+lead with regexes.
+"""
+
+import os
+import re
+import copy
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+# Phone numbers are compared on their last 10 digits so that "+92 300 1234567",
+# "923001234567" and "03001234567" resolve to the same lead.
+PHONE_SUFFIX_DIGITS = 10
+
+_NON_DIGITS = re.compile(r"[^\d]")
+_CONVERSATION_FILE_PATTERN = re.compile(r"^conversation_(.+?)(?:_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})?\.txt$")
+
+_PHONE, _PHONE_SUFFIX, _EMAIL, _ID, _CONVERSATION_FILE, _CONVERSATION_KEY = range(6)
+
+
+def canonical_phone(phone: Optional[str]) -> str:
+    """Return only the digits of a phone number ("" if there are none)."""
+    if not phone:
+        return ""
+    return _NON_DIGITS.sub("", str(phone))
+
+
+def conversation_key(conversation_file: Optional[str]) -> str:
+    """
+    Return the client part of a conversation file name.
+
+    "conversation_923001234567_c.us_2025-06-09_10-15-00.txt" -> "923001234567_c.us"
+    """
+    if not conversation_file:
+        return ""
+    match = _CONVERSATION_FILE_PATTERN.match(os.path.basename(conversation_file))
+    if match:
+        return match.group(1)
+    return ""
+
+
+def _lead_keys(lead: Dict[str, Any]) -> List[Tuple[int, str]]:
+    keys: List[Tuple[int, str]] = []
+    phone = canonical_phone(lead.get("phone"))
+    if phone:
+        keys.append((_PHONE, phone))
+        if len(phone) >= PHONE_SUFFIX_DIGITS:
+            keys.append((_PHONE_SUFFIX, phone[-PHONE_SUFFIX_DIGITS:]))
+    email = (lead.get("email") or "").strip().lower()
+    if email:
+        keys.append((_EMAIL, email))
+    if lead.get("id") is not None:
+        keys.append((_ID, str(lead.get("id"))))
+    for conv_file in lead.get("conversation_files") or []:
+        keys.append((_CONVERSATION_FILE, conv_file))
+        key = conversation_key(conv_file)
+        if key:
+            keys.append((_CONVERSATION_KEY, key))
+    return keys
+
+
+class LeadRegistry:
+    """
+    Holds the leads list in memory and answers lookups in O(1).
+
+    load() returns a snapshot of the leads and find_*() return the live lead
+    dicts; callers mutate a lead and then call save_lead() (or add_lead() for
+    a new one), which writes it to the store and re-indexes just that lead.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._version: Any = None
+        self._leads: List[Dict[str, Any]] = []
+        self._position: Dict[int, int] = {}
+        self._keys: Dict[int, List[Tuple[int, str]]] = {}
+        self._indexes: List[Dict[str, List[Dict[str, Any]]]] = [{} for _ in range(6)]
+
+    # -- index maintenance -------------------------------------------------
+
+    def _index_lead(self, lead: Dict[str, Any]) -> None:
+        keys = _lead_keys(lead)
+        self._keys[id(lead)] = keys
+        for index, key in keys:
+            bucket = self._indexes[index].setdefault(key, [])
+            if not any(item is lead for item in bucket):
+                bucket.append(lead)
+                if len(bucket) > 1:
+                    # First lead in file order wins, like the old linear scans
+                    bucket.sort(key=lambda item: self._position.get(id(item), 0))
+
+    def _unindex_lead(self, lead: Dict[str, Any]) -> None:
+        for index, key in self._keys.pop(id(lead), []):
+            bucket = self._indexes[index].get(key)
+            if not bucket:
+                continue
+            bucket[:] = [item for item in bucket if item is not lead]
+            if not bucket:
+                del self._indexes[index][key]
+
+    def _reindex(self) -> None:
+        self._position = {}
+        self._keys = {}
+        self._indexes = [{} for _ in range(6)]
+        for i, lead in enumerate(self._leads):
+            if isinstance(lead, dict):
+                self._position[id(lead)] = i
+                self._index_lead(lead)
+
+    def _append(self, lead: Dict[str, Any]) -> None:
+        self._position[id(lead)] = len(self._leads)
+        self._leads.append(lead)
+        self._index_lead(lead)
+
+    def _apply_change(self, lead: Dict[str, Any]) -> None:
+        existing = self._first(_ID, str(lead.get("id")))
+        if existing is None:
+            self._append(lead)
+            return
+        # Update in place so references held by callers see the new data
+        self._unindex_lead(existing)
+        existing.clear()
+        existing.update(lead)
+        self._index_lead(existing)
+
+    def _refresh(self) -> None:
+        """Reload from the store only if someone changed it since we last looked."""
+        version = self.store.version()
+        if self._loaded and version == self._version:
+            return
+        changes = self.store.changes_since(self._version) if self._loaded else None
+        if changes is None:
+            self._leads = self.store.load_leads()
+            self._reindex()
+        else:
+            for lead in changes:
+                self._apply_change(lead)
+        self._version = version
+        self._loaded = True
+
+    def _first(self, index: int, key: str) -> Optional[Dict[str, Any]]:
+        bucket = self._indexes[index].get(key)
+        return bucket[0] if bucket else None
+
+    # -- persistence -------------------------------------------------------
+
+    def load(self) -> List[Dict[str, Any]]:
+        """
+        Return a copy of the leads, reloading only if the store changed; the
+        copy can be serialized while other threads change the registry.
+        """
+        with self._lock:
+            self._refresh()
+            return copy.deepcopy(self._leads)
+
+    def save(self, leads: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """
+        Persist the leads list and rebuild the indexes. A store with row
+        updates keeps leads missing from `leads` (see delete_lead()), so the
+        registry then reloads to take in what other workers added.
+        """
+        with self._lock:
+            if leads is not None:
+                self._leads = leads
+            try:
+                self.store.save_leads(self._leads)
+            except Exception as e:
+                logging.error(f"❌ Error saving leads minimal: {e}")
+                self._loaded = False
+                return False
+            if self.store.supports_row_updates:
+                self._loaded = False
+                self._refresh()
+                return True
+            self._reindex()
+            self._version = self.store.version()
+            self._loaded = True
+            return True
+
+    def delete_lead(self, lead: Dict[str, Any]) -> bool:
+        """Remove a lead from the store and the indexes."""
+        with self._lock:
+            self._refresh()
+            if id(lead) not in self._position:
+                return False
+            try:
+                self.store.delete_leads([lead.get("id")])
+            except Exception as e:
+                logging.error(f"❌ Error deleting lead {lead.get('id')}: {e}")
+                self._loaded = False
+                return False
+            self._leads = [item for item in self._leads if item is not lead]
+            self._reindex()
+            if not self.store.supports_row_updates:
+                self._version = self.store.version()
+            return True
+
+    def save_lead(self, lead: Dict[str, Any]) -> bool:
+        """Persist one (possibly modified) lead and re-index only that lead."""
+        with self._lock:
+            self._refresh()
+            if id(lead) not in self._position:
+                return self.add_lead(lead)
+            try:
+                if self.store.supports_row_updates:
+                    self.store.upsert_lead(lead)
+                else:
+                    self.store.save_leads(self._leads)
+                    self._version = self.store.version()
+            except Exception as e:
+                logging.error(f"❌ Error saving lead {lead.get('id')}: {e}")
+                self._loaded = False
+                return False
+            self._unindex_lead(lead)
+            self._index_lead(lead)
+            return True
+
+    def add_lead(self, lead: Dict[str, Any]) -> bool:
+        """Store a new lead; lead["id"] is assigned by the store if missing."""
+        with self._lock:
+            self._refresh()
+            try:
+                if self.store.supports_row_updates:
+                    self.store.upsert_lead(lead)
+                    self._append(lead)
+                else:
+                    if lead.get("id") is None:
+                        lead["id"] = max([int(k) for k in self._indexes[_ID] if k.isdigit()] + [0]) + 1
+                    self._append(lead)
+                    self.store.save_leads(self._leads)
+                    self._version = self.store.version()
+            except Exception as e:
+                logging.error(f"❌ Error adding lead: {e}")
+                self._loaded = False
+                return False
+            return True
+
+    # -- lookups -----------------------------------------------------------
+
+    def find_by_phone(self, phone: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Match on the full digit string, falling back to the last 10 digits
+        (or, for shorter input, the first lead whose phone ends with it).
+        """
+        digits = canonical_phone(phone)
+        if not digits:
+            return None
+        with self._lock:
+            self._refresh()
+            lead = self._first(_PHONE, digits)
+            if lead is None and len(digits) >= PHONE_SUFFIX_DIGITS:
+                lead = self._first(_PHONE_SUFFIX, digits[-PHONE_SUFFIX_DIGITS:])
+            elif lead is None:
+                # Too short for the suffix index: scan like the old lookup did
+                lead = next((item for item in self._leads if isinstance(item, dict)
+                             and canonical_phone(item.get("phone")).endswith(digits)), None)
+            return lead
+
+    def find_by_email(self, email: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not email:
+            return None
+        with self._lock:
+            self._refresh()
+            return self._first(_EMAIL, email.strip().lower())
+
+    def find_by_id(self, lead_id: Any) -> Optional[Dict[str, Any]]:
+        if lead_id is None or lead_id == "":
+            return None
+        with self._lock:
+            self._refresh()
+            return self._first(_ID, str(lead_id))
+
+    def find_by_conversation_file(self, conversation_file: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not conversation_file:
+            return None
+        with self._lock:
+            self._refresh()
+            return self._first(_CONVERSATION_FILE, os.path.basename(conversation_file))
+
+    def find_by_conversation_client(self, client_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Find the lead owning a conversation_<client_id>_<timestamp>.txt file."""
+        if not client_id:
+            return None
+        with self._lock:
+            self._refresh()
+            return self._first(_CONVERSATION_KEY, client_id.replace("@", "_"))
+
+    def find_by_contact(self, phone: Optional[str] = None, email: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find a lead by phone or email. When both match different leads the one
+        that comes first in the file wins, as with the old sequential scan.
+        """
+        with self._lock:
+            by_phone = self.find_by_phone(phone)
+            by_email = self.find_by_email(email)
+            if by_phone is None or by_email is None or by_phone is by_email:
+                return by_phone or by_email
+            if self._position.get(id(by_phone), 0) <= self._position.get(id(by_email), 0):
+                return by_phone
+            return by_email
@@ -5,7 +5,6 @@ import os
 import json
 import logging
 import redis
-import requests
 from datetime import datetime
 from flask import Flask, request, jsonify, session, Response, make_response
 from flask_session import Session
@@ -14,6 +13,10 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from dotenv import load_dotenv
 from typing import List, Dict, Any, Optional
+from data_store import create_assessment_store
+from gemini_client import get_gemini_client, GeminiRequestError, GeminiUnavailableError
+from history_manager import HistoryManager
+from session_store import create_session_store
 
 # Load environment variables
 load_dotenv()
@@ -34,6 +37,12 @@ os.makedirs(ASSESSMENT_FOLDER, exist_ok=True)
 ASSESSMENTS_FILE = os.path.join(ASSESSMENT_FOLDER, "student_assessments.json")
 RESULTS_FILE = os.path.join(ASSESSMENT_FOLDER, "mbti_results.json")
 
+# Assessment storage (JSON file or SQLite, see data_store.py)
+assessment_store = create_assessment_store(ASSESSMENT_FOLDER)
+
+# Token-budgeted psychology chat history with a rolling summary of older turns
+history_manager = HistoryManager()
+
 # Logging setup
 logging.basicConfig(level=logging.DEBUG)
 
@@ -64,6 +73,10 @@ app.config["PERMANENT_SESSION_LIFETIME"] = 7200  # 2 hours for assessments
 
 Session(app)
 
+# psychology_session:{student_id}, one JSON value or a turn list (SESSION_STORE_BACKEND)
+psychology_sessions = create_session_store(app.config["SESSION_REDIS"], "psychology_session",
+                                           client_info_prefix=None, session_ttl=7200)
+
 # Rate limiting with Redis storage
 redis_url = f"redis://{redis_host}:{redis_port}/{redis_db}"
 limiter = Limiter(
@@ -124,25 +137,18 @@ Always prioritize student wellbeing and maintain confidentiality.
 
 # Helper functions for assessment data
 def load_assessments() -> List[Dict[str, Any]]:
-    """Load student assessments from file"""
-    if not os.path.exists(ASSESSMENTS_FILE):
-        return []
+    """Load student assessments from the assessment store"""
     try:
-        with open(ASSESSMENTS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError):
+        return assessment_store.load_assessments()
+    except Exception as e:
+        logging.error(f"Error loading assessments: {e}")
         return []
 
 def save_assessment(assessment_data: Dict[str, Any]) -> bool:
-    """Save student assessment data"""
+    """Save student assessment data (assigns assessment_data["id"])"""
     try:
-        assessments = load_assessments()
         assessment_data["timestamp"] = datetime.now().isoformat()
-        assessment_data["id"] = len(assessments) + 1
-        assessments.append(assessment_data)
-        
-        with open(ASSESSMENTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(assessments, f, indent=4)
+        assessment_store.add_assessment(assessment_data)
         return True
     except Exception as e:
         logging.error(f"Error saving assessment: {e}")
@@ -200,52 +206,42 @@ def psychology_chat():
             return jsonify({"error": "Empty message"}), 400
 
         # Get conversation history from session
-        session_key = f"psychology_session:{student_id}"
-        redis_client = app.config["SESSION_REDIS"]
-        
-        session_data_raw = redis_client.get(session_key)
-        if session_data_raw:
-            session_data = json.loads(session_data_raw.decode('utf-8'))
-            conversation_history = session_data.get("conversation_history", [])
-        else:
-            conversation_history = []
+        psychology_session = psychology_sessions.load(student_id)
+        history = history_manager.load(psychology_session.data)
 
-        # Add user message to history
-        conversation_history.append({"role": "user", "parts": [{"text": user_message}]})
-
-        # Limit conversation history
-        if len(conversation_history) > 20:
-            conversation_history = conversation_history[-20:]
+        # Add user message to history (older turns beyond the token budget are summarized)
+        history.add({"role": "user", "parts": [{"text": user_message}]})
 
         # Call Gemini API for psychology response
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
-        headers = {"Content-Type": "application/json"}
-        
         payload = {
             "systemInstruction": {"parts": [{"text": PSYCHOLOGY_SYSTEM_INSTRUCTION}]},
-            "contents": conversation_history
+            "contents": history.contents()
         }
 
-        response = requests.post(url, headers=headers, json=payload)
+        response = get_gemini_client(GEMINI_API_KEY).generate_content(GEMINI_MODEL, payload)
 
         if response.status_code == 200:
             res_json = response.json()
             reply = res_json["candidates"][0]["content"]["parts"][0]["text"]
 
             # Add AI response to history
-            conversation_history.append({"role": "model", "parts": [{"text": reply}]})
+            history.add({"role": "model", "parts": [{"text": reply}]})
 
-            # Save updated session
-            redis_client.setex(session_key, 7200, json.dumps({
-                "conversation_history": conversation_history,
-                "student_id": student_id
-            }))
+            # Save updated session (the list backend appends just the new turns)
+            psychology_session.replace(history, student_id=student_id)
+            psychology_sessions.save(psychology_session)
 
             return jsonify({"reply": reply, "status": "success"})
         else:
             logging.error(f"Gemini API Error: {response.status_code} - {response.text}")
             return jsonify({"error": "AI service temporarily unavailable"}), 500
 
+    except GeminiUnavailableError as e:
+        logging.warning(f"Gemini circuit breaker open: {e}")
+        return jsonify({"error": "AI service temporarily unavailable"}), 503, {"Retry-After": str(int(e.retry_after) + 1)}
+    except GeminiRequestError as e:
+        logging.error(f"Gemini API unreachable: {e}")
+        return jsonify({"error": "AI service temporarily unavailable"}), 504 if e.timeout else 502
     except Exception as e:
         logging.exception(f"Error in psychology chat: {e}")
         return jsonify({"error": "Internal server error"}), 500
@@ -354,8 +350,7 @@ def submit_assessment():
 def get_assessment_results(assessment_id: int):
     """Get assessment results by ID"""
     try:
-        assessments = load_assessments()
-        assessment = next((a for a in assessments if a["id"] == assessment_id), None)
+        assessment = assessment_store.get_assessment(assessment_id)
         
         if not assessment:
             return jsonify({"error": "Assessment not found"}), 404
@@ -376,9 +371,7 @@ def reset_psychology_session():
         data = request.get_json()
         student_id = data.get("student_id", "anonymous")
         
-        session_key = f"psychology_session:{student_id}"
-        redis_client = app.config["SESSION_REDIS"]
-        redis_client.delete(session_key)
+        psychology_sessions.clear(student_id)
         
         return jsonify({"message": "Session reset successfully"})
 
@@ -0,0 +1,134 @@
+"""
+Building blocks for calling a flaky upstream: jittered backoff, a circuit
+breaker and a latency tracker for hedging decisions.
+
+Used by gemini_client.GeminiClient; nothing here does I/O.
+"""
+
+import time
+import random
+import threading
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None) -> float:
+    """
+    Seconds to wait before retry number `attempt` (1-based): "full jitter",
+    a random delay up to base * 2**(attempt-1), capped. A server-sent
+    Retry-After wins when it is longer.
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, cap))
+    return delay
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After header in seconds (the HTTP-date form is ignored)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """
+    Fails fast while the upstream is unhealthy.
+
+    closed:    calls go through; outcomes of the last `window` seconds are kept
+    open:      entered when at least `min_calls` outcomes were seen and the
+               share of failures reached `error_rate`; calls are refused
+               for `cooldown` seconds
+    half-open: one probe call is let through; its success closes the
+               breaker, its failure opens it again
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, error_rate: float = 0.5, min_calls: int = 10,
+                 window: float = 30.0, cooldown: float = 15.0):
+        self.error_rate = error_rate
+        self.min_calls = max(1, min_calls)
+        self.window = window
+        self.cooldown = cooldown
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                return self.HALF_OPEN
+            return self._state
+
+    def retry_in(self) -> float:
+        """Seconds until a probe is allowed (0 when calls go through)."""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        """Whether a call may be made now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record(self, ok: bool) -> None:
+        """Record the outcome of a call that allow() let through."""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if ok:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._state = self.OPEN
+                    self._opened_at = now
+                return
+            self._outcomes.append((now, ok))
+            while self._outcomes and now - self._outcomes[0][0] > self.window:
+                self._outcomes.popleft()
+            if self._state == self.CLOSED and len(self._outcomes) >= self.min_calls:
+                failures = sum(1 for _, outcome in self._outcomes if not outcome)
+                if failures / len(self._outcomes) >= self.error_rate:
+                    self._state = self.OPEN
+                    self._opened_at = now
+
+
+class LatencyTracker:
+    """Latencies of the most recent successful calls."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """The p-th percentile in seconds, or None until min_samples were seen."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered))) - 1))
+        return ordered[index]
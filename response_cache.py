@@ -0,0 +1,276 @@
+"""
+Response cache for repeated Gemini prompts.
+
+Most WhatsApp traffic is the same few questions about pricing and services,
+and each one used to cost a full generateContent call with the whole system
+instruction. ResponseCache keys a reply by
+
+- the normalized user input (lowercase, punctuation and extra spaces removed)
+- a hash of the final system instruction (changes with every edit and daily
+  with the injected date)
+- a fingerprint of the conversation turns just before the question
+
+and keeps it in an in-process LRU with a TTL, with Redis as a shared second
+tier. Turns that inject per-client context (sales notes, client data,
+meeting info) must not be cached; callers record them with bypass().
+
+The optional near-duplicate mode ("how much does it cost" vs "how much do
+you cost") compares TF-IDF vectors of hashed word unigrams and bigrams by
+cosine similarity with NumPy, within the same instruction/context bucket.
+It needs numpy; without it only exact matches are served.
+
+Configuration (environment):
+    RESPONSE_CACHE_ENABLED        "1" to enable (default off)
+    RESPONSE_CACHE_MAX_ENTRIES    in-process entries (default 1000)
+    RESPONSE_CACHE_TTL            seconds a reply stays valid (default 3600)
+    RESPONSE_CACHE_CONTEXT_TURNS  prior turns in the fingerprint (default 1)
+    RESPONSE_CACHE_SEMANTIC       "1" to serve near-duplicates (default off)
+    RESPONSE_CACHE_SIMILARITY     cosine threshold for near-duplicates (default 0.9)
+"""
+
+import os
+import re
+import time
+import zlib
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 3600))
+RESPONSE_CACHE_CONTEXT_TURNS = int(os.getenv("RESPONSE_CACHE_CONTEXT_TURNS", 1))
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "0").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", 0.9))
+
+REDIS_KEY_PREFIX = "response_cache:"
+# Hashed feature space for the TF-IDF vectors
+VECTOR_DIM = 2048
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_DIGITS = re.compile(r"\d+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def context_fingerprint(turns: List[Dict[str, Any]]) -> str:
+    """
+    Fingerprint of the turns before the question. Digits are folded so that
+    e.g. greetings that differ only in the client ID share a fingerprint.
+    """
+    parts = []
+    for turn in turns:
+        text = " ".join(part.get("text", "") for part in turn.get("parts", []))
+        parts.append(f"{turn.get('role', '')}:{_DIGITS.sub('#', normalize_text(text))}")
+    return _hash("\n".join(parts))
+
+
+class CacheQuery:
+    """The cache key of one turn."""
+
+    def __init__(self, text: str, bucket: str):
+        self.text = text
+        self.bucket = bucket
+        self.key = _hash(f"{bucket}\n{text}")
+
+
+class _SemanticIndex:
+    """TF-IDF vectors of the cached questions of one bucket."""
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self._rows: Dict[str, Any] = {}
+        self._matrix = None
+
+    @staticmethod
+    def _features(text: str):
+        words = text.split()
+        terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+        for term in terms:
+            vector[zlib.crc32(term.encode("utf-8")) % VECTOR_DIM] += 1.0
+        # Sublinear term frequency
+        return np.log1p(vector)
+
+    def add(self, key: str, text: str) -> None:
+        if key not in self._rows:
+            self.keys.append(key)
+        self._rows[key] = self._features(text)
+        self._matrix = None
+
+    def remove(self, key: str) -> None:
+        if self._rows.pop(key, None) is not None:
+            self.keys.remove(key)
+            self._matrix = None
+
+    def nearest(self, text: str) -> Tuple[Optional[str], float]:
+        """The most similar cached question and its cosine similarity."""
+        if not self.keys:
+            return None, 0.0
+        if self._matrix is None:
+            self._matrix = np.vstack([self._rows[key] for key in self.keys])
+        # IDF over the cached questions of this bucket
+        document_frequency = np.count_nonzero(self._matrix, axis=0)
+        idf = np.log((1 + len(self.keys)) / (1 + document_frequency)) + 1.0
+        weighted = self._matrix * idf
+        query = self._features(text) * idf
+        norms = np.linalg.norm(weighted, axis=1) * np.linalg.norm(query)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            similarity = np.where(norms > 0, weighted @ query / norms, 0.0)
+        best = int(np.argmax(similarity))
+        return self.keys[best], float(similarity[best])
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class ResponseCache:
+    """Two-tier (in-process LRU + Redis) cache of Gemini replies."""
+
+    def __init__(self, redis_client=None, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 ttl: int = RESPONSE_CACHE_TTL, context_turns: int = RESPONSE_CACHE_CONTEXT_TURNS,
+                 semantic: bool = RESPONSE_CACHE_SEMANTIC, similarity: float = RESPONSE_CACHE_SIMILARITY):
+        self.redis = redis_client
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.context_turns = max(0, context_turns)
+        if semantic and np is None:
+            logging.warning("⚠️ RESPONSE_CACHE_SEMANTIC needs numpy; serving exact matches only")
+            semantic = False
+        self.semantic = semantic
+        self.similarity = similarity
+        # key -> (expires_at, bucket, normalized text, reply)
+        self._entries: "OrderedDict[str, Tuple[float, str, str, str]]" = OrderedDict()
+        self._indexes: Dict[str, _SemanticIndex] = {}
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "memory_hits": 0, "redis_hits": 0, "semantic_hits": 0,
+                         "misses": 0, "bypassed": 0, "stored": 0, "evicted": 0}
+
+    def query(self, user_input: str, system_instruction: str,
+              history: List[Dict[str, Any]]) -> CacheQuery:
+        """
+        Build the key for `user_input`, given the final system instruction and
+        the conversation turns before it.
+        """
+        context = history[-self.context_turns:] if self.context_turns else []
+        bucket = f"{_hash(system_instruction)}:{context_fingerprint(context)}"
+        return CacheQuery(normalize_text(user_input), bucket)
+
+    def get(self, query: CacheQuery) -> Optional[str]:
+        """Cached reply for the query, or None (counted as a miss)."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(query.key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(query.key)
+                self._count_hit("memory_hits")
+                return entry[3]
+            if entry is not None:
+                self._drop(query.key)
+
+        reply = self._redis_get(query.key)
+        if reply is not None:
+            self._store(query, reply, now + self.ttl)
+            with self._lock:
+                self._count_hit("redis_hits")
+            return reply
+
+        if self.semantic:
+            with self._lock:
+                index = self._indexes.get(query.bucket)
+                if index is not None:
+                    key, score = index.nearest(query.text)
+                    entry = self._entries.get(key) if key else None
+                    if entry is not None and score >= self.similarity and entry[0] > now:
+                        self._entries.move_to_end(key)
+                        self._count_hit("semantic_hits")
+                        logging.debug(f"🧠 Near-duplicate cache hit ({score:.2f}): '{query.text}' ~ '{entry[2]}'")
+                        return entry[3]
+
+        with self._lock:
+            self._metrics["misses"] += 1
+        return None
+
+    def put(self, query: CacheQuery, reply: str) -> None:
+        """Cache `reply` for the query in both tiers."""
+        self._store(query, reply, time.time() + self.ttl)
+        with self._lock:
+            self._metrics["stored"] += 1
+        if self.redis is not None:
+            try:
+                self.redis.setex(REDIS_KEY_PREFIX + query.key, self.ttl, reply)
+            except Exception as e:
+                logging.warning(f"⚠️ Could not write response cache entry to Redis: {e}")
+
+    def bypass(self) -> None:
+        """Record a turn that was not cached because it carries per-client context."""
+        with self._lock:
+            self._metrics["bypassed"] += 1
+
+    def clear(self) -> None:
+        """Drop the in-process tier (Redis entries expire by TTL)."""
+        with self._lock:
+            self._entries.clear()
+            self._indexes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, hit rate and current size."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._metrics)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["semantic"] = self.semantic
+        return stats
+
+    def _count_hit(self, tier: str) -> None:
+        # Caller holds the lock
+        self._metrics["hits"] += 1
+        self._metrics[tier] += 1
+
+    def _redis_get(self, key: str) -> Optional[str]:
+        if self.redis is None:
+            return None
+        try:
+            value = self.redis.get(REDIS_KEY_PREFIX + key)
+        except Exception as e:
+            logging.warning(f"⚠️ Could not read response cache entry from Redis: {e}")
+            return None
+        if value is None:
+            return None
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def _store(self, query: CacheQuery, reply: str, expires_at: float) -> None:
+        with self._lock:
+            self._entries[query.key] = (expires_at, query.bucket, query.text, reply)
+            self._entries.move_to_end(query.key)
+            if self.semantic:
+                self._indexes.setdefault(query.bucket, _SemanticIndex()).add(query.key, query.text)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._metrics["evicted"] += 1
+
+    def _drop(self, key: str) -> None:
+        # Caller holds the lock
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        index = self._indexes.get(entry[1])
+        if index is not None:
+            index.remove(key)
+            if not len(index):
+                del self._indexes[entry[1]]
@@ -0,0 +1,129 @@
+"""
+Encoding of the values session_store.py keeps in Redis.
+
+Sessions were stored as JSON, where every turn repeats its
+{"role": ..., "parts": [{"text": ...}]} wrapper in full. MsgpackCodec
+stores them as msgpack and compresses values of SESSION_COMPRESS_MIN_BYTES
+or more with zstd, which shrinks the Redis memory per active chat and the
+bytes moved on every turn. Encoded values start with a version byte:
+
+    0x01  msgpack
+    0x02  zstd-compressed msgpack
+
+Anything else is read as JSON, which never starts with those bytes, so
+values written before (or by SESSION_CODEC=json) are read transparently and
+re-encoded on their next save; every codec reads every format, so workers
+can switch codecs one at a time.
+
+msgpack (pip install msgpack) and zstandard (pip install zstandard) are
+optional: without msgpack sessions stay JSON, without zstandard they are not
+compressed.
+
+Configuration (environment):
+    SESSION_CODEC               json or msgpack (default json)
+    SESSION_COMPRESS_MIN_BYTES  compress encoded values from this size on; 0 = never (default 1024)
+    SESSION_ZSTD_LEVEL          zstd compression level (default 3)
+"""
+
+import os
+import json
+import logging
+import threading
+from typing import Any
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SESSION_CODEC = os.getenv("SESSION_CODEC", "json").lower()
+SESSION_COMPRESS_MIN_BYTES = int(os.getenv("SESSION_COMPRESS_MIN_BYTES", 1024))
+SESSION_ZSTD_LEVEL = int(os.getenv("SESSION_ZSTD_LEVEL", 3))
+
+VERSION_MSGPACK = 0x01
+VERSION_MSGPACK_ZSTD = 0x02
+
+
+class SessionCodecError(ValueError):
+    """A stored value cannot be decoded (corrupt, or its codec is not installed)."""
+
+
+# zstd (de)compressors are not thread-safe: one per thread
+_zstd = threading.local()
+
+
+def _compressor(level: int):
+    compressors = _zstd.__dict__.setdefault("compressors", {})
+    if level not in compressors:
+        compressors[level] = zstandard.ZstdCompressor(level=level)
+    return compressors[level]
+
+
+def _decompressor():
+    if not hasattr(_zstd, "decompressor"):
+        _zstd.decompressor = zstandard.ZstdDecompressor()
+    return _zstd.decompressor
+
+
+def decode_value(raw: bytes) -> Any:
+    """Decode a value written by any codec (or plain JSON)."""
+    if not raw:
+        raise SessionCodecError("empty value")
+    version = raw[0]
+    if version not in (VERSION_MSGPACK, VERSION_MSGPACK_ZSTD):
+        return json.loads(raw)
+    if msgpack is None or (version == VERSION_MSGPACK_ZSTD and zstandard is None):
+        raise SessionCodecError(f"value needs {'zstandard' if msgpack else 'msgpack'}, which is not installed")
+    try:
+        payload = raw[1:]
+        if version == VERSION_MSGPACK_ZSTD:
+            payload = _decompressor().decompress(payload)
+        return msgpack.unpackb(payload, raw=False)
+    except Exception as e:
+        raise SessionCodecError(f"corrupt session value: {e}") from e
+
+
+class JsonCodec:
+    """Plain JSON, as sessions were always stored."""
+
+    name = "json"
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(value).encode("utf-8")
+
+    def decode(self, raw: bytes) -> Any:
+        return decode_value(raw)
+
+
+class MsgpackCodec(JsonCodec):
+    """msgpack behind a version byte, zstd-compressed from `compress_min_bytes` on."""
+
+    name = "msgpack"
+
+    def __init__(self, compress_min_bytes: int = SESSION_COMPRESS_MIN_BYTES, level: int = SESSION_ZSTD_LEVEL):
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed")
+        self.compress_min_bytes = compress_min_bytes if zstandard is not None else 0
+        self.level = level
+
+    def encode(self, value: Any) -> bytes:
+        packed = msgpack.packb(value, use_bin_type=True)
+        if self.compress_min_bytes and len(packed) >= self.compress_min_bytes:
+            compressed = _compressor(self.level).compress(packed)
+            if len(compressed) < len(packed):
+                return bytes((VERSION_MSGPACK_ZSTD,)) + compressed
+        return bytes((VERSION_MSGPACK,)) + packed
+
+
+def get_codec(name: str = SESSION_CODEC) -> JsonCodec:
+    """The codec selected by SESSION_CODEC (JSON when msgpack is not installed)."""
+    if name == "msgpack":
+        if msgpack is not None:
+            return MsgpackCodec()
+        logging.warning("⚠️ SESSION_CODEC=msgpack but msgpack is not installed, storing sessions as JSON")
+    return JsonCodec()
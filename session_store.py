@@ -0,0 +1,239 @@
+"""
+Redis state of a chat client, read and written once per turn.
+
+Each client has a chat session (chat_session:{client_id}: history, rolling
+summary, client name, turn counter) and the details it gave when asked
+(client_info:{client_id}). A /gemini/train turn used to GET the session,
+SETEX it before the Gemini call, GET/SETEX client_info and SETEX the whole
+session again afterwards, re-serializing the conversation on every write.
+
+SessionStore.load() fetches both keys in one pipelined round trip into a
+ChatSession; the turn changes it in memory and SessionStore.save() writes
+what changed in one MULTI/EXEC, so a turn costs two round trips.
+
+Two layouts of the session (SESSION_STORE_BACKEND):
+
+- json (default): the whole session in one value, rewritten on every save.
+- list: the turns are a Redis list ({prefix}_turns:{id}, one item per turn
+  with its token count) and the rest is a small hash ({prefix}_meta:{id}:
+  summary, client name, turn counter). A save RPUSHes the new turns, LTRIMs
+  the turns the history window dropped, updates the hash (the summary only
+  when turns were dropped) and the EXPIREs, so appending a turn costs the
+  size of that turn, not of the whole history. A session still in the json
+  layout is read as is and rewritten as a list on its next save.
+
+Values are encoded by session_codec.py (SESSION_CODEC: JSON, or msgpack
+with zstd for large values); values in any encoding are read.
+
+mbti_app.py keeps its psychology sessions in the same stores under the
+psychology_session prefix (without client info).
+
+Configuration (environment):
+    SESSION_STORE_BACKEND  json or list (default json)
+    CHAT_SESSION_TTL       seconds a chat session is kept after its last turn (default 86400)
+    CLIENT_INFO_TTL        seconds client info is kept after its last update (default 604800)
+"""
+
+import os
+import logging
+from typing import Any, Dict, List, Optional
+
+from history_manager import ConversationWindow
+from session_codec import JsonCodec, get_codec
+
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "json").lower()
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", 86400))
+CLIENT_INFO_TTL = int(os.getenv("CLIENT_INFO_TTL", 86400 * 7))
+
+
+def _decode(codec: JsonCodec, raw: Optional[bytes], key: str) -> Optional[Dict[str, Any]]:
+    if not raw:
+        return None
+    try:
+        return codec.decode(raw)
+    except ValueError as e:
+        logging.error(f"❌ Unreadable {key}, starting over: {e}")
+        return None
+
+
+class ChatSession:
+    """A client's session fields and client info, with the changes still to be saved."""
+
+    def __init__(self, client_id: str, data: Optional[Dict[str, Any]], client_info: Optional[Dict[str, Any]]):
+        self.client_id = client_id
+        # None until the client's first turn is saved
+        self.data = data
+        self.client_info: Dict[str, Any] = client_info or {}
+        self.window: Optional[ConversationWindow] = None
+        self.meta: Dict[str, Any] = {}
+        self._session_changed = False
+        self._client_info_changed = False
+        # The stored layout differs from the store's (see ListSessionStore)
+        self._rewrite = False
+
+    @property
+    def is_new(self) -> bool:
+        return self.data is None
+
+    def replace(self, window: ConversationWindow, **meta: Any) -> None:
+        """Store `window` (loaded from this session's data) and `meta` fields on the next save()."""
+        self.window = window
+        self.meta = meta
+        self.data = {**window.session_fields(), **meta}
+        self._session_changed = True
+
+    def update_client_info(self, items: Dict[str, Any]) -> None:
+        self.client_info.update(items)
+        self._client_info_changed = True
+
+    @property
+    def client_info_changed(self) -> bool:
+        return self._client_info_changed
+
+    @property
+    def changed(self) -> bool:
+        return self._session_changed or self._client_info_changed
+
+
+class SessionStore:
+    """
+    Loads a ChatSession in one pipelined round trip and saves it in one
+    transaction; the session is one value under {prefix}:{id}.
+    """
+
+    def __init__(self, redis_client, prefix: str = "chat_session",
+                 client_info_prefix: Optional[str] = "client_info",
+                 session_ttl: int = CHAT_SESSION_TTL, client_info_ttl: int = CLIENT_INFO_TTL,
+                 codec: Optional[JsonCodec] = None):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.client_info_prefix = client_info_prefix
+        self.session_ttl = session_ttl
+        self.client_info_ttl = client_info_ttl
+        # Encoding of every value written (SESSION_CODEC); any encoding is read
+        self.codec = codec or get_codec()
+
+    def session_key(self, client_id: str) -> str:
+        return f"{self.prefix}:{client_id}"
+
+    def client_info_key(self, client_id: str) -> str:
+        return f"{self.client_info_prefix}:{client_id}"
+
+    def load(self, client_id: str) -> ChatSession:
+        with self.redis.pipeline(transaction=False) as pipe:
+            self._queue_reads(pipe, client_id)
+            if self.client_info_prefix:
+                pipe.get(self.client_info_key(client_id))
+            results = pipe.execute()
+        client_info = None
+        if self.client_info_prefix:
+            client_info = _decode(self.codec, results.pop(), self.client_info_key(client_id))
+        session = ChatSession(client_id, None, client_info)
+        self._read_session(session, results)
+        return session
+
+    def save(self, session: ChatSession) -> None:
+        """Write the session's changes (nothing when unchanged) in one MULTI/EXEC."""
+        if not session.changed:
+            return
+        with self.redis.pipeline(transaction=True) as pipe:
+            if session._session_changed:
+                self._queue_writes(pipe, session)
+            if session._client_info_changed and self.client_info_prefix:
+                pipe.setex(self.client_info_key(session.client_id), self.client_info_ttl,
+                           self.codec.encode(session.client_info))
+            pipe.execute()
+        if session._session_changed and session.window is not None:
+            session.window.mark_saved()
+        session._session_changed = session._client_info_changed = session._rewrite = False
+
+    def load_client_info(self, client_id: str) -> Dict[str, Any]:
+        key = self.client_info_key(client_id)
+        return _decode(self.codec, self.redis.get(key), key) or {}
+
+    def clear(self, client_id: str) -> None:
+        """Forget the client's session and client info."""
+        keys = self._session_keys(client_id)
+        if self.client_info_prefix:
+            keys.append(self.client_info_key(client_id))
+        self.redis.delete(*keys)
+
+    def _session_keys(self, client_id: str) -> List[str]:
+        return [self.session_key(client_id)]
+
+    def _queue_reads(self, pipe, client_id: str) -> None:
+        pipe.get(self.session_key(client_id))
+
+    def _read_session(self, session: ChatSession, results: List[Any]) -> None:
+        session.data = _decode(self.codec, results[0], self.session_key(session.client_id))
+
+    def _queue_writes(self, pipe, session: ChatSession) -> None:
+        pipe.setex(self.session_key(session.client_id), self.session_ttl, self.codec.encode(session.data))
+
+
+class ListSessionStore(SessionStore):
+    """Session turns as a Redis list plus a metadata hash; saves append only the new turns."""
+
+    def turns_key(self, client_id: str) -> str:
+        return f"{self.prefix}_turns:{client_id}"
+
+    def meta_key(self, client_id: str) -> str:
+        return f"{self.prefix}_meta:{client_id}"
+
+    def _session_keys(self, client_id: str) -> List[str]:
+        return [self.turns_key(client_id), self.meta_key(client_id), self.session_key(client_id)]
+
+    def _queue_reads(self, pipe, client_id: str) -> None:
+        pipe.lrange(self.turns_key(client_id), 0, -1)
+        pipe.hgetall(self.meta_key(client_id))
+        # A session written by the json layout, not migrated yet
+        pipe.get(self.session_key(client_id))
+
+    def _read_session(self, session: ChatSession, results: List[Any]) -> None:
+        raw_turns, raw_meta, legacy = results
+        if not raw_meta:
+            # New, or still in the json layout: the first save writes the whole list
+            session.data = _decode(self.codec, legacy, self.session_key(session.client_id))
+            session._rewrite = True
+            return
+        try:
+            meta = {field.decode("utf-8"): self.codec.decode(value) for field, value in raw_meta.items()}
+            items = [self.codec.decode(item) for item in raw_turns]
+        except ValueError as e:
+            logging.error(f"❌ Unreadable {self.meta_key(session.client_id)}, starting over: {e}")
+            session._rewrite = True
+            return
+        session.data = {
+            **meta,
+            "conversation_history": [turn for _, turn in items],
+            "history_tokens": [tokens for tokens, _ in items],
+        }
+
+    def _queue_writes(self, pipe, session: ChatSession) -> None:
+        window = session.window
+        if window is None:
+            raise ValueError("ListSessionStore saves sessions set with ChatSession.replace(window, ...)")
+        turns_key, meta_key = self.turns_key(session.client_id), self.meta_key(session.client_id)
+        if session._rewrite:
+            pipe.delete(turns_key, self.session_key(session.client_id))
+            drop, new_turns = 0, list(zip(window.tokens, window.turns))
+        else:
+            drop, new_turns = window.unsaved()
+        if new_turns:
+            pipe.rpush(turns_key, *[self.codec.encode([tokens, turn]) for tokens, turn in new_turns])
+        if drop:
+            pipe.ltrim(turns_key, drop, -1)
+        meta = dict(session.meta)
+        if session._rewrite or drop:
+            # The summary only changes when turns are dropped (bounded by HISTORY_SUMMARY_TOKENS)
+            meta["history_summary"] = window.summary
+        pipe.hset(meta_key, mapping={field: self.codec.encode(value) for field, value in meta.items()})
+        pipe.expire(turns_key, self.session_ttl)
+        pipe.expire(meta_key, self.session_ttl)
+
+
+def create_session_store(redis_client, prefix: str = "chat_session", **kwargs: Any) -> SessionStore:
+    """Build the session store selected by SESSION_STORE_BACKEND."""
+    if SESSION_STORE_BACKEND == "list":
+        return ListSessionStore(redis_client, prefix, **kwargs)
+    return SessionStore(redis_client, prefix, **kwargs)
@@ -0,0 +1,123 @@
+"""
+Helpers that keep importing app.py cheap and free of side effects.
+
+- Lazy: stands in for an object whose construction touches the disk
+  (stores that create folders or SQLite files) until it is first used.
+- ReadinessCheck: runs a slow startup check, such as validating the Gemini
+  key and model over the network, on a background thread instead of at
+  import, and reports the outcome for a readiness probe (/ready).
+
+Both are fork-aware, so `gunicorn --preload` can import and even create the
+app in the master process: threads are only started in the process that
+serves requests.
+
+Configuration (environment):
+    READINESS_RETRY_INTERVAL  seconds before a failed check is run again (default 30)
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+READINESS_RETRY_INTERVAL = float(os.getenv("READINESS_RETRY_INTERVAL", 30))
+
+T = TypeVar("T")
+
+_UNSET: Any = object()
+
+
+class Lazy(Generic[T]):
+    """Proxy that builds the real object with `factory()` on first attribute access."""
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._value: T = _UNSET
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        value = self._value
+        if value is _UNSET:
+            with self._lock:
+                if self._value is _UNSET:
+                    self._value = self._factory()
+                value = self._value
+        return value
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not _UNSET
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+
+class ReadinessCheck:
+    """
+    Runs `check()` -> (ok, error message) in the background, once per
+    process; a failed check is retried after `retry_interval` seconds.
+    """
+
+    PENDING, READY, FAILED = "pending", "ready", "failed"
+
+    def __init__(self, check: Callable[[], Tuple[bool, Optional[str]]],
+                 retry_interval: float = READINESS_RETRY_INTERVAL):
+        self.check = check
+        self.retry_interval = retry_interval
+        self._state = self.PENDING
+        self._error: Optional[str] = None
+        self._checked_at: Optional[float] = None
+        self._pid: Optional[int] = None
+        self._running = False
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Run the check in a background thread unless it is running or passed in this process."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker checks for itself
+                self._pid = os.getpid()
+                self._state, self._error, self._checked_at, self._running = self.PENDING, None, None, False
+            if self._running or self._state == self.READY:
+                return
+            if self._state == self.FAILED and time.time() - (self._checked_at or 0) < self.retry_interval:
+                return
+            self._running = True
+        threading.Thread(target=self._run, name="readiness-check", daemon=True).start()
+
+    def _run(self) -> None:
+        try:
+            ok, error = self.check()
+        except Exception as e:
+            ok, error = False, str(e)
+        with self._lock:
+            self._state = self.READY if ok else self.FAILED
+            self._error = None if ok else error
+            self._checked_at = time.time()
+            self._running = False
+        if ok:
+            logging.info("✅ Readiness check passed")
+        else:
+            logging.error(f"❌ Readiness check failed: {error}")
+
+    @property
+    def ready(self) -> bool:
+        return self._state == self.READY and self._pid == os.getpid()
+
+    def status(self) -> Dict[str, Any]:
+        """{"ready", "state", "error"}; (re)starts the check when it is due."""
+        self.start()
+        with self._lock:
+            return {"ready": self._state == self.READY, "state": self._state, "error": self._error}
+
+    def wait(self, timeout: float) -> bool:
+        """Start the check and wait up to `timeout` seconds for it to pass."""
+        self.start()
+        give_up_at = time.monotonic() + timeout
+        while time.monotonic() < give_up_at:
+            with self._lock:
+                if not self._running:
+                    return self._state == self.READY
+            time.sleep(0.05)
+        return self.ready
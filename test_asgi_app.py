@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Tests for the ASGI server's native /gemini/train routes, called in-process
+"""
+
+import sys
+import json
+import asyncio
+
+import pytest
+
+if sys.version_info < (3, 12):
+    pytest.skip("app.py needs Python 3.12", allow_module_level=True)
+for module in ("flask", "flask_session", "flask_cors", "flask_limiter", "limits", "redis", "dotenv"):
+    pytest.importorskip(module)
+
+from limits import parse_many
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+
+import asgi_app
+from client_lock import AsyncClientTurnLock
+from idempotency import AsyncIdempotencyStore
+
+REQUEST = {"client_id": "923001234567@c.us", "content": "hi"}
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeStream:
+    status_code = 200
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.closed = False
+
+    async def text(self):
+        return ""
+
+    async def __aiter__(self):
+        for text in self.texts:
+            await asyncio.sleep(0)
+            yield {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeGemini:
+    """AsyncGeminiClient answering "Hello!", in one piece or streamed in two"""
+
+    def __init__(self):
+        self.calls = []
+        self.streams = []
+
+    async def generate_content(self, model, payload, deadline=None):
+        self.calls.append(payload)
+        return FakeResponse("Hello!")
+
+    async def stream_generate_content(self, model, payload, deadline=None):
+        self.calls.append(payload)
+        self.streams.append(FakeStream(["Hel", "lo!"]))
+        return self.streams[-1]
+
+
+@pytest.fixture
+def gemini(monkeypatch, async_fake_redis):
+    chat = asgi_app.chat
+    prepared = []
+    finalized = []
+
+    def prepare_train_turn(data):
+        prepared.append(data)
+        return {"client_id": data["client_id"], "payload": {"contents": [data["content"]]}, "cache_query": None}
+
+    def finalize_train_turn(turn, reply):
+        finalized.append(reply)
+        return f"{reply} 😊"
+
+    monkeypatch.setattr(chat, "prepare_train_turn", prepare_train_turn)
+    monkeypatch.setattr(chat, "finalize_train_turn", finalize_train_turn)
+    monkeypatch.setattr(chat, "start_background_work", lambda: None)
+    monkeypatch.setattr(asgi_app, "rate_limiter", FixedWindowRateLimiter(MemoryStorage()))
+    monkeypatch.setattr(asgi_app, "idempotency_store", AsyncIdempotencyStore(async_fake_redis))
+    monkeypatch.setattr(asgi_app, "client_turns", AsyncClientTurnLock(async_fake_redis))
+    monkeypatch.setattr(asgi_app, "message_coalescer", None)
+    client = FakeGemini()
+    monkeypatch.setattr(asgi_app, "get_async_gemini_client", lambda api_key: client)
+    client.prepared, client.finalized = prepared, finalized
+    return client
+
+
+def post(path, data, headers=()):
+    """Run one POST through the ASGI app; returns (status, headers, body)"""
+    scope = {"type": "http", "method": "POST", "path": path, "query_string": b"", "client": ("10.0.0.7", 51234),
+             "headers": [(b"content-type", b"application/json"), *headers]}
+    body = json.dumps(data).encode("utf-8")
+    chunks = [{"type": "http.request", "body": body[:5], "more_body": True},
+              {"type": "http.request", "body": body[5:]}]
+    sent = []
+
+    async def receive():
+        return chunks.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app.app(scope, receive, send))
+    assert sent[0]["type"] == "http.response.start"
+    return sent[0]["status"], dict(sent[0]["headers"]), b"".join(message.get("body", b"") for message in sent[1:])
+
+
+def test_train_awaits_gemini_and_replays_a_retried_message(gemini):
+    headers = [(b"origin", b"https://crm.example.com"), (b"idempotency-key", b"msg-1")]
+    status, response_headers, body = post("/gemini/train", REQUEST, headers)
+    assert status == 200
+    assert json.loads(body) == {"reply": "Hello! 😊"}
+    assert response_headers[b"access-control-allow-origin"] == b"https://crm.example.com"
+    assert gemini.prepared == [REQUEST] and gemini.finalized == ["Hello!"]
+    assert gemini.calls == [{"contents": ["hi"]}]
+
+    # The gateway retries the message: same result, no second turn
+    status, response_headers, body = post("/gemini/train", REQUEST, headers)
+    assert status == 200 and json.loads(body) == {"reply": "Hello! 😊"}
+    assert response_headers[b"idempotent-replayed"] == b"true"
+    assert len(gemini.calls) == 1 and len(gemini.prepared) == 1
+
+
+def test_stream_sends_chunks_then_the_finalized_reply(gemini):
+    status, response_headers, body = post("/gemini/train/stream", REQUEST)
+    assert status == 200
+    assert response_headers[b"content-type"] == b"text/event-stream; charset=utf-8"
+    assert response_headers[b"cache-control"] == b"no-cache"
+    events = [(event.split("\n")[0], json.loads(event.split("\n")[1][len("data: "):]))
+              for event in body.decode("utf-8").split("\n\n") if event]
+    assert events == [("event: chunk", {"text": "Hel"}), ("event: chunk", {"text": "lo!"}),
+                      ("event: chunk", {"text": " 😊"}), ("event: done", {"reply": "Hello! 😊"})]
+    assert gemini.finalized == ["Hello!"] and gemini.streams[0].closed
+
+
+def test_train_rate_limit_is_counted_under_the_flask_endpoint(gemini, monkeypatch):
+    monkeypatch.setattr(asgi_app, "TRAIN_RATE_LIMITS", parse_many("1 per minute"))
+    assert post("/gemini/train", REQUEST)[0] == 200
+    status, _, body = post("/gemini/train", REQUEST)
+    assert status == 429 and json.loads(body) == {"error": "Rate limit exceeded. Please try again later."}
+    # The key flask-limiter uses for the Flask route, so both servers share the count
+    assert asgi_app.rate_limiter.storage.get("LIMITER/10.0.0.7/chat.gemini_train/1/1/minute") == 2
+    assert len(gemini.calls) == 1
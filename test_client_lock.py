@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Tests for per-client serialization of chat turns
+"""
+
+import time
+import asyncio
+import threading
+
+import pytest
+
+from client_lock import AsyncClientTurnLock, ClientBusy, ClientTurnLock
+
+
+def queued(redis, client_key):
+    return len(redis.lrange(f"client_turn:{client_key}:queue", 0, -1))
+
+def wait_for(condition, timeout=5.0):
+    give_up_at = time.monotonic() + timeout
+    while time.monotonic() < give_up_at:
+        if condition():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def test_turns_of_one_client_run_in_arrival_order_across_workers(fake_redis):
+    redis = fake_redis
+    workers = [ClientTurnLock(redis, lease=5, wait=5, poll_interval=0.01) for _ in range(2)]
+    order, running, overlaps = [], [], []
+    first_holds = threading.Event()
+
+    def turn(n):
+        with workers[n % 2].hold("c1"):
+            running.append(n)
+            overlaps.append(len(running) > 1)
+            if n == 0:
+                first_holds.wait(5)
+            order.append(n)
+            running.remove(n)
+
+    threads = []
+    for n in range(6):
+        threads.append(threading.Thread(target=turn, args=(n,)))
+        threads[-1].start()
+        assert wait_for(lambda: queued(redis, "c1") == n + 1)
+
+    # Another client is not held up by c1's queue
+    with workers[1].hold("c2"):
+        pass
+    first_holds.set()
+    for thread in threads:
+        thread.join(5)
+    assert order == list(range(6)) and not any(overlaps)
+    assert queued(redis, "c1") == 0
+
+
+def test_abandoned_turn_is_skipped_and_waiting_too_long_is_busy(fake_redis):
+    redis = fake_redis
+    crashed = ClientTurnLock(redis, lease=0.2, wait=5)
+    crashed.acquire("c1")
+    crashed._leases.clear()  # The worker died: nobody renews its lease
+
+    lock = ClientTurnLock(redis, lease=5, wait=2, poll_interval=0.01)
+    started = time.monotonic()
+    with lock.hold("c1"):
+        assert time.monotonic() - started < 1.5
+        impatient = ClientTurnLock(redis, lease=5, wait=0.1, poll_interval=0.01)
+        with pytest.raises(ClientBusy):
+            impatient.acquire("c1")
+    assert queued(redis, "c1") == 0
+
+
+def test_without_redis_turns_are_ordered_in_the_worker():
+    lock = ClientTurnLock(None, wait=0.2)
+    first = lock.acquire("c1")
+    assert first.local
+    with pytest.raises(ClientBusy):
+        lock.acquire("c1")
+    with lock.hold("c2"):
+        pass
+    lock.release(first)
+    with lock.hold("c1"):
+        pass
+
+
+def test_async_turns_of_one_client_do_not_overlap():
+    lock = AsyncClientTurnLock(None, wait=5)
+    order = []
+
+    async def turn(client_key, n):
+        async with lock.hold(client_key):
+            order.append(f"{client_key} start {n}")
+            await asyncio.sleep(0.01)
+            order.append(f"{client_key} end {n}")
+
+    async def main():
+        await asyncio.gather(*(turn("c1", n) for n in range(3)))
+
+    asyncio.run(main())
+    assert order == [f"c1 {step} {n}" for n in range(3) for step in ("start", "end")]
+    assert not lock._local
+
+
+def test_async_turns_queue_in_redis_and_skip_abandoned_ones(fake_redis, async_fake_redis):
+    async def main():
+        crashed = AsyncClientTurnLock(async_fake_redis, lease=0.2, wait=5)
+        await crashed.acquire("c1")
+        crashed._renewals.pop(next(iter(crashed._renewals))).cancel()  # The worker died
+
+        workers = [AsyncClientTurnLock(async_fake_redis, lease=0.3, wait=5, poll_interval=0.01)
+                   for _ in range(2)]
+        order, running = [], []
+
+        async def turn(n):
+            async with workers[n % 2].hold("c1") as lease:
+                assert not lease.local
+                running.append(n)
+                assert len(running) == 1
+                # Outlives the lease: only renewal keeps the turn
+                await asyncio.sleep(0.4 if n == 0 else 0.01)
+                order.append(n)
+                running.remove(n)
+
+        tasks = []
+        for n in range(4):
+            tasks.append(asyncio.ensure_future(turn(n)))
+            while queued(fake_redis, "c1") < n + 2:
+                await asyncio.sleep(0.005)
+
+        # A waiter that is cancelled leaves the queue
+        impatient = asyncio.ensure_future(workers[1].acquire("c1"))
+        while queued(fake_redis, "c1") < 6:
+            await asyncio.sleep(0.005)
+        impatient.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+
+        await asyncio.gather(*tasks)
+        assert order == [0, 1, 2, 3]
+        assert queued(fake_redis, "c1") == 0
+        assert not any(worker._renewals for worker in workers)
+
+    asyncio.run(main())
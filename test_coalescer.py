@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-client message coalescer
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from coalescer import AsyncMessageCoalescer, MessageCoalescer
+
+
+def send_burst(coalescer, key, messages, handler, gap=0.02):
+    results = [None] * len(messages)
+
+    def send(i, message):
+        results[i] = coalescer.submit(key, message, handler)
+
+    threads = []
+    for i, message in enumerate(messages):
+        thread = threading.Thread(target=send, args=(i, message))
+        thread.start()
+        threads.append(thread)
+        time.sleep(gap)
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_burst_runs_handler_once_and_fans_out():
+    coalescer = MessageCoalescer(window=0.15, max_wait=2)
+    calls = []
+
+    def handler(batch):
+        calls.append(batch)
+        return " ".join(batch)
+
+    results = send_burst(coalescer, "client-1", ["hi", "I need", "a website"], handler)
+    assert calls == [["hi", "I need", "a website"]]
+    assert results == [("hi I need a website", 0, 3), ("hi I need a website", 1, 3), ("hi I need a website", 2, 3)]
+
+    # Another client and a later message are separate bursts
+    assert coalescer.submit("client-2", "hello", handler) == ("hello", 0, 1)
+    assert coalescer.submit("client-1", "thanks", handler) == ("thanks", 0, 1)
+    assert coalescer.stats == {"requests": 5, "bursts": 3}
+
+
+def test_max_wait_caps_a_long_burst_and_errors_reach_everyone():
+    coalescer = MessageCoalescer(window=0.1, max_wait=0.15)
+    sizes = []
+    send_burst(coalescer, "c", list(range(6)), lambda batch: sizes.append(len(batch)), gap=0.05)
+    assert sum(sizes) == 6 and len(sizes) >= 2
+
+    def fail(batch):
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        coalescer.submit("c", "x", fail)
+
+
+def test_async_burst_runs_handler_once():
+    coalescer = AsyncMessageCoalescer(window=0.1, max_wait=2)
+    calls = []
+
+    async def handler(batch):
+        calls.append(batch)
+        await asyncio.sleep(0)
+        return " ".join(batch)
+
+    async def burst():
+        tasks = []
+        for message in ["hi", "I need", "a website"]:
+            tasks.append(asyncio.ensure_future(coalescer.submit("client-1", message, handler)))
+            await asyncio.sleep(0.02)
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(burst())
+    assert calls == [["hi", "I need", "a website"]]
+    assert [result[1:] for result in results] == [(0, 3), (1, 3), (2, 3)]
+    assert all(result[0] == "hi I need a website" for result in results)
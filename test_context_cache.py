@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Tests for the two-tier per-client context cache
+"""
+
+import time
+
+from context_cache import ContextCache, InvalidationBus
+
+
+class Source:
+    """A loader that counts its calls."""
+
+    def __init__(self, **values):
+        self.values = values
+        self.loads = 0
+
+    def __call__(self, key):
+        self.loads += 1
+        return self.values.get(key, "")
+
+
+def worker(redis, source, **kwargs):
+    bus = InvalidationBus(redis)
+    cache = ContextCache("notes", source, redis, bus, **kwargs)
+    bus.start()
+    assert bus._subscribed.wait(2)
+    return cache
+
+
+def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_hot_clients_are_served_from_memory_and_shared_through_redis(fake_redis):
+    redis, source = fake_redis, Source(c1="VIP client, offer discount")
+    first, second = worker(redis, source), worker(redis, source)
+
+    assert first.get("c1") == "VIP client, offer discount"
+    assert first.get("c1") == "VIP client, offer discount"
+    # Another worker takes the Redis copy instead of reading the notes again
+    assert second.get("c1") == "VIP client, offer discount"
+    assert source.loads == 1
+    assert first.stats()["memory_hits"] == 1 and second.stats()["redis_hits"] == 1
+
+
+def test_invalidation_reaches_every_worker(fake_redis):
+    redis, source = fake_redis, Source(c1="old note")
+    first, second = worker(redis, source), worker(redis, source)
+    assert first.get("c1") == second.get("c1") == "old note"
+
+    source.values["c1"] = "new note"
+    first.invalidate("c1")
+    assert first.get("c1") == "new note"
+    assert wait_for(lambda: second.get("c1") == "new note")
+    assert redis.data["context_cache:notes:versions"][b"c1"] == b"1"
+
+
+def test_value_loaded_before_a_change_is_not_cached(fake_redis):
+    redis = fake_redis
+    values = iter(["note before the change", "note after the change"])
+    cache = None
+
+    def racing_loader(key):
+        value = next(values)
+        if value == "note before the change":
+            # A writer changes the notes while this load is in flight
+            cache.invalidate(key)
+        return value
+
+    cache = worker(redis, racing_loader)
+    assert cache.get("c1") == "note before the change"
+    assert cache.get("c1") == "note after the change"
+    assert cache.get("c1") == "note after the change"
+
+
+def test_memory_only_cache_and_redis_outage(fake_redis):
+    redis, source = fake_redis, Source(c1={"Name": "Sara"})
+    cache = worker(redis, source, shared=False, max_entries=1)
+    assert cache.get("c1") == {"Name": "Sara"} and cache.get("c2") == ""
+    assert not redis.data  # The source already lives in Redis
+    assert cache.get("c1") == {"Name": "Sara"} and source.loads == 3  # c1 was evicted
+
+    redis.down = True
+    source.values["c2"] = "still answered"
+    assert cache.get("c2") == "still answered"
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent conversation file index
+"""
+
+import os
+
+from conversation_index import ConversationIndex
+
+
+def test_builds_once_and_tracks_new_files(tmp_path):
+    old = "conversation_923001234567_c.us_2025-06-09_10-15-00.txt"
+    (tmp_path / old).write_text("user: hi\n")
+    (tmp_path / "conversation_9230012345678_c.us_2025-06-09_10-16-00.txt").write_text("user: hi\n")
+    (tmp_path / "leads.json").write_text("[]")
+
+    index = ConversationIndex(str(tmp_path))
+    assert index.files_for("923001234567@c.us") == [old]
+
+    new = "conversation_923001234567_c.us_2025-06-10_09-00-00.txt"
+    index.register(new)
+    assert index.latest("923001234567_c.us") == new
+
+    # Another worker sees the change through the index file
+    other_worker = ConversationIndex(str(tmp_path))
+    assert other_worker.files_for("923001234567_c.us") == [old, new]
+    index.remove(old)
+    os.utime(tmp_path / "conversation_index.json", ns=(1, 1))
+    assert other_worker.files_for("923001234567_c.us") == [new]
+    assert other_worker.latest("unknown") is None
+
+
+def test_corrupt_index_is_rebuilt_from_the_folder(tmp_path):
+    name = "conversation_923001234567_c.us_2025-06-09_10-15-00.txt"
+    (tmp_path / name).write_text("user: hi\n")
+    index = ConversationIndex(str(tmp_path))
+    (tmp_path / "conversation_index.json").write_text("{corrupt")
+
+    assert index.latest("923001234567_c.us") == name
+    new = "conversation_923001234567_c.us_2025-06-10_09-00-00.txt"
+    index.register(new)
+    # The next change wrote a valid index again
+    assert ConversationIndex(str(tmp_path)).files_for("923001234567_c.us") == [name, new]
+
+    # A change is the first to notice the damage: it must not wait on its own file lock
+    (tmp_path / "conversation_index.json").write_text("{corrupt")
+    index.remove(new)
+    assert ConversationIndex(str(tmp_path)).files_for("923001234567_c.us") == [name]
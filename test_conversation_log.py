@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for the append-only conversation log writer
+"""
+
+import os
+
+from conversation_log import ConversationLogWriter
+
+NAME = "conversation_923001234567_c.us_2025-06-09_10-15-00.txt"
+
+
+def turn(role, text):
+    return {"role": role, "parts": [{"text": text}]}
+
+
+def read_log(folder):
+    with open(folder / NAME, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_appends_only_new_turns_and_skips_retries(tmp_path):
+    writer = ConversationLogWriter(str(tmp_path), fsync_every=2)
+
+    assert writer.append(NAME, [turn("user", "hi"), turn("model", "hello")], 1, "s1") == 2
+    assert writer.append(NAME, [turn("user", "hi"), turn("model", "hello")], 1, "s1") == 0
+    assert writer.append(NAME, [turn("model", "hello"), turn("user", "price?")], 2, "s1") == 1
+    # The same exchange again is a new turn, not a retry
+    assert writer.append(NAME, [turn("user", "price?")], 4, "s1") == 1
+    writer.close()
+
+    assert read_log(tmp_path) == "user: hi\nmodel: hello\nuser: price?\nuser: price?\n"
+    assert sorted(os.listdir(tmp_path)) == [NAME]  # One write per save: no sidecar files
+
+
+def test_turns_after_a_reset_are_written_to_the_same_file(tmp_path):
+    writer = ConversationLogWriter(str(tmp_path))
+    for seq in range(1, 11, 2):
+        assert writer.append(NAME, [turn("user", f"q{seq}"), turn("model", f"a{seq}")], seq, "s1") == 2
+
+    # /gemini/reset (or the session TTL) starts a new session numbered from 1
+    assert writer.append(NAME, [turn("user", "again"), turn("model", "welcome back")], 1, "s2") == 2
+    assert writer.append(NAME, [turn("user", "again"), turn("model", "welcome back")], 1, "s2") == 0
+    assert writer.last_seq(NAME) == 2
+    # Jobs queued before sessions had an epoch: numbers going backwards also start over
+    writer.forget(NAME)
+    assert writer.append(NAME, [turn("user", "late")], 5) == 1
+    assert writer.append(NAME, [turn("user", "old")], 1) == 1
+    writer.close()
+    assert read_log(tmp_path).endswith("user: again\nmodel: welcome back\nuser: late\nuser: old\n")
+
+
+def test_retry_in_another_process_is_skipped_through_redis(tmp_path, fake_redis):
+    first = ConversationLogWriter(str(tmp_path), fake_redis)
+    assert first.append(NAME, [turn("user", "hi"), turn("model", "hello")], 1, "s1") == 2
+    first.close()
+
+    # The job failed after its append and another worker (or a restart) runs it again
+    other = ConversationLogWriter(str(tmp_path), fake_redis)
+    assert other.append(NAME, [turn("user", "hi"), turn("model", "hello")], 1, "s1") == 0
+    assert other.append(NAME, [turn("user", "more"), turn("model", "sure")], 3, "s1") == 2
+    assert first.position(NAME) == ("s1", 3, 4)
+    other.forget(NAME)
+    assert first.position(NAME) == ("", 0, 0)
+    other.close()
+    assert read_log(tmp_path) == "user: hi\nmodel: hello\nuser: more\nmodel: sure\n"
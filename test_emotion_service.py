@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared emotion inference service
+"""
+
+import os
+import socket
+import tempfile
+import threading
+
+import pytest
+
+from emotion_service import (EMOTION_MODEL, GO_EMOTIONS_MODEL, EmotionServer, EmotionServiceClient,
+                             EmotionServiceError, MicroBatcher, ModelRunner)
+
+
+def fake_loader(loaded):
+    def load(model):
+        loaded.append(model)
+        return lambda texts, batch_size: [[{"label": "joy", "score": len(text) / 100},
+                                           {"label": "anger", "score": 0.5}] for text in texts]
+    return load
+
+
+@pytest.fixture
+def service():
+    loaded = []
+    address = os.path.join(tempfile.mkdtemp(), "emotion.sock")
+    server = EmotionServer(address, ModelRunner(fake_loader(loaded)))
+    server.bind()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield address, loaded
+    server.close()
+    thread.join(2)
+
+
+def test_workers_share_one_model_loaded_on_first_use(service):
+    address, loaded = service
+    assert loaded == []
+    results = {}
+
+    def worker(n):
+        client = EmotionServiceClient(address, autostart=False, timeout=5)
+        results[n] = client.classify(EMOTION_MODEL, ["x" * n, "hello"])
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(1, 6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loaded == [EMOTION_MODEL]
+    assert results[3][0] == [{"label": "joy", "score": 0.03}, {"label": "anger", "score": 0.5}]
+    assert results[3][1][0]["score"] == 0.05
+
+
+def test_errors_are_reported_to_the_caller(service):
+    address, loaded = service
+    client = EmotionServiceClient(address, autostart=False, timeout=5)
+    with pytest.raises(EmotionServiceError, match="not served"):
+        client.classify("some/other-model", ["hi"])
+    # The connection stays usable
+    assert client.classify(GO_EMOTIONS_MODEL, ["hi"])[0][1]["label"] == "anger"
+
+
+def test_missing_service_without_autostart_raises():
+    address = os.path.join(tempfile.mkdtemp(), "missing.sock")
+    with pytest.raises(EmotionServiceError, match="not running"):
+        EmotionServiceClient(address, autostart=False).classify(EMOTION_MODEL, ["hi"])
+
+
+def test_stale_socket_file_is_replaced():
+    address = os.path.join(tempfile.mkdtemp(), "stale.sock")
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(address)
+    stale.close()  # The file stays behind, nobody listens
+    server = EmotionServer(address, ModelRunner(fake_loader([])))
+    server.bind()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = EmotionServiceClient(address, autostart=False, timeout=5)
+        assert client.classify(EMOTION_MODEL, ["hi"])[0][0]["label"] == "joy"
+    finally:
+        server.close()
+        thread.join(2)
+
+
+def test_only_clients_with_the_key_and_socket_owner_connect(service, monkeypatch):
+    address, loaded = service
+    assert os.stat(f"{address}.key").st_mode & 0o777 == 0o600
+    with pytest.raises(EmotionServiceError, match="rejected the key"):
+        EmotionServiceClient(address, autostart=False, timeout=5, authkey=b"guess").classify(EMOTION_MODEL, ["hi"])
+    # The service keeps serving clients that have the key
+    assert EmotionServiceClient(address, autostart=False, timeout=5).classify(EMOTION_MODEL, ["hi"])
+
+    uid = os.getuid()
+    monkeypatch.setattr(os, "getuid", lambda: uid + 1)
+    with pytest.raises(EmotionServiceError, match="owned by another user"):
+        EmotionServiceClient(address, autostart=False, authkey=b"key").classify(EMOTION_MODEL, ["hi"])
+
+
+def test_service_refuses_a_shared_directory():
+    shared = tempfile.mkdtemp()
+    os.chmod(shared, 0o1777)
+    server = EmotionServer(os.path.join(shared, "emotion.sock"), ModelRunner(fake_loader([])))
+    with pytest.raises(EmotionServiceError, match="accessible to other users"):
+        server.bind()
+
+
+def test_concurrent_requests_run_as_one_batch():
+    batches = []
+
+    def run(texts):
+        batches.append(list(texts))
+        return [[{"label": text, "score": 1.0}] for text in texts]
+
+    batcher = MicroBatcher(run, max_batch=6, max_wait=0.2)
+    results = {}
+
+    def submit(n):
+        results[n] = batcher.submit([f"t{n}"] if n != 3 else ["t3a", "t3b"])
+
+    threads = [threading.Thread(target=submit, args=(n,)) for n in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Six texts fill one batch, and every caller gets exactly its own scores
+    assert len(batches) == 1 and sorted(batches[0]) == ["t0", "t1", "t2", "t3a", "t3b", "t4"]
+    assert results[3] == [[{"label": "t3a", "score": 1.0}], [{"label": "t3b", "score": 1.0}]]
+    assert results[4] == [[{"label": "t4", "score": 1.0}]]
+
+
+def test_batch_size_is_capped_and_errors_reach_every_caller():
+    batches = []
+
+    def run(texts):
+        batches.append(len(texts))
+        if "bad" in texts:
+            raise ValueError("model failed")
+        return [[] for _ in texts]
+
+    batcher = MicroBatcher(run, max_batch=2, max_wait=0.1)
+    errors = []
+
+    def submit(text):
+        try:
+            batcher.submit([text])
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=submit, args=(text,)) for text in ["a", "b", "c", "bad"]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(batches) <= 2 and sum(batches) == 4
+    assert errors and set(errors) == {"model failed"}
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for the incremental conversation extraction state
+"""
+
+from extraction_state import ExtractionState, ExtractionStateStore
+
+CONVERSATION = (
+    "user: Hello\n"
+    "model: Hi! I'm Saba from IMJD. May I have your name?\n"
+    "user: My name is Salman, my number is +92 300 1234567\n"
+    "model: Thanks Salman. The price depends on the service.\n"
+    "user: Send it to khanjawadkhalid@gmail.com or Salman.K@Example.com, let's have a meeting\n"
+)
+
+
+def test_full_text_extraction():
+    state = ExtractionState()
+    state.observe(CONVERSATION)
+    assert state.client_info() == {
+        "name": "Salman",
+        "phone": "+92 300 1234567",
+        "email": "salman.k@example.com",
+        "chat_summary": "Interested in services, Asked about pricing, Requested meeting",
+    }
+
+
+def test_store_reads_only_appended_lines(tmp_path):
+    name = "conversation_923001234567_c.us_2025-06-09_10-15-00.txt"
+    path = tmp_path / name
+    lines = CONVERSATION.splitlines(keepends=True)
+    store = ExtractionStateStore(str(tmp_path))
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(lines[:2]) + "user: My na")  # last line not finished yet
+    assert store.get(name).name is None
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("me is Salman, my number is +92 300 1234567\n" + "".join(lines[3:]))
+    state = store.get(name)
+    expected = ExtractionState()
+    expected.observe(CONVERSATION)
+    assert state.client_info() == expected.client_info()
+    assert state.offset == path.stat().st_size
+
+    # A restarted worker resumes from the sidecar without rereading the file
+    restarted = ExtractionStateStore(str(tmp_path))
+    assert restarted.get(name).client_emails == ["Salman.K@Example.com"]
+
+
+def test_engine_scan():
+    from client_extraction import CLIENT_INFO_ENGINE, MEETING_NAME_ENGINE, find_emails
+
+    found = CLIENT_INFO_ENGINE.scan(CONVERSATION)
+    assert found.name == "Salman"
+    assert found.phone == "+92 300 1234567"
+    assert found.client_emails == ["Salman.K@Example.com"]
+    assert found.keywords == {"services", "pricing", "meeting_request"}
+    # Rules after an already known name are skipped
+    assert CLIENT_INFO_ENGINE.scan("user: My name is Salman\n", name_rules=0).name is None
+
+    assert MEETING_NAME_ENGINE.scan("hi, call me Ayesha Khan please").name == "Ayesha Khan please"
+    assert find_emails("no address here") == []
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Tests for the pooled Gemini HTTP client (run against a local HTTP server)
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from gemini_client import AsyncGeminiClient, GeminiClient, GeminiRequestError, GeminiUnavailableError
+from resilience import CircuitBreaker, LatencyTracker
+
+
+class FakeGemini(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    connections = set()
+    seen = {}
+
+    def do_POST(self):
+        FakeGemini.connections.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if ":streamGenerateContent?alt=sse" in self.path:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for text in ("Hello", " there"):
+                event = f"data: {json.dumps({'candidates': [{'content': {'parts': [{'text': text}]}}]})}\r\n\r\n".encode()
+                self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        if body.get("slow"):
+            time.sleep(0.5)
+        if "id" in body:
+            count = FakeGemini.seen[body["id"]] = FakeGemini.seen.get(body["id"], 0) + 1
+            if count <= body.get("fail_times", 0):
+                self.send_response(503)
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if count == 1 and body.get("slow_first"):
+                time.sleep(0.5)
+        reply = json.dumps({"key": self.headers.get("x-goog-api-key"), "path": self.path}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeGemini)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/v1beta"
+    httpd.shutdown()
+
+
+def test_reuses_connection_and_times_out(server):
+    FakeGemini.connections.clear()
+    client = GeminiClient("test-key", base_url=server, http2="0", read_timeout=0.2)
+
+    for _ in range(3):
+        response = client.generate_content("gemini-2.0-flash", {"contents": []})
+        assert response.status_code == 200
+        assert response.json() == {"key": "test-key", "path": "/v1beta/models/gemini-2.0-flash:generateContent"}
+    assert len(FakeGemini.connections) == 1
+
+    with pytest.raises(GeminiRequestError) as error:
+        client.generate_content("gemini-2.0-flash", {"slow": True})
+    assert error.value.timeout
+    client.close()
+
+
+def test_streams_sse_chunks(server):
+    client = GeminiClient("test-key", base_url=server, http2="0")
+    stream = client.stream_generate_content("gemini-2.0-flash", {"contents": []})
+    assert stream.status_code == 200
+    texts = [chunk["candidates"][0]["content"]["parts"][0]["text"] for chunk in stream]
+    assert texts == ["Hello", " there"]
+    client.close()
+
+
+def test_retries_unavailable_then_succeeds(server):
+    client = GeminiClient("test-key", base_url=server, http2="0", retry_base=0.01, max_retries=2)
+    response = client.generate_content("gemini-2.0-flash", {"id": "retry", "fail_times": 2})
+    assert response.status_code == 200
+    assert client.stats["retries"] == 2
+
+    # Out of retries: the last error reply is returned
+    response = client.generate_content("gemini-2.0-flash", {"id": "down", "fail_times": 10})
+    assert response.status_code == 503
+    client.close()
+
+
+def test_breaker_fails_fast_and_deadline_caps_the_call(server):
+    breaker = CircuitBreaker(error_rate=0.5, min_calls=2, window=30, cooldown=60)
+    client = GeminiClient("test-key", base_url=server, http2="0", max_retries=0, breaker=breaker)
+    for _ in range(2):
+        assert client.generate_content("gemini-2.0-flash", {"id": "outage", "fail_times": 10}).status_code == 503
+    with pytest.raises(GeminiUnavailableError):
+        client.generate_content("gemini-2.0-flash", {"contents": []})
+
+    client = GeminiClient("test-key", base_url=server, http2="0", read_timeout=5)
+    started = time.monotonic()
+    with pytest.raises(GeminiRequestError) as error:
+        client.generate_content("gemini-2.0-flash", {"slow": True}, deadline=time.monotonic() + 0.2)
+    assert error.value.timeout
+    assert time.monotonic() - started < 0.45
+    client.close()
+
+
+def test_probe_that_raises_or_is_cancelled_does_not_wedge_the_breaker(server):
+    breaker = CircuitBreaker(error_rate=0.5, min_calls=1, window=30, cooldown=0.05)
+    client = GeminiClient("test-key", base_url=server, http2="0", max_retries=0, breaker=breaker)
+    breaker.record(False)
+    time.sleep(0.06)
+
+    def broken_send(timeout):
+        raise RuntimeError("bug in the request builder")
+
+    with pytest.raises(RuntimeError):
+        client._call(broken_send)
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.06)
+    # The next probe is let through and closes the breaker
+    assert client.generate_content("gemini-2.0-flash", {"contents": []}).status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+    client.close()
+
+    pytest.importorskip("httpx")
+
+    async def run():
+        client = AsyncGeminiClient("test-key", base_url=server, http2="0", max_retries=0, breaker=breaker)
+        breaker.record(False)
+        await asyncio.sleep(0.06)
+        probe = asyncio.ensure_future(client.generate_content("gemini-2.0-flash", {"slow": True}))
+        await asyncio.sleep(0.1)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        await asyncio.sleep(0.06)
+        response = await client.generate_content("gemini-2.0-flash", {"contents": []})
+        assert response.status_code == 200 and breaker.state == CircuitBreaker.CLOSED
+        await client.aclose()
+
+    asyncio.run(run())
+
+
+def test_hedged_request_wins_over_a_slow_one(server):
+    client = GeminiClient("test-key", base_url=server, http2="0", hedge=True)
+    client.latency = LatencyTracker(min_samples=1)
+    client.latency.add(0.05)
+    started = time.monotonic()
+    response = client.generate_content("gemini-2.0-flash", {"id": "hedge", "slow_first": True})
+    assert response.status_code == 200
+    assert time.monotonic() - started < 0.4
+    assert client.stats["hedged"] == 1 and client.stats["hedge_wins"] == 1
+    client.close()
+
+
+def test_async_client_retries_streams_and_runs_concurrently(server):
+    pytest.importorskip("httpx")
+
+    async def run():
+        client = AsyncGeminiClient("test-key", base_url=server, http2="0", retry_base=0.01)
+        response = await client.generate_content("gemini-2.0-flash", {"id": "async-retry", "fail_times": 1})
+        assert response.status_code == 200 and client.stats["retries"] == 1
+
+        stream = await client.stream_generate_content("gemini-2.0-flash", {"contents": []})
+        texts = [chunk["candidates"][0]["content"]["parts"][0]["text"] async for chunk in stream]
+        assert texts == ["Hello", " there"]
+
+        # Slow calls overlap on one event loop
+        started = time.monotonic()
+        responses = await asyncio.gather(*[client.generate_content("gemini-2.0-flash", {"slow": True})
+                                           for _ in range(5)])
+        assert all(response.status_code == 200 for response in responses)
+        assert time.monotonic() - started < 1.5
+        await client.aclose()
+
+    asyncio.run(run())
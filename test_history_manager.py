@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Tests for token-budgeted chat history
+"""
+
+from history_manager import HistoryManager, SUMMARY_PREFIX
+
+
+def turn(role, text):
+    return {"role": role, "parts": [{"text": text}]}
+
+
+def test_keeps_newest_turns_within_budget_and_summarizes_the_rest():
+    manager = HistoryManager(token_budget=40, summary_tokens=100, chars_per_token=4)
+    window = manager.load(None)
+    window.add(turn("user", "Hello, my name is Ayesha and I run a clothing shop"))
+    window.add(turn("model", "Nice to meet you Ayesha!"))
+    window.add(turn("user", "What does the social media package cost?"))
+    window.add(turn("model", "It starts from PKR 25,000 per month."))
+
+    assert window.total_tokens <= 40
+    assert window.turns[0]["role"] == "user"
+    assert window.turns[-1]["parts"][0]["text"] == "It starts from PKR 25,000 per month."
+    assert "- user: Hello, my name is Ayesha" in window.summary
+
+    contents = window.contents()
+    assert contents[0]["parts"][0]["text"].startswith(SUMMARY_PREFIX)
+    assert [c["role"] for c in contents[:2]] == ["user", "model"]
+    assert contents[2:] == window.turns
+
+
+def test_long_message_is_kept_alone_and_counts_survive_the_session():
+    manager = HistoryManager(token_budget=50, summary_tokens=20, chars_per_token=4)
+    window = manager.load({"conversation_history": [turn("user", "hi"), turn("model", "hello")]})
+    assert window.tokens == [5, 6]
+
+    window.add(turn("user", "x " * 400))
+    assert len(window.turns) == 1
+    # The summary is trimmed to its own budget, oldest lines first
+    assert len(window.summary) <= 80
+
+    stored = window.session_fields()
+    reloaded = manager.load(stored)
+    assert reloaded.tokens == stored["history_tokens"]
+    assert reloaded.summary == window.summary
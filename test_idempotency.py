@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for idempotent /gemini/train runs
+"""
+
+import asyncio
+import threading
+import time
+
+from idempotency import AsyncIdempotencyStore, IdempotencyStore
+
+
+def slow_handler(calls, result=({"reply": "Hello"}, 200, {}), delay=0.2):
+    def handler():
+        calls.append(1)
+        time.sleep(delay)
+        return result
+    return handler
+
+
+def test_concurrent_duplicates_share_one_run_across_workers(fake_redis):
+    redis_client = fake_redis
+    workers = [IdempotencyStore(redis_client, poll_interval=0.01) for _ in range(2)]
+    calls, results = [], []
+
+    def request(store):
+        results.append(store.run("client:msg-1", slow_handler(calls)))
+
+    threads = [threading.Thread(target=request, args=(workers[i % 2],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(replayed for _, replayed in results) == [False, True, True, True]
+    assert all(result == ({"reply": "Hello"}, 200, {}) for result, _ in results)
+
+    # A later retry is answered from Redis by a fresh worker
+    assert IdempotencyStore(redis_client).run("client:msg-1", slow_handler(calls)) == (({"reply": "Hello"}, 200, {}), True)
+    assert len(calls) == 1
+
+
+def test_server_errors_are_not_replayed():
+    store = IdempotencyStore()
+    calls = []
+    failed = ({"error": "Gemini API request failed."}, 503, {"Retry-After": "5"})
+    assert store.run("c:m", slow_handler(calls, failed, delay=0)) == (failed, False)
+    assert store.run("c:m", slow_handler(calls, delay=0)) == (({"reply": "Hello"}, 200, {}), False)
+    assert store.run("c:m", slow_handler(calls, delay=0))[1] is True
+    assert len(calls) == 2
+
+
+def test_async_store_shares_one_run_with_sync_workers(async_fake_redis):
+    redis_client = async_fake_redis
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return {"reply": "Hello"}, 200, {}
+
+    async def duplicates():
+        store = AsyncIdempotencyStore(redis_client, poll_interval=0.01)
+        other_worker = AsyncIdempotencyStore(redis_client, poll_interval=0.01)
+        return await asyncio.gather(store.run("c:m", handler), store.run("c:m", handler),
+                                    other_worker.run("c:m", handler))
+
+    results = asyncio.run(duplicates())
+    assert len(calls) == 1
+    assert sorted(replayed for _, replayed in results) == [False, True, True]
+
+    # Results are stored under the same keys the threaded store reads
+    assert IdempotencyStore(redis_client.sync).run("c:m", slow_handler(calls)) == (({"reply": "Hello"}, 200, {}), True)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for the cached system instruction and client context blocks
+"""
+
+import os
+from datetime import datetime
+
+from instruction_cache import InstructionCache, ClientContextCache
+
+INSTRUCTION = (
+    "You are Saba.\n\n"
+    "📅 CURRENT DATE & TIME CONTEXT\n"
+    "Today's date is: January 01, 2025\n"
+    "Current time zone: Pakistan Standard Time (PST/PKT)\n\n"
+    "Be helpful.\n"
+)
+
+
+def test_date_is_filled_in_and_edits_are_picked_up(tmp_path):
+    path = tmp_path / "system_instruction.txt"
+    path.write_text(INSTRUCTION, encoding="utf-8")
+    cache = InstructionCache(str(path), default="default")
+
+    rendered = cache.render(datetime(2026, 3, 5))
+    assert "Today's date is: March 05, 2026\n" in rendered
+    assert rendered.startswith("You are Saba.") and rendered.endswith("Be helpful.\n")
+    assert cache.render(datetime(2026, 3, 5)) is rendered
+    version = cache.version
+
+    # Another worker replaces the file
+    tmp = tmp_path / "new.txt"
+    tmp.write_text("You are Saba, v2.\n", encoding="utf-8")
+    os.replace(tmp, path)
+    assert cache.render(datetime(2026, 3, 5)) == "You are Saba, v2.\n"
+    assert cache.version != version
+
+    os.remove(path)
+    assert cache.raw() is None
+    assert cache.render() == "default"
+
+
+def test_date_is_inserted_after_the_header_without_a_slot(tmp_path):
+    lines = [f"line {n}" for n in range(12)]
+    path = tmp_path / "system_instruction.txt"
+    path.write_text("\n".join(lines), encoding="utf-8")
+    rendered = InstructionCache(str(path)).render(datetime(2026, 3, 5))
+
+    expected = lines[:9] + ["\n📅 CURRENT DATE & TIME CONTEXT\nToday's date is: March 05, 2026\n"
+                            "Current time zone: Pakistan Standard Time (PST/PKT)"] + lines[9:]
+    assert rendered == "\n".join(expected)
+
+
+def test_client_block_is_rebuilt_when_lead_data_changes():
+    cache = ClientContextCache()
+    lead = {"name": "Ayesha", "phone": "923001234567", "chat_summary": "Asked about pricing"}
+    assert cache.block("c1", "", None) == ""
+
+    block = cache.block("c1", "VIP", lead)
+    assert "VIP" in block and "- Name: Ayesha" in block
+    assert cache.block("c1", "VIP", dict(lead)) is block
+
+    lead["meet_link"] = "https://meet.google.com/abc"
+    assert "- Meeting Link: https://meet.google.com/abc" in cache.block("c1", "VIP", lead)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for the durable bookkeeping job queue
+"""
+
+import time
+
+from job_queue import JobQueue
+
+
+def test_jobs_with_the_same_key_run_in_order(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), workers=3, poll_interval=0.05)
+    seen = []
+    queue.register("append", lambda job: (time.sleep(0.01), seen.append((job["key"], job["n"]))))
+    queue.start()
+    try:
+        for n in range(10):
+            for key in ("a", "b"):
+                queue.enqueue("append", {"key": key, "n": n}, key=key)
+        deadline = time.time() + 10
+        while len(seen) < 20 and time.time() < deadline:
+            time.sleep(0.02)
+    finally:
+        queue.stop()
+    assert [n for key, n in seen if key == "a"] == list(range(10))
+    assert [n for key, n in seen if key == "b"] == list(range(10))
+    assert queue.counts() == {}
+
+
+def test_failed_job_is_retried_then_kept(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    queue = JobQueue(path, workers=1, max_attempts=3, retry_base=0)
+    calls = []
+
+    def flaky(job):
+        calls.append(job)
+        raise RuntimeError("disk full")
+
+    queue.register("flaky", flaky)
+    queue.enqueue("flaky", {"n": 1}, key="a")
+    queue.enqueue("flaky", {"n": 2}, key="b")
+    assert queue.run_pending() == 6
+    assert queue.counts() == {"failed": 2}
+
+    # Jobs survive a restart; a later job for a failed key is not blocked by it
+    restarted = JobQueue(path, workers=1)
+    done = []
+    restarted.register("ok", done.append)
+    restarted.enqueue("ok", {"n": 3}, key="a")
+    assert restarted.run_pending() == 1
+    assert done == [{"n": 3}]
+
+
+def test_zero_workers_runs_inline(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), workers=0)
+    done = []
+    queue.register("ok", done.append)
+    queue.register("boom", lambda job: 1 / 0)
+    assert queue.enqueue("ok", {"n": 1}) is None
+    queue.enqueue("boom", {})
+    assert done == [{"n": 1}]
+    assert queue.counts() == {}
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Tests for the keyword group classifier
+"""
+
+import json
+
+from keyword_matcher import KeywordMatcher, load_keyword_groups
+
+
+def test_classifies_all_groups_in_one_call():
+    matcher = KeywordMatcher()
+    assert matcher.classify("Yes, please book it for a Google Meet tomorrow") == {
+        "confirmation", "meeting", "flagged"}
+    assert matcher.classify("What does the service cost?", only=["pricing", "demo"]) == {"pricing"}
+    assert matcher.matches("Please CALLBACK later", "flagged")
+    assert not matcher.matches("", "meeting")
+
+
+def test_new_intents_can_be_added(tmp_path):
+    path = tmp_path / "groups.json"
+    path.write_text(json.dumps({"refund": ["refund", "money back"]}))
+    matcher = KeywordMatcher(load_keyword_groups(str(path)))
+    assert "refund" in matcher.classify("I want my money back")
+
+    matcher.add_group("urdu_meeting", ["mulaqat"])
+    assert matcher.classify("kal mulaqat karein?") == {"urdu_meeting"}
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Tests for the indexed lead registry and the lead/assessment stores
+"""
+
+import json
+import os
+
+from data_store import JsonLeadStore, SqliteLeadStore, JsonAssessmentStore, SqliteAssessmentStore, export_json_leads
+from lead_registry import LeadRegistry, canonical_phone, conversation_key
+
+
+def write_leads(folder, leads):
+    with open(os.path.join(folder, "leads_minimal.json"), "w", encoding="utf-8") as f:
+        json.dump(leads, f)
+
+
+def test_lookups_use_indexes(tmp_path):
+    write_leads(tmp_path, [
+        {"id": 1, "phone": "+92 300 1234567", "email": "Ali@Example.com",
+         "conversation_files": ["conversation_923001234567_c.us_2025-06-09_10-15-00.txt"]},
+        {"id": 2, "phone": "", "email": "sara@example.com", "conversation_files": []},
+    ])
+    registry = LeadRegistry(JsonLeadStore(str(tmp_path)))
+
+    assert registry.find_by_phone("923001234567")["id"] == 1
+    assert registry.find_by_phone("03001234567")["id"] == 1
+    assert registry.find_by_email("ali@example.com")["id"] == 1
+    assert registry.find_by_id("2")["id"] == 2
+    assert registry.find_by_conversation_client("923001234567@c.us")["id"] == 1
+    assert registry.find_by_phone("") is None
+    assert registry.find_by_contact(phone="111", email="SARA@example.com")["id"] == 2
+    # Input shorter than 10 digits matches the end of a lead's phone, as before the indexes
+    assert registry.find_by_phone("123-4567")["id"] == 1
+    assert registry.find_by_phone("7654321") is None
+
+    snapshot = registry.load()
+    snapshot[0]["email"] = "changed@example.com"
+    snapshot.append({"id": 3})
+    assert registry.find_by_id(1)["email"] == "Ali@Example.com" and registry.find_by_id(3) is None
+
+
+def test_save_lead_keeps_indexes_consistent(tmp_path):
+    write_leads(tmp_path, [{"id": 1, "phone": "923001234567", "email": "old@example.com"}])
+    registry = LeadRegistry(JsonLeadStore(str(tmp_path)))
+
+    lead = registry.find_by_id(1)
+    lead["email"] = "new@example.com"
+    assert registry.save_lead(lead)
+    new_lead = {"phone": "923339876543", "email": ""}
+    assert registry.add_lead(new_lead)
+
+    assert new_lead["id"] == 2
+    assert registry.find_by_email("old@example.com") is None
+    assert registry.find_by_email("new@example.com")["id"] == 1
+    assert registry.find_by_phone("923339876543")["id"] == 2
+    with open(tmp_path / "leads_minimal.json", encoding="utf-8") as f:
+        assert len(json.load(f)) == 2
+
+
+def test_reloads_when_file_changes(tmp_path):
+    write_leads(tmp_path, [{"id": 1, "phone": "923001234567"}])
+    registry = LeadRegistry(JsonLeadStore(str(tmp_path)))
+    assert registry.find_by_id(1)
+
+    write_leads(tmp_path, [{"id": 1, "phone": "923001234567"}, {"id": 7, "email": "x@y.com"}])
+    os.utime(tmp_path / "leads_minimal.json", ns=(1, 1))
+    assert registry.find_by_email("x@y.com")["id"] == 7
+
+
+def test_sqlite_store_imports_json_and_sees_other_writers(tmp_path):
+    write_leads(tmp_path, [{"id": 3, "phone": "923001234567", "email": "ali@example.com"}])
+    with open(tmp_path / "lead_notes.json", "w", encoding="utf-8") as f:
+        json.dump({"3": "VIP"}, f)
+    db_path = str(tmp_path / "leads.db")
+
+    registry = LeadRegistry(SqliteLeadStore(db_path, import_folder=str(tmp_path)))
+    other_worker = LeadRegistry(SqliteLeadStore(db_path))
+    assert registry.find_by_phone("3001234567")["id"] == 3
+    assert registry.store.load_notes() == {"3": "VIP"}
+
+    lead = other_worker.find_by_id(3)
+    lead["email"] = "ali@new.com"
+    other_worker.save_lead(lead)
+    new_lead = {"phone": "923111111111"}
+    other_worker.add_lead(new_lead)
+
+    assert registry.find_by_email("ali@new.com")["id"] == 3
+    assert registry.find_by_email("ali@example.com") is None
+    assert registry.find_by_phone("923111111111")["id"] == new_lead["id"] == 4
+
+    export_dir = tmp_path / "export"
+    export_dir.mkdir()
+    export_json_leads(registry.store, JsonLeadStore(str(export_dir)))
+    with open(export_dir / "leads_minimal.json", encoding="utf-8") as f:
+        assert [l["id"] for l in json.load(f)] == [3, 4]
+
+
+def test_sqlite_save_keeps_other_workers_leads_and_deletes_are_explicit(tmp_path):
+    db_path = str(tmp_path / "leads.db")
+    registry = LeadRegistry(SqliteLeadStore(db_path))
+    other_worker = LeadRegistry(SqliteLeadStore(db_path))
+    registry.add_lead({"phone": "923001234567"})
+    stale = [dict(lead) for lead in registry.load()]
+
+    other_worker.add_lead({"email": "new@example.com"})
+    stale[0]["email"] = "ali@example.com"
+    assert registry.save(stale)
+    assert registry.find_by_email("new@example.com") is not None
+    assert registry.find_by_email("ali@example.com")["id"] == 1
+
+    version = registry.store.version()
+    assert other_worker.delete_lead(other_worker.find_by_id(1))
+    assert registry.store.changes_since(version) is None  # A delete needs a full reload
+    assert registry.find_by_id(1) is None
+    assert [lead["email"] for lead in registry.load()] == ["new@example.com"]
+
+
+def test_sqlite_import_keeps_meeting_leads_with_repeated_ids(tmp_path):
+    with open(tmp_path / "leads.json", "w", encoding="utf-8") as f:
+        json.dump([{"id": 1, "name": "a"}, {"id": 2, "name": "b"}, {"id": 1, "name": "c"}], f)
+    store = SqliteLeadStore(str(tmp_path / "leads.db"), import_folder=str(tmp_path))
+    assert [(entry["id"], entry["name"]) for entry in store.load_meeting_leads()] == [(1, "a"), (2, "b"), (3, "c")]
+
+
+def test_assessment_stores(tmp_path):
+    for store in (JsonAssessmentStore(str(tmp_path)), SqliteAssessmentStore(str(tmp_path / "a.db"))):
+        first = store.add_assessment({"student_id": "s1", "mbti_type": "INTJ"})
+        second = store.add_assessment({"student_id": "s2", "mbti_type": "ENTJ"})
+        assert (first["id"], second["id"]) == (1, 2)
+        assert store.get_assessment(2)["mbti_type"] == "ENTJ"
+        assert len(store.load_assessments()) == 2
+
+
+def test_helpers():
+    assert canonical_phone("+92 (300) 123-4567") == "923001234567"
+    assert conversation_key("conversation_923001234567_c.us_2025-06-09_10-15-00.txt") == "923001234567_c.us"
+    assert conversation_key("leads.json") == ""
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Tests for the circuit breaker, backoff and latency tracker
+"""
+
+import time
+
+from resilience import CircuitBreaker, LatencyTracker, backoff_delay, parse_retry_after
+
+
+def test_breaker_opens_on_error_rate_and_recovers_after_probe():
+    breaker = CircuitBreaker(error_rate=0.5, min_calls=4, window=30, cooldown=0.05)
+    for ok in (True, False, True):
+        assert breaker.allow()
+        breaker.record(ok)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()          # the probe
+    assert not breaker.allow()      # only one probe at a time
+    breaker.record(False)
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_backoff_and_percentile():
+    for attempt in range(1, 6):
+        assert 0 <= backoff_delay(attempt, 0.5, 4) <= min(4, 0.5 * 2 ** (attempt - 1))
+    assert backoff_delay(1, 0.5, 4, retry_after=3) >= 3
+    assert parse_retry_after("2") == 2.0 and parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") is None
+
+    tracker = LatencyTracker(min_samples=10)
+    assert tracker.percentile(95) is None
+    for ms in range(1, 101):
+        tracker.add(ms / 1000)
+    assert tracker.percentile(95) == 0.095
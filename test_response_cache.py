@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Tests for the Gemini response cache
+"""
+
+import pytest
+
+from response_cache import ResponseCache, normalize_text
+
+GREETING = {"role": "model", "parts": [{"text": "Hi! I'm Saba from IMJD. Your client ID is 17."}]}
+
+
+def test_exact_hits_ignore_case_punctuation_and_client_id():
+    cache = ResponseCache(max_entries=10, ttl=60)
+    query = cache.query("What is the PRICE?", "instruction v1", [GREETING])
+    assert cache.get(query) is None
+    cache.put(query, "Plans start from PKR 25,000.")
+
+    other_client = {"role": "model", "parts": [{"text": "Hi! I'm Saba from IMJD. Your client ID is 42."}]}
+    assert normalize_text("  what is the price ") == "what is the price"
+    assert cache.get(cache.query("what is the price", "instruction v1", [other_client])) == "Plans start from PKR 25,000."
+    # A new system instruction or different preceding turn is a different key
+    assert cache.get(cache.query("what is the price", "instruction v2", [GREETING])) is None
+    assert cache.get(cache.query("what is the price", "instruction v1", [])) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stored"]) == (1, 3, 1)
+
+
+def test_lru_eviction_and_redis_tier(fake_redis):
+    redis_client = fake_redis
+    cache = ResponseCache(redis_client, max_entries=2, ttl=60)
+    queries = [cache.query(f"question {n}", "v1", []) for n in range(3)]
+    for n, query in enumerate(queries):
+        cache.put(query, f"answer {n}")
+    assert cache.stats()["evicted"] == 1
+
+    # The evicted entry (and a fresh worker) is served from Redis
+    assert cache.get(queries[0]) == "answer 0"
+    fresh_worker = ResponseCache(redis_client, max_entries=2, ttl=60)
+    assert fresh_worker.get(queries[2]) == "answer 2"
+    assert fresh_worker.stats()["redis_hits"] == 1
+
+
+def test_near_duplicates_above_threshold():
+    pytest.importorskip("numpy")
+    cache = ResponseCache(semantic=True, similarity=0.6)
+    cache.put(cache.query("how much does the social media package cost", "v1", []), "PKR 25,000 per month.")
+    cache.put(cache.query("do you build websites", "v1", []), "Yes, we do.")
+
+    assert cache.get(cache.query("how much does your social media package cost?", "v1", [])) == "PKR 25,000 per month."
+    assert cache.get(cache.query("can you book a meeting", "v1", [])) is None
+    assert cache.stats()["semantic_hits"] == 1
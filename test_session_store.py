@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Tests for loading and saving a chat turn's Redis state in two round trips
+"""
+
+import json
+
+import pytest
+
+from history_manager import HistoryManager
+from session_store import ListSessionStore, SessionStore
+
+
+def turn(role, text):
+    return {"role": role, "parts": [{"text": text}]}
+
+
+def chat(store, client_id, manager, *messages):
+    """Run user/model exchanges like app.py does: load, add turns, save."""
+    for message in messages:
+        session = store.load(client_id)
+        window = manager.load(session.data)
+        window.add(turn("user", message))
+        window.add(turn("model", f"re: {message}"))
+        session.replace(window, client_name="Sara", turn_seq=(session.data or {}).get("turn_seq", 0) + 2)
+        store.save(session)
+    return window
+
+
+def test_turn_loads_and_saves_in_two_round_trips(fake_redis):
+    redis = fake_redis
+    redis.data["chat_session:c1"] = json.dumps({"conversation_history": [], "turn_seq": 4}).encode("utf-8")
+    redis.data["client_info:c1"] = json.dumps({"Name": "Sara"}).encode("utf-8")
+    store = SessionStore(redis, session_ttl=100, client_info_ttl=700)
+
+    session = store.load("c1")
+    assert not session.is_new and session.data["turn_seq"] == 4
+    assert session.client_info == {"Name": "Sara"}
+
+    session.update_client_info({"Business": "Bakery"})
+    window = HistoryManager().load(session.data)
+    window.add(turn("user", "hi"))
+    session.replace(window, turn_seq=5)
+    store.save(session)
+
+    assert redis.round_trips == 2 and redis.transactions == 1
+    saved = json.loads(redis.data["chat_session:c1"])
+    assert saved["conversation_history"] == [turn("user", "hi")] and saved["turn_seq"] == 5
+    assert json.loads(redis.data["client_info:c1"]) == {"Name": "Sara", "Business": "Bakery"}
+    assert redis.ttls == {"chat_session:c1": 100, "client_info:c1": 700}
+
+
+def test_unchanged_parts_are_not_written(fake_redis):
+    redis = fake_redis
+    store = SessionStore(redis)
+    session = store.load("new")
+    assert session.is_new and session.client_info == {}
+
+    store.save(session)
+    assert redis.round_trips == 1  # Nothing changed, nothing sent
+
+    session.replace(HistoryManager().load(None), turn_seq=1)
+    store.save(session)
+    assert "client_info:new" not in redis.data and "chat_session:new" in redis.data
+
+
+def test_unreadable_session_starts_over_and_clear_removes_both_keys(fake_redis):
+    redis = fake_redis
+    redis.data["chat_session:c2"] = b"{not json"
+    redis.data["client_info:c2"] = b'{"Name": "Ali"}'
+    store = SessionStore(redis)
+    assert store.load("c2").is_new
+
+    store.clear("c2")
+    assert redis.data == {}
+
+
+def test_list_backend_appends_only_new_turns_and_trims_dropped_ones(fake_redis):
+    redis = fake_redis
+    store = ListSessionStore(redis, session_ttl=100)
+    manager = HistoryManager(token_budget=60, summary_tokens=40)
+
+    def bytes_per_exchange(message):
+        written_before = redis.bytes_written
+        chat(store, "c1", manager, message)
+        return redis.bytes_written - written_before
+
+    chat(store, "c1", manager, "first message", "second message")
+    # Nothing dropped yet: only the new turns and the small metadata are written
+    assert bytes_per_exchange("third message") < 200
+
+    # Once the window is full, each exchange also rewrites the (capped) summary,
+    # but that does not grow with the conversation
+    chat(store, "c1", manager, *[f"message number {n}" for n in range(10)])
+    early = bytes_per_exchange("message number 90")
+    chat(store, "c1", manager, *[f"message number {n}" for n in range(10, 60)])
+    assert bytes_per_exchange("message number 91") <= early + 20
+    window = chat(store, "c1", manager, "message number 99")
+
+    # The list holds exactly the window; dropped turns went to the summary
+    session = store.load("c1")
+    assert session.data["conversation_history"] == window.turns
+    assert session.data["history_tokens"] == window.tokens
+    assert session.data["history_summary"] == window.summary and "first message" not in window.summary
+    assert session.data["client_name"] == "Sara" and session.data["turn_seq"] == 132
+    assert redis.ttls["chat_session_turns:c1"] == 100 and redis.ttls["chat_session_meta:c1"] == 100
+
+
+def test_list_backend_migrates_a_json_session(fake_redis):
+    redis = fake_redis
+    manager = HistoryManager()
+    chat(SessionStore(redis), "c1", manager, "hello")
+    assert "chat_session:c1" in redis.data
+
+    store = ListSessionStore(redis)
+    session = store.load("c1")
+    assert [t["parts"][0]["text"] for t in session.data["conversation_history"]] == ["hello", "re: hello"]
+    window = chat(store, "c1", manager, "again")
+    assert "chat_session:c1" not in redis.data
+    assert store.load("c1").data["conversation_history"] == window.turns and len(window.turns) == 4
+
+    store.clear("c1")
+    assert not any(key.startswith("chat_session") for key in redis.data)
+
+
+def test_msgpack_store_reads_json_sessions_and_writes_msgpack(fake_redis):
+    pytest.importorskip("msgpack")
+    from session_codec import MsgpackCodec, VERSION_MSGPACK
+
+    redis = fake_redis
+    manager = HistoryManager()
+    chat(SessionStore(redis), "c1", manager, "hello")
+    store = SessionStore(redis, codec=MsgpackCodec(compress_min_bytes=0))
+    window = chat(store, "c1", manager, "again")
+    assert redis.data["chat_session:c1"][0] == VERSION_MSGPACK
+    assert store.load("c1").data["conversation_history"] == window.turns
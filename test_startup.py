@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tests for the lazy objects and the background readiness check
+"""
+
+import os
+import sys
+import time
+import threading
+import subprocess
+
+import pytest
+
+from startup import Lazy, ReadinessCheck
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_lazy_builds_once_on_first_use():
+    built = []
+
+    def factory():
+        built.append(1)
+        return {"name": "store"}
+
+    store = Lazy(factory)
+    assert not store.loaded and built == []
+    threads = [threading.Thread(target=store.get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.get()["name"] == "store"
+    assert built == [1] and store.loaded
+
+
+def test_lazy_keeps_a_none_result():
+    calls = []
+    value = Lazy(lambda: calls.append(1))
+    assert value.get() is None and value.get() is None
+    assert calls == [1]
+
+
+def test_readiness_reports_failure_then_retries():
+    results = [(False, "model not found"), (True, None)]
+    check = ReadinessCheck(lambda: results.pop(0), retry_interval=0.2)
+    assert not check.wait(2)
+    assert check.status() == {"ready": False, "state": "failed", "error": "model not found"}
+    time.sleep(0.25)
+    assert check.wait(2) and check.ready
+
+
+def test_readiness_treats_an_exception_as_failure():
+    def check():
+        raise RuntimeError("network down")
+
+    readiness = ReadinessCheck(check, retry_interval=60)
+    assert not readiness.wait(2)
+    assert readiness.status() == {"ready": False, "state": "failed", "error": "network down"}
+
+
+@pytest.mark.skipif(sys.version_info < (3, 12), reason="app.py needs Python 3.12")
+def test_importing_app_touches_nothing_on_disk(tmp_path):
+    for module in ("flask", "flask_session", "flask_cors", "flask_limiter", "redis", "dotenv", "requests"):
+        pytest.importorskip(module)
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([REPO, os.environ.get("PYTHONPATH", "")]),
+           "PYTHONDONTWRITEBYTECODE": "1"}
+    # A fresh checkout: no client_data/ or other data folders in the working directory
+    result = subprocess.run([sys.executable, "-c", "import app"], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert os.listdir(tmp_path) == []
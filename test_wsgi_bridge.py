@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for serving the WSGI app from the ASGI server
+"""
+
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from wsgi_bridge import WsgiBridge
+
+
+def echo_app(environ, start_response):
+    body = environ["wsgi.input"].read()
+    reply = json.dumps({
+        "method": environ["REQUEST_METHOD"],
+        "path": environ["PATH_INFO"],
+        "query": environ["QUERY_STRING"],
+        "type": environ.get("CONTENT_TYPE"),
+        "token": environ.get("HTTP_X_TOKEN"),
+        "body": body.decode("utf-8"),
+    }).encode("utf-8")
+    start_response("201 Created", [("Content-Type", "application/json")])
+    return [reply[:10], reply[10:]]
+
+
+def failing_app(environ, start_response):
+    raise RuntimeError("boom")
+
+
+def call(app, path, body=b"", headers=()):
+    scope = {
+        "type": "http", "method": "POST", "path": path, "query_string": b"a=1",
+        "headers": [(b"content-type", b"application/json"), *headers],
+    }
+    chunks = [{"type": "http.request", "body": body[:3], "more_body": True},
+              {"type": "http.request", "body": body[3:]}]
+    sent = []
+
+    async def receive():
+        return chunks.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    with ThreadPoolExecutor(2) as executor:
+        asyncio.run(WsgiBridge(app, executor)(scope, receive, send))
+    return sent
+
+
+def test_request_and_streamed_response_round_trip():
+    sent = call(echo_app, "/notes/client-1", b'{"notes": "hi"}', [(b"x-token", b"abc")])
+    assert sent[0] == {"type": "http.response.start", "status": 201,
+                       "headers": [(b"content-type", b"application/json")]}
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    assert json.loads(body) == {"method": "POST", "path": "/notes/client-1", "query": "a=1",
+                                "type": "application/json", "token": "abc", "body": '{"notes": "hi"}'}
+    assert sent[-1] == {"type": "http.response.body", "body": b""}
+
+
+def test_app_error_before_the_response_is_a_500():
+    sent = call(failing_app, "/leads")
+    assert sent[0]["status"] == 500
+
+
+def test_repeated_headers_are_joined_and_cookies_with_semicolons():
+    def headers_app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "application/json")])
+        return [json.dumps([environ["HTTP_COOKIE"], environ["HTTP_ACCEPT"]]).encode("utf-8")]
+
+    # Over HTTP/2 every cookie arrives as a separate header
+    sent = call(headers_app, "/leads", headers=[(b"cookie", b"session=abc"), (b"cookie", b"theme=dark"),
+                                                (b"accept", b"text/html"), (b"accept", b"*/*")])
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    assert json.loads(body) == ["session=abc; theme=dark", "text/html,*/*"]
@@ -0,0 +1,162 @@
+"""
+Serve a WSGI app (the Flask app) from an ASGI server on a bounded thread pool.
+
+asgi_app.py handles the chat endpoints natively and hands every other route
+(/leads*, /notes*, /lead-context, reports, OAuth, ...) to the unchanged Flask
+app through WsgiBridge, so those routes keep their exact behaviour. Each
+request body is read on the event loop, the WSGI call and the iteration of
+its response run on the shared executor, and response chunks are handed back
+through a small queue (a slow client pauses the producing thread instead of
+letting the response pile up in memory).
+"""
+
+import io
+import sys
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# Response chunks buffered between the WSGI thread and the event loop
+QUEUED_CHUNKS = 8
+
+
+async def read_body(receive: Receive) -> bytes:
+    """The full request body of an ASGI http request."""
+    chunks: List[bytes] = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+def build_environ(scope: Scope, body: bytes) -> Dict[str, Any]:
+    """PEP 3333 environ for an ASGI http scope."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ: Dict[str, Any] = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+            continue
+        if name == "CONTENT_LENGTH":
+            continue
+        key = f"HTTP_{name}"
+        # HTTP/2 clients send each cookie as its own header; one Cookie header joins them with "; "
+        separator = "; " if key == "HTTP_COOKIE" else ","
+        environ[key] = f"{environ[key]}{separator}{value}" if key in environ else value
+    return environ
+
+
+class WsgiBridge:
+    """ASGI app that runs `wsgi_app` on `executor`."""
+
+    def __init__(self, wsgi_app: Callable, executor: Executor):
+        self.wsgi_app = wsgi_app
+        self.executor = executor
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            raise ValueError(f"WsgiBridge only serves http, not {scope['type']}")
+        environ = build_environ(scope, await read_body(receive))
+        loop = asyncio.get_running_loop()
+        queue: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue(QUEUED_CHUNKS)
+
+        def put(message: Tuple[str, Any]) -> None:
+            asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+        worker = loop.run_in_executor(self.executor, self._run, environ, put)
+        started = False
+        send_error: Optional[BaseException] = None
+        while True:
+            kind, value = await queue.get()
+            if kind == "error":
+                await worker
+                if not started:
+                    logging.error(f"❌ WSGI app failed for {scope['path']}: {value}")
+                    await send({"type": "http.response.start", "status": 500,
+                                "headers": [(b"content-type", b"text/plain; charset=utf-8")]})
+                    await send({"type": "http.response.body", "body": b"Internal Server Error"})
+                    return
+                raise value
+            if send_error is not None:
+                # The client is gone: keep draining so the worker thread can finish
+                if kind == "end":
+                    break
+                continue
+            try:
+                if kind == "start":
+                    started = True
+                    await send({"type": "http.response.start", "status": value[0], "headers": value[1]})
+                elif kind == "body":
+                    await send({"type": "http.response.body", "body": value, "more_body": True})
+                else:
+                    await send({"type": "http.response.body", "body": b""})
+                    break
+            except Exception as e:
+                send_error = e
+                if kind == "end":
+                    break
+        await worker
+        if send_error is not None:
+            raise send_error
+
+    def _run(self, environ: Dict[str, Any], put: Callable[[Tuple[str, Any]], None]) -> None:
+        """Call the WSGI app (on a pool thread) and hand its response to the event loop."""
+        response: Dict[str, Any] = {}
+        try:
+            def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+                if exc_info and response.get("sent"):
+                    raise exc_info[1].with_traceback(exc_info[2])
+                response["start"] = (int(status.split(" ", 1)[0]),
+                                     [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                                      for name, value in headers])
+                return write
+
+            def write(data: bytes) -> None:
+                if not response.get("sent"):
+                    response["sent"] = True
+                    put(("start", response["start"]))
+                if data:
+                    put(("body", data))
+
+            iterable = self.wsgi_app(environ, start_response)
+            try:
+                for chunk in iterable:
+                    if chunk:
+                        write(chunk)
+            finally:
+                if hasattr(iterable, "close"):
+                    iterable.close()
+            write(b"")
+            put(("end", None))
+        except BaseException as e:
+            put(("error", e))